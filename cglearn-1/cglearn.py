@@ -1,10 +1,70 @@
 #!/usr/bin/env python3
 
+import os
 import sys
 import math
+import atexit
 import argparse
 import importlib
 
+import offscreen
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("configuration_filepath",
+                    metavar="CONFIG_FILE", nargs='?',
+                    help="JSON configuration file to load")
+parser.add_argument("--rebuild-cache", action="store_true",
+                    help="reparse the OBJ files and rewrite their mesh cache")
+parser.add_argument("--immediate-mode", action="store_true",
+                    help="draw with glBegin/glEnd instead of buffer objects")
+parser.add_argument("--max-fps", type=float, default=None,
+                    help="limit the frame rate of animations")
+parser.add_argument("--profile", metavar="FILE", default=None,
+                    help="write per-frame timings to a CSV (or .json) file "
+                         "on exit")
+parser.add_argument("--output", metavar="IMAGE", default=None,
+                    help="render to this PNG file without opening a window; "
+                         "with several frames, a %%d in the name is "
+                         "replaced by the frame number")
+parser.add_argument("--size", type=offscreen.parse_size, default=None,
+                    metavar="WIDTHxHEIGHT",
+                    help="image size of headless renders (default 400x400, "
+                         "or the recorded window size when replaying)")
+parser.add_argument("--phase", type=int, default=0,
+                    help="phase shown in headless renders")
+parser.add_argument("--time", type=float, default=0.0,
+                    help="time in milliseconds of the first headless frame")
+parser.add_argument("--frames", type=int, default=1,
+                    help="number of headless frames to render")
+parser.add_argument("--frame-step", type=float, default=40.0,
+                    help="milliseconds between headless frames")
+parser.add_argument("--clock", choices=("real-time", "fast-forward",
+                                        "fixed-step"),
+                    default="real-time",
+                    help="how the scene time advances in the window")
+parser.add_argument("--step", type=float, default=1000.0 / 60,
+                    help="milliseconds per frame of the fixed-step clock")
+parser.add_argument("--speed", type=float, default=4.0,
+                    help="speed of the fast-forward clock")
+parser.add_argument("--record", metavar="LOG", default=None,
+                    help="record the input of the session to this file")
+parser.add_argument("--replay", metavar="LOG", default=None,
+                    help="replay a recorded session; headless renders keep "
+                         "the last frame, or every frame with a %%d in the "
+                         "image name")
+parser.add_argument("--software", action="store_true",
+                    help="render headless images with the NumPy rasterizer "
+                         "instead of OpenGL")
+
+if __name__ == '__main__':
+    options = parser.parse_args()
+
+    # Headless renders need an offscreen platform, which PyOpenGL reads
+    # when it is first imported.
+    if options.output is not None:
+        offscreen.select_platform(software=options.software)
+
 from OpenGL.GL import *
 from OpenGL.GLU import *
 from OpenGL.GLUT import *
@@ -17,42 +77,37 @@ from timing import Timing
 import config
 from context import Context
 from drawingutils import *
+from profiling import FrameProfiler
+from clock import Clock, InputLog
+import scoring
 
 
-parser = argparse.ArgumentParser()
-parser.add_argument("configuration_filepath",
-                    metavar="CONFIG_FILE", nargs='?',
-                    help="JSON configuration file to load")
-options = parser.parse_args()
-config = config.load_config_file(options.configuration_filepath)
-
+def load_student_module(config):
+    compor_cena = None
+    processar_teclado = None
 
-compor_cena = None
-processar_teclado = None
+    try:
+        student_module = importlib.import_module(config.module_name)
+        compor_cena = getattr(student_module, config.callback_name)
+        processar_teclado = getattr(student_module, "processar_teclado",
+                                    None)
+    except ImportError:
+        print("*** Atencao: Arquivo %s.py nao foi encontrado."
+              % config.module_name, file=sys.stderr)
+    except AttributeError:
+        print("*** Atencao: Arquivo %s.py nao possui funcao '%s'."
+              % (config.module_name, config.callback_name), file=sys.stderr)
 
-try:
-    student_module = importlib.import_module(config.module_name)
-    compor_cena = getattr(student_module, config.callback_name)
-    processar_teclado = getattr(student_module, "processar_teclado", None)
-except ImportError:
-    print("*** Atencao: Arquivo %s.py nao foi encontrado."
-          % config.module_name, file=sys.stderr)
-except AttributeError:
-    print("*** Atencao: Arquivo %s.py nao possui funcao '%s'."
-          % (config.module_name, config.callback_name), file=sys.stderr)
+    if compor_cena is None:
+        def compor_cena(context):
+            for object_name in context.object_names:
+                context.draw(object_name)
 
-if compor_cena is None:
-    def compor_cena(context):
-        for object_name in context.object_names:
-            context.draw(object_name)
+    if processar_teclado is None:
+        def processar_teclado(key):
+            pass
 
-if processar_teclado is None:
-    def processar_teclado(key):
-        pass
-
-
-glutInit(sys.argv)
-glutInitDisplayMode(GLUT_RGB | GLUT_DOUBLE | GLUT_DEPTH)
+    return compor_cena, processar_teclado
 
 
 class Interface(object):
@@ -204,191 +259,503 @@ class Interface(object):
         self.set_scene_coords_projection()
 
 
-timing = Timing()
-
-timing.set_value('main_opacity', 1.0)
-timing.set_value('main_wireframe_color', Interface.HIDDEN_WIREFRAME_COLOR)
-timing.set_value('point_border_color', Interface.HIDDEN_POINT_BORDER_COLOR)
-timing.set_value('point_fill_color', Interface.HIDDEN_POINT_FILL_COLOR)
-timing.set_value('target_wireframe_color', Interface.VISIBLE_TARGET_COLOR)
-
-
-interface = Interface()
-context = Context(config=config, interface=interface, timing=timing)
-
-
-def display():
-    timing.update_time()
-
-    glClearColor(0.1, 0.1, 0.1, 1)
-    if config.enable_depth:
-        glClear(GL_COLOR_BUFFER_BIT + GL_DEPTH_BUFFER_BIT)
-    else:
-        glClear(GL_COLOR_BUFFER_BIT)
-
-    interface.set_scene_coords_projection()
-    glLoadIdentity()
-
-    draw_grid_2d(grid_spacing=1)
-    current_modelview_matrix = glGetFloatv(GL_MODELVIEW_MATRIX)
-    current_projection_matrix = glGetFloatv(GL_PROJECTION_MATRIX)
-
-    for instruction in config.sequence:
-        glMatrixMode(GL_PROJECTION)
-        glLoadMatrixf(current_projection_matrix)
-        glMatrixMode(GL_MODELVIEW)
-        glLoadMatrixf(current_modelview_matrix)
-
-        command = instruction[0]
-
-        if command == 'UserCallback':
-            glColor(1, 1, 1, 1)
-            compor_cena(context)
-
-        elif command == 'Outline':
-            glColor(timing.get_value('target_wireframe_color'))
-            config.geometry.draw_wireframe(instruction[1])
-
-        elif command == 'Fill':
-            config.geometry.fill(instruction[1])
-
-    glutSwapBuffers()
-
-
-def idle():
-    glutPostRedisplay()
-
-
-def reshape(width, height):
-    interface.window_width = width
-    interface.window_height = height
-
-    glViewport(0, 0, interface.window_width, interface.window_height)
-    interface.set_scene_coords_projection()
-
-
-def mouse(button, state, x, y):
-    if button == GLUT_LEFT_BUTTON:
-        if state == GLUT_DOWN:
-            interface.start_drag(x, y)
+class Viewer(object):
+    # Everything needed to draw one configuration with one student module,
+    # either in a GLUT window or into offscreen images.
+    # clock is a clock.Clock, real-time by default. Input is recorded into
+    # input_log, and replay_log supplies the input and frame times of a
+    # recorded session, along with its clock.
+    def __init__(self, config, compor_cena, processar_teclado,
+                 clock=None, max_fps=None, input_log=None, replay_log=None):
+        self.config = config
+        self.compor_cena = compor_cena
+        self.processar_teclado = processar_teclado
+        self.max_fps = max_fps
+        self._redisplay_scheduled = False
+        self._frame_start_time = 0
+
+        if clock is None:
+            if replay_log is not None:
+                clock = replay_log.create_clock()
+            else:
+                clock = Clock()
+        self.clock = clock
+        self.input_log = input_log
+        self.replay_log = replay_log
+        self.timing = Timing(clock)
+
+        timing = self.timing
+        timing.set_value('main_opacity', 1.0)
+        timing.set_value('main_wireframe_color',
+                         Interface.HIDDEN_WIREFRAME_COLOR)
+        timing.set_value('point_border_color',
+                         Interface.HIDDEN_POINT_BORDER_COLOR)
+        timing.set_value('point_fill_color', Interface.HIDDEN_POINT_FILL_COLOR)
+        timing.set_value('target_wireframe_color',
+                         Interface.VISIBLE_TARGET_COLOR)
+
+        self.interface = Interface()
+        self.profiler = FrameProfiler()
+        config.geometry.profiler = self.profiler
+        self.context = Context(config=config, interface=self.interface,
+                               timing=timing, profiler=self.profiler,
+                               clock=clock)
+
+        self.fit_view()
+
+    def fit_view(self):
+        config = self.config
+        interface = self.interface
+
+        if config.bounds_min is not None:
+            bounds_min, bounds_max = config.bounds_min, config.bounds_max
         else:
-            interface.finish_drag()
-
-    elif button == 3:  # Scroll up
-        interface.increment_zoom()
-
-    elif button == 4:  # Scroll down
-        interface.decrement_zoom()
+            bounds_min, bounds_max = config.geometry.get_bounds(
+                config.fit_objects)
 
+        delta_x = bounds_max[0] - bounds_min[0]
+        delta_y = bounds_max[1] - bounds_min[1]
+        interface.zoom_exponent = max(
+            math.log(delta_x / 2) / math.log(1.2),
+            math.log(delta_y / 2) / math.log(1.2)) + 1
 
-def motion(x, y):
-    interface.update_drag(x, y)
-
-
-def keyboard(key, x, y):
-    if key == b'\x1b':
-        sys.exit(0)
-
-    elif key == b'+' or key == b'=':
-        interface.increment_zoom()
-
-    elif key == b'-':
-        interface.decrement_zoom()
-
-    elif key.lower() == b'f':
-        transition_time = interface.FAST_TRANSITION_TIME \
-            if key == b'F' else interface.SLOW_TRANSITION_TIME
-
-        if interface.show_fill:
-            interface.show_fill = False
-            timing.set_value('main_opacity', 0.1, transition_time)
+        if config.center is not None:
+            interface.viewport_fixed_center = config.center
         else:
-            interface.show_fill = True
-            timing.set_value('main_opacity', 1.0, transition_time)
-
-    elif key.lower() == b'w':
-        transition_time = interface.FAST_TRANSITION_TIME \
-            if key == b'W' else interface.SLOW_TRANSITION_TIME
-
-        if interface.show_wireframe:
-            interface.show_wireframe = False
-            timing.set_value('main_wireframe_color',
-                             Interface.HIDDEN_WIREFRAME_COLOR,
-                             transition_time)
+            interface.viewport_fixed_center = (bounds_min[0] + 0.5 * delta_x,
+                                               bounds_min[1] + 0.5 * delta_y)
+
+    def init_gl(self):
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+
+        if self.config.enable_depth:
+            glEnable(GL_DEPTH_TEST)
+
+    def render(self, id_colors=None):
+        # With id_colors (see scoring.get_id_colors), objects are filled
+        # flat with their id color, unblended, without the grid, outlines
+        # or overlay.
+        config = self.config
+        timing = self.timing
+        interface = self.interface
+        profiler = self.profiler
+
+        timing.update_time()
+
+        with profiler.stage('clear'):
+            if id_colors is None:
+                glClearColor(0.1, 0.1, 0.1, 1)
+            else:
+                glClearColor(0, 0, 0, 1)
+            if config.enable_depth:
+                glClear(GL_COLOR_BUFFER_BIT + GL_DEPTH_BUFFER_BIT)
+            else:
+                glClear(GL_COLOR_BUFFER_BIT)
+
+        interface.set_scene_coords_projection()
+        glLoadIdentity()
+
+        if id_colors is None:
+            with profiler.stage('grid'):
+                draw_grid_2d(grid_spacing=1,
+                             bounds=(interface.viewport_min_x,
+                                     interface.viewport_min_y,
+                                     interface.viewport_max_x,
+                                     interface.viewport_max_y))
         else:
-            interface.show_wireframe = True
-            timing.set_value('main_wireframe_color',
-                             Interface.VISIBLE_WIREFRAME_COLOR,
-                             transition_time)
-
-    elif key.lower() == b'p':
-        transition_time = interface.FAST_TRANSITION_TIME \
-            if key == b'P' else interface.SLOW_TRANSITION_TIME
-
-        if interface.show_points:
-            interface.show_points = False
-            timing.set_value('point_border_color',
-                             Interface.HIDDEN_POINT_BORDER_COLOR,
-                             transition_time)
-            timing.set_value('point_fill_color',
-                             Interface.HIDDEN_POINT_FILL_COLOR,
-                             transition_time)
+            glDisable(GL_BLEND)
+        self.context.id_colors = id_colors
+        current_modelview_matrix = glGetFloatv(GL_MODELVIEW_MATRIX)
+        current_projection_matrix = glGetFloatv(GL_PROJECTION_MATRIX)
+
+        for instruction in config.sequence:
+            glMatrixMode(GL_PROJECTION)
+            glLoadMatrixf(current_projection_matrix)
+            glMatrixMode(GL_MODELVIEW)
+            glLoadMatrixf(current_modelview_matrix)
+
+            command = instruction[0]
+
+            with profiler.stage(' '.join(map(str, instruction))):
+                if command == 'UserCallback':
+                    glColor(1, 1, 1, 1)
+                    self.compor_cena(self.context)
+
+                elif command == 'Outline':
+                    if id_colors is None:
+                        glColor(timing.get_value('target_wireframe_color'))
+                        config.geometry.draw_wireframe(instruction[1])
+
+                elif command == 'Fill':
+                    if id_colors is None:
+                        config.geometry.fill(instruction[1])
+                    else:
+                        config.geometry.fill(instruction[1],
+                                             color=id_colors[instruction[1]])
+
+        if id_colors is None:
+            profiler.draw_hud(interface.window_width,
+                              interface.window_height)
         else:
-            interface.show_points = True
-            timing.set_value('point_border_color',
-                             Interface.VISIBLE_POINT_BORDER_COLOR,
-                             transition_time)
-            timing.set_value('point_fill_color',
-                             Interface.VISIBLE_POINT_FILL_COLOR,
-                             transition_time)
-
-    elif key == b'[':
-        context.prev_phase()
-
-    elif key == b']':
-        context.next_phase()
-
-    elif key == b'{':
-        context.first_phase()
+            self.context.id_colors = None
+            glEnable(GL_BLEND)
+
+    def advance_frame(self, time=None):
+        # Starts the next frame: moves the clock on, to time if given, and
+        # applies the input a replay has for the frame.
+        replay_log = self.replay_log
+        if replay_log is not None:
+            time = replay_log.get_frame_time(self.clock.frame + 1)
+        self.clock.tick(time)
+
+        if self.input_log is not None:
+            self.input_log.record_frame(self.clock.frame, self.clock.time)
+
+        if replay_log is not None:
+            for event in replay_log.get_events(self.clock.frame):
+                self.replay_event(event)
+            if self.clock.frame + 1 >= replay_log.frame_count:
+                self.replay_log = None
+
+    def replay_event(self, event):
+        kind = event[1]
+        arguments = event[2:]
+        if kind == 'key':
+            self.handle_key(arguments[0].encode('latin-1'))
+        elif kind == 'mouse':
+            self.handle_mouse(*arguments)
+        elif kind == 'motion':
+            self.handle_motion(*arguments)
+        elif kind == 'reshape':
+            self.reshape(*arguments)
+        elif kind == 'phase':
+            self.set_phase(*arguments)
+
+    def record_event(self, kind, *arguments):
+        # Input arriving now is handled before the next frame.
+        if self.input_log is not None:
+            self.input_log.record(self.clock.frame + 1, kind, *arguments)
+
+    def set_phase(self, phase):
+        self.record_event('phase', phase)
+        self.context.set_phase(phase)
+
+    def display(self):
+        self._frame_start_time = glutGet(GLUT_ELAPSED_TIME)
+        self.advance_frame()
+
+        self.profiler.begin_frame()
+        self.render()
+        with self.profiler.stage('swap'):
+            glutSwapBuffers()
+        self.profiler.end_frame()
+
+        # Frames are only drawn when something changed: input events post a
+        # redisplay, and the scene keeps redrawing itself while a transition
+        # runs or the student module declares itself animated. The profiler
+        # overlay also needs fresh frames to show meaningful numbers, and
+        # a replay runs until its last frame.
+        if self.timing.has_transitions() or self.context.animated \
+                or self.profiler.show_hud or self.replay_log is not None:
+            self.schedule_redisplay()
+
+    def render_image(self, width, height):
+        # Draws one frame into the current offscreen context and returns
+        # its pixels, top row first.
+        self.reshape(width, height)
+        self.profiler.begin_frame()
+        self.render()
+        with self.profiler.stage('read'):
+            pixels = offscreen.read_pixels(width, height)
+        self.profiler.end_frame()
+        return pixels
+
+    def simulate_frame(self):
+        # Runs a frame whose image is not needed, into a single pixel and
+        # without reading it back, so replays can skip ahead quickly.
+        glViewport(0, 0, 1, 1)
+        self.render()
+
+    def render_id_image(self, width, height):
+        # (height, width) object ids, top row first: 0 for the background
+        # and i + 1 for the i-th of the geometry's object names.
+        self.reshape(width, height)
+        self.render(id_colors=scoring.get_id_colors(
+            self.config.geometry.object_names))
+        return scoring.decode_ids(offscreen.read_pixels(width, height))
+
+    def schedule_redisplay(self):
+        if not self.max_fps:
+            glutPostRedisplay()
+            return
 
-    elif key == b'}':
-        context.last_phase()
+        if self._redisplay_scheduled:
+            return
+        self._redisplay_scheduled = True
+
+        frame_time = 1000.0 / self.max_fps
+        elapsed_time = glutGet(GLUT_ELAPSED_TIME) - self._frame_start_time
+        glutTimerFunc(max(0, int(frame_time - elapsed_time)),
+                      self._scheduled_redisplay, 0)
+
+    def _scheduled_redisplay(self, value):
+        self._redisplay_scheduled = False
+        glutPostRedisplay()
+
+    def reshape_window(self, width, height):
+        self.record_event('reshape', width, height)
+        self.reshape(width, height)
+
+    def reshape(self, width, height):
+        interface = self.interface
+        interface.window_width = width
+        interface.window_height = height
+
+        glViewport(0, 0, interface.window_width, interface.window_height)
+        interface.set_scene_coords_projection()
+
+    def mouse(self, button, state, x, y):
+        self.record_event('mouse', button, state, x, y)
+        self.handle_mouse(button, state, x, y)
+        glutPostRedisplay()
+
+    def handle_mouse(self, button, state, x, y):
+        interface = self.interface
+
+        if button == GLUT_LEFT_BUTTON:
+            if state == GLUT_DOWN:
+                interface.start_drag(x, y)
+            else:
+                interface.finish_drag()
+
+        elif button == 3:  # Scroll up
+            interface.increment_zoom()
+
+        elif button == 4:  # Scroll down
+            interface.decrement_zoom()
+
+    def motion(self, x, y):
+        if self.interface.is_dragging:
+            self.record_event('motion', x, y)
+            self.handle_motion(x, y)
+            glutPostRedisplay()
+
+    def handle_motion(self, x, y):
+        if self.interface.is_dragging:
+            self.interface.update_drag(x, y)
+
+    def keyboard(self, key, x, y):
+        if key == b'\x1b':
+            if bool(glutLeaveMainLoop):
+                glutLeaveMainLoop()
+                return
+            sys.exit(0)
+
+        self.record_event('key', key)
+        self.handle_key(key)
+        glutPostRedisplay()
+
+    def handle_key(self, key):
+        interface = self.interface
+        timing = self.timing
+        context = self.context
+
+        if key == b'+' or key == b'=':
+            interface.increment_zoom()
+
+        elif key == b'-':
+            interface.decrement_zoom()
+
+        elif key.lower() == b'f':
+            transition_time = interface.FAST_TRANSITION_TIME \
+                if key == b'F' else interface.SLOW_TRANSITION_TIME
+
+            if interface.show_fill:
+                interface.show_fill = False
+                timing.set_value('main_opacity', 0.1, transition_time)
+            else:
+                interface.show_fill = True
+                timing.set_value('main_opacity', 1.0, transition_time)
+
+        elif key.lower() == b'w':
+            transition_time = interface.FAST_TRANSITION_TIME \
+                if key == b'W' else interface.SLOW_TRANSITION_TIME
+
+            if interface.show_wireframe:
+                interface.show_wireframe = False
+                timing.set_value('main_wireframe_color',
+                                 Interface.HIDDEN_WIREFRAME_COLOR,
+                                 transition_time)
+            else:
+                interface.show_wireframe = True
+                timing.set_value('main_wireframe_color',
+                                 Interface.VISIBLE_WIREFRAME_COLOR,
+                                 transition_time)
+
+        elif key.lower() == b'p':
+            transition_time = interface.FAST_TRANSITION_TIME \
+                if key == b'P' else interface.SLOW_TRANSITION_TIME
+
+            if interface.show_points:
+                interface.show_points = False
+                timing.set_value('point_border_color',
+                                 Interface.HIDDEN_POINT_BORDER_COLOR,
+                                 transition_time)
+                timing.set_value('point_fill_color',
+                                 Interface.HIDDEN_POINT_FILL_COLOR,
+                                 transition_time)
+            else:
+                interface.show_points = True
+                timing.set_value('point_border_color',
+                                 Interface.VISIBLE_POINT_BORDER_COLOR,
+                                 transition_time)
+                timing.set_value('point_fill_color',
+                                 Interface.VISIBLE_POINT_FILL_COLOR,
+                                 transition_time)
+
+        elif key == b'[':
+            context.prev_phase()
+
+        elif key == b']':
+            context.next_phase()
+
+        elif key == b'{':
+            context.first_phase()
+
+        elif key == b'}':
+            context.last_phase()
+
+        elif key == b'h':
+            self.profiler.show_hud = not self.profiler.show_hud
 
+        else:
+            self.processar_teclado(key)
+
+    def run_window(self):
+        glutInitWindowPosition(0, 0)
+        glutInitWindowSize(400, 400)
+        glutCreateWindow(b"Computer Graphics")
+        # With freeglut, closing the window returns from glutMainLoop
+        # instead of calling exit(), which would skip writing the profile
+        # and the input log.
+        if bool(glutSetOption):
+            glutSetOption(GLUT_ACTION_ON_WINDOW_CLOSE,
+                          GLUT_ACTION_GLUTMAINLOOP_RETURNS)
+
+        self.init_gl()
+
+        glutDisplayFunc(self.display)
+        glutReshapeFunc(self.reshape_window)
+        glutMouseFunc(self.mouse)
+        glutMotionFunc(self.motion)
+        glutKeyboardFunc(self.keyboard)
+
+        glutMainLoop()
+
+
+def get_frame_filepath(filepath, frame, frame_count):
+    if '%' in filepath:
+        return filepath % frame
+    if frame_count == 1:
+        return filepath
+    root, extension = os.path.splitext(filepath)
+    return '%s-%04d%s' % (root, frame, extension)
+
+
+def run_headless(config, compor_cena, processar_teclado, options):
+    # Frames are at fixed times, --time and then every --frame-step, or at
+    # the times of a replayed session.
+    replay_log = None
+    if options.replay is not None:
+        replay_log = InputLog.load(options.replay)
+
+    size = options.size
+    if size is None and replay_log is not None:
+        size = replay_log.get_window_size()
+    width, height = size or (400, 400)
+
+    try:
+        gl_context = offscreen.create_context(width, height)
+    except offscreen.OffscreenError as error:
+        print("*** Atencao: Nao foi possivel criar um contexto OpenGL "
+              "sem janela: %s" % error, file=sys.stderr)
+        sys.exit(1)
+
+    if replay_log is None:
+        viewer = Viewer(config, compor_cena, processar_teclado,
+                        clock=Clock(Clock.FIXED_STEP, step=options.frame_step,
+                                    start_time=options.time))
+        viewer.set_phase(options.phase)
+        frame_count = options.frames
+        written_frames = range(frame_count)
     else:
-        processar_teclado(key)
-
-
-if config.bounds_min is not None:
-    bounds_min, bounds_max = config.bounds_min, config.bounds_max
-else:
-    bounds_min, bounds_max = config.geometry.get_bounds(config.fit_objects)
-
-delta_x = bounds_max[0] - bounds_min[0]
-delta_y = bounds_max[1] - bounds_min[1]
-interface.zoom_exponent = max(math.log(delta_x / 2) / math.log(1.2),
-                              math.log(delta_y / 2) / math.log(1.2)) + 1
-
-if config.center is not None:
-    interface.viewport_fixed_center = config.center
-else:
-    interface.viewport_fixed_center = (bounds_min[0] + 0.5 * delta_x,
-                                       bounds_min[1] + 0.5 * delta_y)
-
-glutInitWindowPosition(0, 0)
-glutInitWindowSize(400, 400)
-glutCreateWindow(b"Computer Graphics")
-
-glEnable(GL_BLEND)
-glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-
-if config.enable_depth:
-    glEnable(GL_DEPTH_TEST)
-
-glutDisplayFunc(display)
-glutIdleFunc(idle)
-glutReshapeFunc(reshape)
-glutMouseFunc(mouse)
-glutMotionFunc(motion)
-glutKeyboardFunc(keyboard)
-
-glutMainLoop()
+        viewer = Viewer(config, compor_cena, processar_teclado,
+                        replay_log=replay_log)
+        frame_count = replay_log.frame_count
+        if '%' in options.output:
+            written_frames = range(frame_count)
+        else:
+            written_frames = [frame_count - 1]
+    viewer.init_gl()
+
+    for frame in range(frame_count):
+        viewer.advance_frame()
+        if frame not in written_frames:
+            viewer.simulate_frame()
+            continue
+
+        pixels = viewer.render_image(width, height)
+        offscreen.write_png(
+            get_frame_filepath(options.output, frame, len(written_frames)),
+            pixels)
+
+    if options.profile is not None:
+        viewer.profiler.dump(options.profile)
+    config.geometry.release_buffers()
+    config.geometry.invalidate_display_lists()
+    gl_context.destroy()
+
+
+def main(options):
+    configuration = config.load_config_file(
+        options.configuration_filepath, rebuild_cache=options.rebuild_cache)
+    configuration.geometry.use_buffer_objects = not options.immediate_mode
+    compor_cena, processar_teclado = load_student_module(configuration)
+
+    if options.output is not None:
+        run_headless(configuration, compor_cena, processar_teclado, options)
+        return
+
+    glutInit(sys.argv)
+    glutInitDisplayMode(GLUT_RGB | GLUT_DOUBLE | GLUT_DEPTH)
+
+    clock = Clock(options.clock, step=options.step, speed=options.speed)
+    input_log = None
+    if options.record is not None:
+        input_log = InputLog.for_clock(clock)
+    replay_log = None
+    if options.replay is not None:
+        replay_log = InputLog.load(options.replay)
+        clock = replay_log.create_clock()
+
+    viewer = Viewer(configuration, compor_cena, processar_teclado,
+                    clock=clock, max_fps=options.max_fps,
+                    input_log=input_log, replay_log=replay_log)
+
+    def save_session():
+        if input_log is not None:
+            input_log.save(options.record)
+        if options.profile is not None:
+            viewer.profiler.dump(options.profile)
+
+    # The files are written once the main loop returns. GLUTs that cannot
+    # leave it only exit through sys.exit, which still runs atexit.
+    atexit.register(save_session)
+    viewer.run_window()
+    atexit.unregister(save_session)
+    save_session()
+
+
+if __name__ == '__main__':
+    main(options)
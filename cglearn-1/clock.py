@@ -0,0 +1,151 @@
+import collections
+
+from timing import get_glut_time
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+class Clock(object):
+    # Time of the scene in milliseconds, moved forward once per frame by
+    # tick(). Calling the clock returns that time, so it can drive a Timing.
+    #
+    # - real-time follows the wall clock;
+    # - fast-forward follows the wall clock sped up by speed;
+    # - fixed-step adds step per frame, whatever the wall clock says, so
+    #   a scene goes through the same times on every run.
+    REAL_TIME = 'real-time'
+    FAST_FORWARD = 'fast-forward'
+    FIXED_STEP = 'fixed-step'
+    MODES = (REAL_TIME, FAST_FORWARD, FIXED_STEP)
+
+    def __init__(self, mode=REAL_TIME, step=1000.0 / 60, speed=1.0,
+                 start_time=0.0, source=get_glut_time):
+        if mode not in self.MODES:
+            raise ValueError('Unknown clock mode %r.' % mode)
+        self.mode = mode
+        self.step = step
+        self.speed = speed if mode == self.FAST_FORWARD else 1.0
+        self.start_time = start_time
+        self._source = source
+        self._last_source_time = None
+
+        self.frame = -1
+        self.time = start_time
+        self.dt = 0.0
+
+    def __call__(self):
+        return self.time
+
+    def tick(self, time=None):
+        # Starts the next frame, at the given time when one is forced, as
+        # replays and headless renders do. The first frame is at
+        # start_time.
+        source_time = self._source() if self.mode != self.FIXED_STEP \
+            else None
+
+        if time is None:
+            if self.frame < 0:
+                time = self.start_time
+            elif self.mode == self.FIXED_STEP:
+                time = self.time + self.step
+            else:
+                time = self.time + self.speed * (source_time
+                                                 - self._last_source_time)
+
+        self._last_source_time = source_time
+        self.frame += 1
+        self.dt = time - self.time if self.frame > 0 else 0.0
+        self.time = time
+
+
+class InputLog(object):
+    # Input events of a session, each tagged with the frame it was handled
+    # before, plus the frame times when the clock did not run in fixed
+    # steps. Replaying a log with the same configuration and student
+    # module goes through the same states frame by frame.
+    #
+    # Events are lists [frame, kind, arguments...], with kinds 'key' (key),
+    # 'mouse' (button, state, x, y), 'motion' (x, y), 'reshape' (width,
+    # height) and 'phase' (phase). Keys are stored as latin-1
+    # strings.
+    VERSION = 1
+
+    def __init__(self, clock_mode=Clock.FIXED_STEP, step=1000.0 / 60,
+                 start_time=0.0):
+        self.clock_mode = clock_mode
+        self.step = step
+        self.start_time = start_time
+        self.frame_count = 0
+        self.frame_times = None if clock_mode == Clock.FIXED_STEP else []
+        self.events = []
+        self._events_by_frame = None
+
+    @classmethod
+    def for_clock(cls, clock):
+        return cls(clock.mode, clock.step, clock.start_time)
+
+    def record_frame(self, frame, time):
+        self.frame_count = frame + 1
+        if self.frame_times is not None:
+            self.frame_times.append(time)
+
+    def record(self, frame, kind, *arguments):
+        arguments = [argument.decode('latin-1')
+                     if isinstance(argument, bytes) else argument
+                     for argument in arguments]
+        self.events.append([frame, kind] + arguments)
+        self._events_by_frame = None
+
+    def get_window_size(self):
+        # Size of the first recorded window, or None.
+        for event in self.events:
+            if event[1] == 'reshape':
+                return tuple(event[2:4])
+        return None
+
+    def create_clock(self):
+        # Clock giving the recorded frame times when ticked by a replay.
+        return Clock(Clock.FIXED_STEP, step=self.step,
+                     start_time=self.start_time)
+
+    def get_frame_time(self, frame):
+        # Forced time of a frame, or None when it follows from the step.
+        if self.frame_times is None or frame >= len(self.frame_times):
+            return None
+        return self.frame_times[frame]
+
+    def get_events(self, frame):
+        if self._events_by_frame is None:
+            self._events_by_frame = collections.defaultdict(list)
+            for event in self.events:
+                self._events_by_frame[event[0]].append(event)
+        return self._events_by_frame.get(frame, [])
+
+    def save(self, filepath):
+        with open(filepath, 'w') as fh:
+            json.dump({
+                'version': self.VERSION,
+                'clock_mode': self.clock_mode,
+                'step': self.step,
+                'start_time': self.start_time,
+                'frame_count': self.frame_count,
+                'frame_times': self.frame_times,
+                'events': self.events,
+            }, fh, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, filepath):
+        with open(filepath) as fh:
+            data = json.load(fh)
+        if data.get('version') != cls.VERSION:
+            raise ValueError('Unsupported input log version %r in %s.'
+                             % (data.get('version'), filepath))
+
+        log = cls(data['clock_mode'], data['step'], data['start_time'])
+        log.frame_count = data['frame_count']
+        log.frame_times = data['frame_times']
+        log.events = data['events']
+        return log
@@ -1,7 +1,9 @@
 import sys
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 from geometry import Geometry
+import meshcache
 
 try:
     import simplejson as json
@@ -14,7 +16,7 @@ class Configuration(object):
     bounds_min = None
     bounds_max = None
 
-    def __init__(self, filepath):
+    def __init__(self, filepath, rebuild_cache=False):
         config_data = json.load(open(filepath))
 
         self.default_object_name = config_data.get("default_object")
@@ -22,12 +24,11 @@ class Configuration(object):
         self.module_name = config_data.get("module", "student_module")
         self.callback_name = config_data.get("callback", "compor_cena")
         self.enable_depth = config_data.get("depth", False)
+        self.lazy = config_data.get("lazy", False)
 
-        self.geometry = Geometry()
-
-        obj_filepaths = config_data.get("obj_files", [])
-        for obj_filepath in obj_filepaths:
-            self.geometry.read_obj(obj_filepath)
+        self.geometry = load_geometry(config_data.get("obj_files", []),
+                                      rebuild_cache=rebuild_cache,
+                                      lazy=self.lazy)
 
         self.fit_objects = config_data.get("fit_objects")
         self.sequence = config_data.get("sequence", ["UserCallback"])
@@ -44,6 +45,48 @@ class Configuration(object):
                                float(max(bounds[0][1], bounds[1][1])))
 
 
+def load_geometry(obj_filepaths, rebuild_cache=False, lazy=False):
+    # Cached files are mapped right away; the others are parsed in parallel,
+    # one process per file. Everything is then merged into one geometry.
+    # Lazy loading only indexes the files and bypasses the cache.
+    parts = {}
+    if lazy:
+        for obj_filepath in obj_filepaths:
+            parts[obj_filepath] = Geometry()
+            parts[obj_filepath].index_obj(obj_filepath)
+    elif not rebuild_cache:
+        for obj_filepath in obj_filepaths:
+            part = meshcache.try_read_cache(obj_filepath)
+            if part is not None:
+                parts[obj_filepath] = part
+
+    missing_filepaths = [obj_filepath for obj_filepath in obj_filepaths
+                         if obj_filepath not in parts]
+    if len(missing_filepaths) > 1:
+        with ProcessPoolExecutor(
+                max_workers=min(len(missing_filepaths),
+                                os.cpu_count() or 1)) as executor:
+            parts.update(zip(missing_filepaths, executor.map(
+                meshcache.compile_obj, missing_filepaths)))
+    else:
+        for obj_filepath in missing_filepaths:
+            parts[obj_filepath] = meshcache.compile_obj(obj_filepath)
+
+    if len(obj_filepaths) == 1:
+        return parts[obj_filepaths[0]]
+
+    geometry = Geometry()
+    for obj_filepath in obj_filepaths:
+        namespace = os.path.splitext(os.path.basename(obj_filepath))[0]
+        renamed = geometry.merge(parts[obj_filepath], namespace)
+        for object_name, new_object_name in renamed:
+            print("*** Atencao: Objeto '%s' de %s ja existe e foi renomeado"
+                  " para '%s'." % (object_name, obj_filepath,
+                                   new_object_name), file=sys.stderr)
+
+    return geometry
+
+
 def get_config_filepaths():
     entries = os.listdir('.')
     entries = [entry for entry in entries
@@ -52,7 +95,7 @@ def get_config_filepaths():
     return entries
 
 
-def load_config_file(filepath=None):
+def load_config_file(filepath=None, rebuild_cache=False):
     if filepath is None:
         filepaths = get_config_filepaths()
 
@@ -76,4 +119,4 @@ def load_config_file(filepath=None):
         else:
             filepath = filepaths[0]
 
-    return Configuration(filepath)
+    return Configuration(filepath, rebuild_cache=rebuild_cache)
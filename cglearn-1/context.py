@@ -1,16 +1,34 @@
 from OpenGL.GL import *
 
 from drawingutils import *
+from transformation import pose_matrices
+from profiling import FrameProfiler
+from clock import Clock
+from gears import GearTrain
+from scenegraph import SceneGraph
 
 
 class Context(object):
-    def __init__(self, config, interface, timing):
+    def __init__(self, config, interface, timing, profiler=None, clock=None):
         self._config = config
         self._interface = interface
         self._timing = timing
+        self._profiler = profiler if profiler is not None \
+            else FrameProfiler(enabled=False)
+        self._clock = clock if clock is not None else Clock()
         self._geometry = config.geometry
         self._current_phase = 0
 
+        # Set by animated scenes so the viewer keeps redrawing them even
+        # when nothing else changes.
+        self.animated = False
+
+        # While set, maps object names to flat colors that every draw uses
+        # instead of materials, wireframes and points, for id renders.
+        self.id_colors = None
+
+        self._scene = None
+
         self._timing.set_value("phase", 0)
 
     def get_phase_k(self, phase):
@@ -24,6 +42,21 @@ class Context(object):
         else:
             return running_phase - phase
 
+    # Scene time and time since the previous frame, in seconds. Animations
+    # using them instead of the wall clock replay and render headlessly
+    # exactly like they run in the window.
+    @property
+    def time(self):
+        return self._clock.time / 1000.0
+
+    @property
+    def dt(self):
+        return self._clock.dt / 1000.0
+
+    @property
+    def frame(self):
+        return self._clock.frame
+
     @property
     def object_names(self):
         return self._geometry.object_names
@@ -32,35 +65,84 @@ class Context(object):
         if object_name is None:
             object_name = self._config.default_object_name
 
+        with self._profiler.object(object_name):
+            self._draw(object_name)
+
+    def _draw(self, object_name):
+        if self.id_colors is not None:
+            self._geometry.fill(object_name,
+                                color=self.id_colors[object_name])
+            return
+
         self._geometry.fill(object_name,
                             opacity=self._timing.get_value('main_opacity'))
         glColor(self._timing.get_value('main_wireframe_color'))
         self._geometry.draw_wireframe(object_name)
 
-        # modelview_matrix = glGetDoublev(GL_MODELVIEW_MATRIX)
-        # projection_matrix = glGetDoublev(GL_PROJECTION_MATRIX)
-        # viewport_matrix = glGetIntegerv(GL_VIEWPORT)
-        #
-        # self._interface.set_window_coords_projection()
-        #
-        # glColor(self._timing.get_value('point_fill_color'))
-        # for point in self._geometry.get_vertexes(object_name):
-        #     fill_circle(5, self._interface.scene_to_window_coords(
-        #         point, modelview_matrix, projection_matrix, viewport_matrix))
-        # glColor(self._timing.get_value('point_border_color'))
-        # for point in self._geometry.get_vertexes(object_name):
-        #     draw_circle(5, self._interface.scene_to_window_coords(
-        #         point, modelview_matrix, projection_matrix, viewport_matrix))
+        point_fill_color = self._timing.get_value('point_fill_color')
+        point_border_color = self._timing.get_value('point_border_color')
+        if point_fill_color[3] > 0.0 or point_border_color[3] > 0.0:
+            draw_point_markers(self._geometry.get_vertex_array(object_name),
+                               5, fill_color=point_fill_color,
+                               border_color=point_border_color)
+
+    def draw_instances(self, object_name, transforms):
+        # Draws one copy of the object per transform, as in draw, in a
+        # single batch. See transformation.pose_matrices for the formats.
+        matrices = pose_matrices(transforms)
+
+        with self._profiler.object(object_name):
+            self._draw_instances(object_name, matrices)
+
+    def _draw_instances(self, object_name, matrices):
+        if self.id_colors is not None:
+            self._geometry.fill_instances(object_name, matrices,
+                                          color=self.id_colors[object_name])
+            return
+
+        self._geometry.fill_instances(
+            object_name, matrices,
+            opacity=self._timing.get_value('main_opacity'))
+        glColor(self._timing.get_value('main_wireframe_color'))
+        self._geometry.draw_wireframe_instances(object_name, matrices)
+
+    @property
+    def scene(self):
+        # Retained scene graph, kept between frames and drawn by draw_scene;
+        # see scenegraph.SceneGraph.
+        if self._scene is None:
+            self._scene = SceneGraph()
+        return self._scene
+
+    def draw_scene(self, scene=None):
+        # Draws every node of the scene graph at its world matrix, with one
+        # batch per object.
+        if scene is None:
+            scene = self.scene
+        world_matrices = scene.get_world_matrices()
+        for object_name, indexes in scene.get_draw_list(self._geometry):
+            self.draw_instances(object_name, world_matrices[indexes])
+
+    def create_gear_train(self, *args, **kwargs):
+        # Gear train of objects of the scene; see gears.GearTrain.
+        return GearTrain(self._geometry, *args, **kwargs)
 
     def outline(self, object_name=None, color=None):
         if object_name is None:
             object_name = self._config.default_object_name
         if color is None:
             color = (0.2, 0.6, 0.8)
+        if self.id_colors is not None:
+            return
 
         glColor(color)
         self._geometry.draw_wireframe(object_name)
 
+    def set_phase(self, phase):
+        # Jumps straight to the given phase, with no transition.
+        self._current_phase = phase
+        self._timing.set_value("phase", float(self._current_phase))
+
     def first_phase(self):
         if self._current_phase > 0:
             self._current_phase = 0
@@ -4,97 +4,219 @@ import numpy
 from OpenGL.GL import *
 
 
-def fill_circle(radius, center=(0.0, 0.0, 0.0), steps=32):
-    glBegin(GL_POLYGON)
+_unit_circles = {}
 
-    for step in range(steps):
-        glVertex(radius * math.cos(step * 2 * math.pi / steps) + center[0],
-                 radius * math.sin(step * 2 * math.pi / steps) + center[1],
-                 center[2])
 
-    glEnd()
+def get_unit_circle(steps):
+    unit_circle = _unit_circles.get(steps)
+    if unit_circle is None:
+        angles = numpy.arange(steps) * 2 * math.pi / steps
+        unit_circle = numpy.stack((numpy.cos(angles), numpy.sin(angles)),
+                                  axis=1)
+        _unit_circles[steps] = unit_circle
+    return unit_circle
 
 
-def draw_circle(radius, center=(0.0, 0.0, 0.0), steps=32):
-    glBegin(GL_LINE_LOOP)
+def _get_circle_vertexes(radius, center, steps):
+    vertexes = numpy.empty((steps, 3), dtype=numpy.float32)
+    vertexes[:, :2] = radius * get_unit_circle(steps) + center[:2]
+    vertexes[:, 2] = center[2]
+    return vertexes
 
-    for step in range(steps):
-        glVertex(radius * math.cos(step * 2 * math.pi / steps) + center[0],
-                 radius * math.sin(step * 2 * math.pi / steps) + center[1],
-                 center[2])
 
-    glEnd()
+def fill_circle(radius, center=(0.0, 0.0, 0.0), steps=32):
+    vertexes = _get_circle_vertexes(radius, center, steps)
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glVertexPointer(3, GL_FLOAT, 0, vertexes)
+    glDrawArrays(GL_POLYGON, 0, steps)
+    glDisableClientState(GL_VERTEX_ARRAY)
 
 
-def draw_grid_2d(grid_spacing=None):
+def draw_circle(radius, center=(0.0, 0.0, 0.0), steps=32):
+    vertexes = _get_circle_vertexes(radius, center, steps)
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glVertexPointer(3, GL_FLOAT, 0, vertexes)
+    glDrawArrays(GL_LINE_LOOP, 0, steps)
+    glDisableClientState(GL_VERTEX_ARRAY)
+
+
+def project_points(points, modelview_matrix, projection_matrix, viewport):
+    # Same as gluProject for every point at once. GL matrices come back
+    # column-major, so row vectors are multiplied on the left.
+    points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3)
+    clip = numpy.concatenate((points, numpy.ones((len(points), 1))),
+                             axis=1).dot(
+        numpy.asarray(modelview_matrix).reshape(4, 4)).dot(
+        numpy.asarray(projection_matrix).reshape(4, 4))
+    ndc = clip[:, :3] / clip[:, 3:]
+
+    window = numpy.empty_like(ndc)
+    window[:, 0] = viewport[0] + (ndc[:, 0] + 1.0) * viewport[2] / 2.0
+    window[:, 1] = viewport[1] + (ndc[:, 1] + 1.0) * viewport[3] / 2.0
+    window[:, 2] = (ndc[:, 2] + 1.0) / 2.0
+    return window
+
+
+def draw_point_markers(points, radius, fill_color=None, border_color=None,
+                       steps=16):
+    # Draws a circle of the given radius in pixels around every point, all
+    # fills in one draw and all borders in another.
+    points = numpy.asarray(points).reshape(-1, 3)
+    if not len(points):
+        return
+
+    viewport = glGetIntegerv(GL_VIEWPORT)
+    centers = project_points(points, glGetDoublev(GL_MODELVIEW_MATRIX),
+                             glGetDoublev(GL_PROJECTION_MATRIX),
+                             viewport)[:, :2]
+
+    circle = radius * get_unit_circle(steps)
+    rims = centers[:, numpy.newaxis, :] + circle
+    next_rims = numpy.roll(rims, -1, axis=1)
+
     orig_depth_test_enabled = glIsEnabled(GL_DEPTH_TEST)
+    glDisable(GL_DEPTH_TEST)
+
+    glMatrixMode(GL_PROJECTION)
+    glPushMatrix()
+    glLoadIdentity()
+    glOrtho(viewport[0], viewport[0] + viewport[2],
+            viewport[1], viewport[1] + viewport[3], -1, 1)
+    glMatrixMode(GL_MODELVIEW)
+    glPushMatrix()
+    glLoadIdentity()
+    glEnableClientState(GL_VERTEX_ARRAY)
+
+    if fill_color is not None:
+        triangles = numpy.ascontiguousarray(numpy.stack(
+            (numpy.broadcast_to(centers[:, numpy.newaxis, :], rims.shape),
+             rims, next_rims), axis=2).reshape(-1, 2), dtype=numpy.float32)
+        glColor(fill_color)
+        glVertexPointer(2, GL_FLOAT, 0, triangles)
+        glDrawArrays(GL_TRIANGLES, 0, len(triangles))
+
+    if border_color is not None:
+        segments = numpy.ascontiguousarray(numpy.stack(
+            (rims, next_rims), axis=2).reshape(-1, 2), dtype=numpy.float32)
+        glColor(border_color)
+        glVertexPointer(2, GL_FLOAT, 0, segments)
+        glDrawArrays(GL_LINES, 0, len(segments))
+
+    glDisableClientState(GL_VERTEX_ARRAY)
+    glPopMatrix()
+    glMatrixMode(GL_PROJECTION)
+    glPopMatrix()
+    glMatrixMode(GL_MODELVIEW)
+
+    if orig_depth_test_enabled:
+        glEnable(GL_DEPTH_TEST)
+
+
+def get_grid_spacing(delta, min_intervals, factors):
+    selected_interval_count = float('inf')
+    selected_spacing = None
+
+    for factor in factors:
+        spacing = delta / min_intervals / factor
+        spacing = 10 ** math.floor(math.log10(spacing)) * factor
+        interval_count = delta / spacing
+
+        if interval_count < selected_interval_count:
+            selected_interval_count = interval_count
+            selected_spacing = spacing
+
+    return selected_spacing
+
+
+def get_visible_bounds():
     modelview_matrix = numpy.array(glGetFloatv(GL_MODELVIEW_MATRIX))
     projection_matrix = numpy.array(glGetFloatv(GL_PROJECTION_MATRIX))
     inv_matrix = numpy.linalg.inv(projection_matrix.dot(modelview_matrix))
 
-    glDisable(GL_DEPTH_TEST)
-
     scene_points = numpy.array(
         [[x, y, 0, 1] for x in (-1, 1) for y in (-1, 1)])
     image_points = scene_points.dot(inv_matrix)
     image_x = image_points[:, 0] / image_points[:, 3]
     image_y = image_points[:, 1] / image_points[:, 3]
 
-    min_x = min(image_x)
-    max_x = max(image_x)
-    min_y = min(image_y)
-    max_y = max(image_y)
+    return min(image_x), min(image_y), max(image_x), max(image_y)
+
+
+class GridLines(object):
+    # Vertexes of the grid lines followed by the X and Y axes, built for a
+    # range of whole grid cells.
+    def __init__(self, grid_spacing, index_min_x, index_min_y,
+                 index_max_x, index_max_y):
+        min_x = index_min_x * grid_spacing
+        max_x = index_max_x * grid_spacing
+        min_y = index_min_y * grid_spacing
+        max_y = index_max_y * grid_spacing
+
+        ys = numpy.arange(index_min_y, index_max_y + 1) * grid_spacing
+        xs = numpy.arange(index_min_x, index_max_x + 1) * grid_spacing
+
+        horizontal = numpy.empty((len(ys), 2, 2))
+        horizontal[:, 0, 0] = min_x
+        horizontal[:, 1, 0] = max_x
+        horizontal[:, :, 1] = ys[:, numpy.newaxis]
+
+        vertical = numpy.empty((len(xs), 2, 2))
+        vertical[:, :, 0] = xs[:, numpy.newaxis]
+        vertical[:, 0, 1] = min_y
+        vertical[:, 1, 1] = max_y
+
+        axes = numpy.array([[min_x, 0], [max_x, 0], [0, min_y], [0, max_y]])
 
-    def get_grid_spacing(delta, min_intervals, factors):
-        selected_interval_count = float('inf')
-        selected_spacing = None
+        self.vertexes = numpy.ascontiguousarray(numpy.concatenate((
+            horizontal.reshape(-1, 2), vertical.reshape(-1, 2), axes)),
+            dtype=numpy.float32)
+        self.grid_count = len(self.vertexes) - 4
 
-        for factor in factors:
-            spacing = delta / min_intervals / factor
-            spacing = 10 ** math.floor(math.log10(spacing)) * factor
-            interval_count = delta / spacing
+    def draw(self):
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(2, GL_FLOAT, 0, self.vertexes)
 
-            if interval_count < selected_interval_count:
-                selected_interval_count = interval_count
-                selected_spacing = spacing
+        glColor(0.2, 0.2, 0.2)
+        glDrawArrays(GL_LINES, 0, self.grid_count)
+        glColor(0.6, 0.2, 0.2)
+        glDrawArrays(GL_LINES, self.grid_count, 2)
+        glColor(0.2, 0.6, 0.2)
+        glDrawArrays(GL_LINES, self.grid_count + 2, 2)
 
-        return selected_spacing
+        glDisableClientState(GL_VERTEX_ARRAY)
+
+
+_grid_cache = {}
+
+
+def draw_grid_2d(grid_spacing=None, bounds=None):
+    # bounds is the visible (min_x, min_y, max_x, max_y) of the scene. When
+    # omitted it is recovered from the current matrices.
+    if bounds is None:
+        bounds = get_visible_bounds()
+    min_x, min_y, max_x, max_y = bounds
 
     if grid_spacing is None:
         grid_spacing = get_grid_spacing(
             min(max_x - min_x, max_y - min_y), 10, (1, 2, 5))
 
-    count_x = long(math.ceil(max_x / grid_spacing)
-                   - math.floor(min_x / grid_spacing))
-    min_x = math.floor(min_x / grid_spacing) * grid_spacing
-    max_x = math.ceil(max_x / grid_spacing) * grid_spacing
-    count_y = long(math.ceil(max_y / grid_spacing)
-                   - math.floor(min_y / grid_spacing))
-    min_y = math.floor(min_y / grid_spacing) * grid_spacing
-    max_y = math.ceil(max_y / grid_spacing) * grid_spacing
-
-    glColor(0.2, 0.2, 0.2)
-    glBegin(GL_LINES)
-
-    for index_y in range(count_y + 1):
-        y = min_y + grid_spacing * index_y
-        glVertex(min_x, y)
-        glVertex(max_x, y)
-
-    for index_x in range(count_x + 1):
-        x = min_x + grid_spacing * index_x
-        glVertex(x, min_y)
-        glVertex(x, max_y)
-
-    glColor(0.6, 0.2, 0.2)
-    glVertex(min_x, 0)
-    glVertex(max_x, 0)
-
-    glColor(0.2, 0.6, 0.2)
-    glVertex(0, min_y)
-    glVertex(0, max_y)
-
-    glEnd()
+    # Lines only change when the view crosses into another grid cell, so
+    # the cache is keyed by whole cells rather than by exact bounds.
+    key = (grid_spacing,
+           int(math.floor(min_x / grid_spacing)),
+           int(math.floor(min_y / grid_spacing)),
+           int(math.ceil(max_x / grid_spacing)),
+           int(math.ceil(max_y / grid_spacing)))
+    grid_lines = _grid_cache.get(key)
+    if grid_lines is None:
+        _grid_cache.clear()
+        grid_lines = GridLines(*key)
+        _grid_cache[key] = grid_lines
+
+    orig_depth_test_enabled = glIsEnabled(GL_DEPTH_TEST)
+    glDisable(GL_DEPTH_TEST)
+
+    grid_lines.draw()
 
     if orig_depth_test_enabled:
         glEnable(GL_DEPTH_TEST)
@@ -0,0 +1,190 @@
+import re
+import collections
+
+import numpy
+
+from transformation import pose_matrices
+
+
+# Kinematics of gear trains made of gear objects modelled flat around the
+# Z axis, centred on the origin. A train is described by which gears mesh
+# and which share an axle; the angular velocities follow from that once,
+# and the angles of all gears at any time come from one closed-form
+# evaluation, so nothing is integrated frame by frame.
+
+_TOOTH_COUNT_PATTERN = re.compile(r'-(\d+)$')
+
+
+def measure_gear(vertexes):
+    # (pitch radius, tooth count) of a gear from its (N, 3) vertexes. The
+    # pitch circle lies midway between the tooth tips and the root of the
+    # teeth, the closest rim vertexes, those farther than half the tip
+    # radius from the axis. Tips are counted as the groups of tip vertexes
+    # separated by gaps wider than half the widest one.
+    vertexes = numpy.asarray(vertexes, dtype=numpy.float64)
+    radii = numpy.hypot(vertexes[:, 0], vertexes[:, 1])
+    tip_radius = radii.max()
+    root_radius = radii[radii > 0.5 * tip_radius].min()
+
+    is_tip = radii > tip_radius - 1e-3 * tip_radius
+    angles = numpy.unique(numpy.round(numpy.arctan2(
+        vertexes[is_tip, 1], vertexes[is_tip, 0]), 6))
+    gaps = numpy.diff(numpy.append(angles, angles[0] + 2.0 * numpy.pi))
+    tooth_count = int(numpy.sum(gaps > 0.5 * gaps.max()))
+
+    return 0.5 * (tip_radius + root_radius), tooth_count
+
+
+def get_tooth_count(object_name):
+    # Tooth count given by object names ending in -<teeth>, as r2-24, or
+    # None.
+    match = _TOOTH_COUNT_PATTERN.search(object_name)
+    return int(match.group(1)) if match is not None else None
+
+
+class Gear(object):
+    def __init__(self, name, object_name, radius, tooth_count, phase=0.0):
+        self.name = name
+        self.object_name = object_name
+        self.radius = radius
+        self.tooth_count = tooth_count
+        self.phase = phase
+
+
+class GearTrain(object):
+    # Gears are named by their object names, or by names of their own
+    # mapped to objects by objects, so an object may be used for several
+    # gears.
+    #
+    # - meshes are (gear, other gear, direction) triples, direction being
+    #   the angle in degrees from the centre of the first gear to the
+    #   centre of the other; meshing gears turn in opposite directions;
+    # - axles are (gear, other gear) pairs turning together around the
+    #   same centre;
+    # - phases are the angles in degrees of gears at rest, to line teeth up.
+    #
+    # The driver, the first gear of the first mesh or axle by default, sits
+    # at position and turns at speed degrees per second. Angles are counter
+    # clockwise and times are in seconds.
+    def __init__(self, geometry, meshes=(), axles=(), phases=None,
+                 objects=None, driver=None, position=(0.0, 0.0)):
+        phases = phases or {}
+        objects = objects or {}
+        links = [(gear_name, other_name, direction)
+                 for gear_name, other_name, direction in meshes] \
+            + [(gear_name, other_name, None)
+               for gear_name, other_name in axles]
+        if not links and driver is None:
+            raise ValueError('A gear train needs a driver, meshes or axles.')
+        if driver is None:
+            driver = links[0][0]
+
+        names = [driver]
+        for gear_name, other_name, direction in links:
+            for name in (gear_name, other_name):
+                if name not in names:
+                    names.append(name)
+
+        self.gears = collections.OrderedDict()
+        for name in names:
+            object_name = objects.get(name, name)
+            radius, tooth_count = measure_gear(
+                geometry.get_vertex_array(object_name))
+            named_tooth_count = get_tooth_count(object_name)
+            if named_tooth_count is not None:
+                tooth_count = named_tooth_count
+            self.gears[name] = Gear(name, object_name, radius, tooth_count,
+                                    phases.get(name, 0.0))
+
+        self._solve(driver, position, links)
+
+        # Gear indexes by object, so every object is drawn in one batch.
+        self._object_indexes = collections.OrderedDict()
+        for index, gear in enumerate(self.gears.values()):
+            self._object_indexes.setdefault(gear.object_name, []).append(
+                index)
+
+        self._phases = numpy.array(
+            [gear.phase for gear in self.gears.values()])
+        self.driver = driver
+        self.speed = 0.0
+        self._driver_angle = 0.0
+        self._driver_time = 0.0
+
+    def _solve(self, driver, position, links):
+        # Walks the links from the driver, giving every gear its position
+        # and its velocity as a multiple of the driver's. A link closing a
+        # loop must agree with what the walk found already.
+        neighbours = collections.defaultdict(list)
+        for gear_name, other_name, direction in links:
+            neighbours[gear_name].append((other_name, direction, 1.0))
+            neighbours[other_name].append((gear_name, direction, -1.0))
+
+        ratios = {driver: 1.0}
+        positions = {driver: numpy.asarray(position, dtype=numpy.float64)}
+        pending = collections.deque([driver])
+        while pending:
+            name = pending.popleft()
+            gear = self.gears[name]
+            for other_name, direction, sense in neighbours[name]:
+                other = self.gears[other_name]
+                if direction is None:
+                    ratio = ratios[name]
+                    other_position = positions[name]
+                else:
+                    ratio = -ratios[name] * gear.tooth_count \
+                        / other.tooth_count
+                    angle = numpy.radians(direction)
+                    other_position = positions[name] \
+                        + sense * (gear.radius + other.radius) \
+                        * numpy.array([numpy.cos(angle), numpy.sin(angle)])
+
+                if other_name not in ratios:
+                    ratios[other_name] = ratio
+                    positions[other_name] = other_position
+                    pending.append(other_name)
+                elif not numpy.isclose(ratios[other_name], ratio):
+                    raise ValueError('Gears %r and %r lock the train.'
+                                     % (name, other_name))
+
+        names = list(self.gears)
+        self.ratios = numpy.array([ratios[name] for name in names])
+        self.positions = numpy.array([positions[name] for name in names])
+
+    def set_speed(self, speed, time):
+        # Turns the driver at speed from time on. Angles stay continuous.
+        self._driver_angle = self.get_driver_angles(time)
+        self._driver_time = time
+        self.speed = speed
+
+    def get_driver_angles(self, times):
+        return self._driver_angle \
+            + self.speed * (numpy.asarray(times, dtype=numpy.float64)
+                            - self._driver_time)
+
+    def get_angles(self, times):
+        # (..., gear count) angles in degrees of every gear at times, since
+        # the last set_speed.
+        driver_angles = self.get_driver_angles(times)
+        return self._phases \
+            + self.ratios * driver_angles[..., numpy.newaxis]
+
+    def get_velocities(self):
+        # Angular velocity of every gear in degrees per second.
+        return self.speed * self.ratios
+
+    def get_poses(self, time):
+        # (gear count, 3) rows of (x, y, angle), as pose_matrices takes.
+        return numpy.column_stack((self.positions, self.get_angles(time)))
+
+    def get_matrices(self, time):
+        return pose_matrices(self.get_poses(time))
+
+    def draw(self, context, time=None):
+        # Draws every gear at time, the scene time by default, with one
+        # batch per object.
+        if time is None:
+            time = context.time
+        matrices = self.get_matrices(time)
+        for object_name, indexes in self._object_indexes.items():
+            context.draw_instances(object_name, matrices[indexes])
@@ -1,133 +1,940 @@
 import os
-import re
+import ctypes
+
+import numpy
 
 from OpenGL.GL import *
 
 
-class AbstractPrimitive(object):
-    def __init__(self, geometry, *args, **kwargs):
-        self.material_name = kwargs.pop('material_name', None)
+DEFAULT_DIFFUSE_COLOR = (0.9, 0.7, 0.4)
+
+
+def parse_face_vertex(token):
+    parts = token.split('/')
+    if len(parts) > 3 or not parts[0].isdigit():
+        raise ValueError('Invalid face vertex: %r.' % token)
+
+    vertex_index = int(parts[0]) - 1
+    if len(parts) == 3 and parts[2]:
+        normal_index = int(parts[2]) - 1
+    else:
+        normal_index = -1
+    return vertex_index, normal_index
+
+
+class GeometryObject(object):
+    # Faces are kept as a (count, 3) int32 array of triangles indexing the
+    # shared vertex and normal arrays of the owning Geometry. A normal index
+    # of -1 means the corner has no normal. Runs are (material_name, start,
+    # stop) slices of consecutive triangles sharing a material; once grouped
+    # by group_by_material there is a single run per material. Edges are the
+    # unique (low, high) vertex index pairs of the outlines of the original
+    # polygons and of the lines. vertex_indexes and bounds (a min row and a
+    # max row, infinite when the object has no vertexes) are cached by
+    # update_bounds.
+    #
+    # Parsers fill the polygon fields instead: the corners of all polygons
+    # one after the other, with the size of each polygon and runs counted in
+    # polygons. triangulate turns them into triangles.
+    ARRAY_FIELDS = ('triangles', 'triangle_normals', 'lines', 'edges',
+                    'vertex_indexes', 'bounds')
+    RUN_FIELDS = ('triangle_runs',)
+
+    def __init__(self, name):
+        self.name = name
+        self.triangles = numpy.zeros((0, 3), dtype=numpy.int32)
+        self.triangle_normals = numpy.zeros((0, 3), dtype=numpy.int32)
+        self.triangle_runs = []
+        self.polygons = numpy.zeros(0, dtype=numpy.int32)
+        self.polygon_normals = numpy.zeros(0, dtype=numpy.int32)
+        self.polygon_sizes = numpy.zeros(0, dtype=numpy.int32)
+        self.polygon_runs = []
+        self.lines = numpy.zeros((0, 2), dtype=numpy.int32)
+        self.edges = numpy.zeros((0, 2), dtype=numpy.int32)
+        self.vertex_indexes = numpy.zeros(0, dtype=numpy.int32)
+        self.bounds = numpy.array([[numpy.inf] * 3, [-numpy.inf] * 3],
+                                  dtype=numpy.float32)
+
+    @staticmethod
+    def _group_runs(faces, face_normals, runs):
+        material_names = []
+        batches = {}
+        for material_name, start, stop in runs:
+            if material_name not in batches:
+                material_names.append(material_name)
+                batches[material_name] = []
+            batches[material_name].append(numpy.arange(start, stop))
+
+        order = numpy.concatenate(
+            [numpy.concatenate(batches[material_name])
+             for material_name in material_names] or
+            [numpy.zeros(0, dtype=numpy.intp)])
+
+        grouped_runs = []
+        start = 0
+        for material_name in material_names:
+            stop = start + sum(len(batch) for batch in batches[material_name])
+            grouped_runs.append((material_name, start, stop))
+            start = stop
+
+        return faces[order], face_normals[order], grouped_runs
+
+    def group_by_material(self):
+        self.triangles, self.triangle_normals, self.triangle_runs = \
+            self._group_runs(self.triangles, self.triangle_normals,
+                             self.triangle_runs)
+
+    def update_edges(self, edges):
+        edges = numpy.sort(edges, axis=1).astype(numpy.int64)
+
+        keys = numpy.unique(edges[:, 0] * (edges[:, 1].max(initial=0) + 1)
+                            + edges[:, 1])
+        self.edges = numpy.stack(
+            divmod(keys, edges[:, 1].max(initial=0) + 1),
+            axis=1).astype(numpy.int32).reshape(-1, 2)
 
-        self._vertex_indexes = []
-        self._material_indexes = []
-        self._normal_indexes = []
-        self._geometry = geometry
+    def triangulate(self, vertexes):
+        # Every polygon of n corners becomes n - 2 triangles, in order, so
+        # the polygon runs map directly onto triangle runs. Triangles and
+        # quads are split as a fan from their first corner; larger polygons
+        # are ear clipped, since they are often concave.
+        sizes = self.polygon_sizes.astype(numpy.int64)
+        starts = numpy.concatenate(([0], numpy.cumsum(sizes)[:-1]))
+        triangle_counts = sizes - 2
+        triangle_starts = numpy.concatenate(
+            ([0], numpy.cumsum(triangle_counts)))
 
-        for arg in args:
-            m = re.match(r'(\d+)(?:/(\d*)(?:/(\d*)?))?$', arg)
-            vertex_index = int(m.group(1)) - 1
-            if m.group(2):
-                material_index = int(m.group(2)) - 1
+        polygon_ids = numpy.repeat(numpy.arange(len(sizes)), triangle_counts)
+        steps = (numpy.arange(len(polygon_ids))
+                 - triangle_starts[:-1][polygon_ids])
+        corners = starts[polygon_ids][:, numpy.newaxis] + numpy.stack(
+            (numpy.zeros_like(steps), steps + 1, steps + 2), axis=1)
+
+        for polygon_id in numpy.flatnonzero(sizes > 4).tolist():
+            start = starts[polygon_id]
+            local_triangles = _ear_clip(vertexes[
+                self.polygons[start:start + sizes[polygon_id]]])
+            if local_triangles is not None:
+                corners[triangle_starts[polygon_id]:
+                        triangle_starts[polygon_id + 1]] = \
+                    start + local_triangles
+
+        self.triangles = self.polygons[corners].reshape(-1, 3)
+        self.triangle_normals = self.polygon_normals[corners].reshape(-1, 3)
+        self.triangle_runs = [
+            (material_name, int(triangle_starts[start]),
+             int(triangle_starts[stop]))
+            for material_name, start, stop in self.polygon_runs]
+
+        # Each corner is joined to the next one of its polygon, the last
+        # corner closing the outline.
+        next_corners = numpy.arange(1, len(self.polygons) + 1)
+        next_corners[starts + sizes - 1] = starts
+        self.update_edges(numpy.concatenate((
+            numpy.stack((self.polygons, self.polygons[next_corners]),
+                        axis=1),
+            self.lines)))
+
+        self.polygons = numpy.zeros(0, dtype=numpy.int32)
+        self.polygon_normals = numpy.zeros(0, dtype=numpy.int32)
+        self.polygon_sizes = numpy.zeros(0, dtype=numpy.int32)
+        self.polygon_runs = []
+
+    def rebased(self, name, vertex_offset, normal_offset, material_names):
+        # Copy of this triangulated object for a geometry where its vertexes
+        # and normals start at the given offsets and its materials were
+        # renamed.
+        result = GeometryObject(name)
+        result.triangles = self.triangles + numpy.int32(vertex_offset)
+        result.triangle_normals = numpy.where(
+            self.triangle_normals >= 0,
+            self.triangle_normals + normal_offset,
+            self.triangle_normals).astype(numpy.int32)
+        result.triangle_runs = [
+            (material_names.get(material_name, material_name), start, stop)
+            for material_name, start, stop in self.triangle_runs]
+        result.lines = self.lines + numpy.int32(vertex_offset)
+        result.edges = self.edges + numpy.int32(vertex_offset)
+        result.vertex_indexes = self.vertex_indexes + numpy.int32(vertex_offset)
+        result.bounds = numpy.array(self.bounds)
+        return result
+
+    def update_bounds(self, vertexes):
+        self.vertex_indexes = numpy.unique(numpy.concatenate((
+            self.triangles.ravel(), self.lines.ravel())))
+        if len(self.vertex_indexes):
+            object_vertexes = vertexes[self.vertex_indexes]
+            self.bounds = numpy.array([object_vertexes.min(axis=0),
+                                       object_vertexes.max(axis=0)],
+                                      dtype=numpy.float32)
+
+
+def _ear_clip(points):
+    # Triangulates one simple polygon given its (n, 3) corners, returning
+    # (n - 2, 3) corner indexes with the winding of the polygon, or None
+    # when no ear can be found (self-intersecting or degenerate polygons).
+    points = numpy.asarray(points, dtype=numpy.float64)
+
+    # Newell's normal; the polygon is projected on the plane of the two
+    # other axes, where it keeps its winding when the dropped component is
+    # positive.
+    following = numpy.roll(points, -1, axis=0)
+    normal = numpy.cross(points, following).sum(axis=0)
+    axis = int(numpy.argmax(numpy.abs(normal)))
+    if normal[axis] == 0:
+        return None
+    orientation = 1.0 if normal[axis] > 0 else -1.0
+    coordinates = points[:, [(axis + 1) % 3, (axis + 2) % 3]].tolist()
+
+    def area(a, b, c):
+        (ax, ay), (bx, by), (cx, cy) = \
+            coordinates[a], coordinates[b], coordinates[c]
+        return ((bx - ax) * (cy - ay) - (by - ay) * (cx - ax)) * orientation
+
+    remaining = list(range(len(points)))
+    triangles = []
+    while len(remaining) > 3:
+        count = len(remaining)
+        for position in range(count):
+            a = remaining[position - 1]
+            b = remaining[position]
+            c = remaining[(position + 1) % count]
+            if area(a, b, c) <= 0:
+                continue
+            if any(area(a, b, other) >= 0 and area(b, c, other) >= 0
+                   and area(c, a, other) >= 0
+                   for other in remaining
+                   if other not in (a, b, c)
+                   and coordinates[other] not in (coordinates[a],
+                                                  coordinates[b],
+                                                  coordinates[c])):
+                continue
+            triangles.append((a, b, c))
+            del remaining[position]
+            break
+        else:
+            return None
+    triangles.append(tuple(remaining))
+
+    return numpy.array(triangles, dtype=numpy.int64)
+
+
+class _ObjectBuilder(object):
+    def __init__(self, name):
+        self.name = name
+        self.polygons = []
+        self.polygon_normals = []
+        self.polygon_sizes = []
+        self.runs = []
+        self.lines = []
+
+    def add_face(self, material_name, corners):
+        count = len(self.polygon_sizes)
+        if self.runs and self.runs[-1][0] == material_name:
+            self.runs[-1][2] = count + 1
+        else:
+            self.runs.append([material_name, count, count + 1])
+
+        self.polygons.extend(corner[0] for corner in corners)
+        self.polygon_normals.extend(corner[1] for corner in corners)
+        self.polygon_sizes.append(len(corners))
+
+    def add_line(self, corners):
+        self.lines.append([corner[0] for corner in corners])
+
+    def build(self):
+        result = GeometryObject(self.name)
+        result.polygons = numpy.array(self.polygons, dtype=numpy.int32)
+        result.polygon_normals = numpy.array(self.polygon_normals,
+                                             dtype=numpy.int32)
+        result.polygon_sizes = numpy.array(self.polygon_sizes,
+                                           dtype=numpy.int32)
+        result.polygon_runs = [tuple(run) for run in self.runs]
+        result.lines = numpy.array(self.lines,
+                                   dtype=numpy.int32).reshape(-1, 2)
+        return result
+
+
+def _parse_obj_lines(lines):
+    vertexes = []
+    normals = []
+    builders = {}
+    mtl_filenames = []
+
+    current_material_name = None
+    current_object_name = None
+
+    def get_builder():
+        if current_object_name not in builders:
+            builders[current_object_name] = \
+                _ObjectBuilder(current_object_name)
+        return builders[current_object_name]
+
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        parts = line.split(' ')
+        command = parts[0]
+        args = parts[1:]
+
+        if command == 'o':
+            current_object_name = args[0]
+
+        elif command == 'mtllib':
+            mtl_filenames.append(args[0])
+
+        elif command == 'usemtl':
+            current_material_name = args[0]
+
+        elif command == 'v':
+            vertexes.append(
+                (float(args[0]), float(args[1]), float(args[2])))
+
+        elif command == 'vn':
+            normals.append(
+                (float(args[0]), float(args[1]), float(args[2])))
+
+        elif command == 'l':
+            if len(args) == 2:
+                get_builder().add_line(list(map(parse_face_vertex, args)))
             else:
-                material_index = None
-            if m.group(3):
-                normal_index = int(m.group(3)) - 1
+                raise ValueError('Invalid number of parameters.')
+
+        elif command == 'f':
+            if len(args) >= 3:
+                get_builder().add_face(current_material_name,
+                                       list(map(parse_face_vertex, args)))
             else:
-                normal_index = None
+                raise ValueError('Invalid number of parameters.')
 
-            self._vertex_indexes.append(vertex_index)
-            self._material_indexes.append(material_index)
-            self._normal_indexes.append(normal_index)
+    objects = {}
+    for object_name, builder in builders.items():
+        objects[object_name] = builder.build()
 
-    def set_material(self, opacity=1.0):
-        diffuse_color = [0.9, 0.7, 0.4]
-        if self.material_name:
-            material = self._geometry._materials[self.material_name]
-            if 'Kd' in material:
-                diffuse_color = list(material['Kd'])
+    return (numpy.array(vertexes, dtype=numpy.float32).reshape(-1, 3),
+            numpy.array(normals, dtype=numpy.float32).reshape(-1, 3),
+            objects, mtl_filenames)
 
-        if len(diffuse_color) == 3:
-            diffuse_color.append(opacity)
-        else:
-            diffuse_color[3] *= opacity
 
-        glColor(*diffuse_color)
+class _UnsupportedLayout(Exception):
+    pass
 
-    def get_vertexes(self):
-        raise NotImplementedError()
 
-    def fill(self, opacity=1.0):
-        raise NotImplementedError()
+_LINE_IGNORED = 0
+_LINE_VERTEX = 1
+_LINE_NORMAL = 2
+_LINE_FACE = 3
+_LINE_LINE = 4
+_LINE_KEYWORD = 5
 
-    def draw_wireframe(self, opacity=1.0):
-        raise NotImplementedError()
 
+def _parse_numbers(text, dtype, count):
+    try:
+        values = numpy.fromstring(text, dtype=dtype, sep=' ')
+    except ValueError:
+        raise _UnsupportedLayout()
+    if len(values) != count:
+        raise _UnsupportedLayout()
+    return values
 
-class Triangle(AbstractPrimitive):
-    def get_vertexes(self):
-        return [self._geometry._vertexes[index]
-                for index in self._vertex_indexes]
 
-    def fill(self, opacity=1.0):
-        self.set_material(opacity=opacity)
-        glBegin(GL_TRIANGLES)
-        for point_index, material_index, normal_index in zip(
-                self._vertex_indexes, self._material_indexes,
-                self._normal_indexes):
-            if material_index:
-                pass # @TODO
-            if normal_index:
-                glNormal(*self._geometry._normals[normal_index])
-            glVertex(*self._geometry._vertexes[point_index])
-        glEnd()
+class _ObjScan(object):
+    # Classifies every line of an OBJ file by its command with array
+    # operations over the raw bytes, so that each block of "v", "vn" and
+    # "f"/"l" lines can be handed to a single numpy.fromstring call.
+    def __init__(self, data):
+        self.data = data
+        buffer = numpy.frombuffer(data + b'\n\n\n', dtype=numpy.uint8)
+        is_newline = buffer == ord('\n')
+        is_space = (is_newline | (buffer == ord(' '))
+                    | (buffer == ord('\t')) | (buffer == ord('\r')))
 
-    def draw_wireframe(self, opacity=1.0):
-        glBegin(GL_LINE_LOOP)
-        for index in self._vertex_indexes:
-            glVertex(*self._geometry._vertexes[index])
-        glEnd()
+        self.newlines = numpy.flatnonzero(is_newline)
+        line_count = len(self.newlines)
+        self.line_starts = numpy.concatenate(([0], self.newlines[:-1] + 1))
+        line_ids = numpy.cumsum(is_newline) - is_newline
 
+        is_token_start = ~is_space & numpy.concatenate(([True],
+                                                        is_space[:-1]))
+        token_starts = numpy.flatnonzero(is_token_start)
+        token_lines = line_ids[token_starts]
+        self.token_counts = numpy.bincount(token_lines, minlength=line_count)
+        command_lines, first_tokens = numpy.unique(token_lines,
+                                                   return_index=True)
+        command_starts = token_starts[first_tokens]
 
-class Quadrangle(AbstractPrimitive):
-    def get_vertexes(self):
-        return [self._geometry._vertexes[index]
-                for index in self._vertex_indexes]
-
-    def fill(self, opacity=1.0):
-        self.set_material(opacity=opacity)
-        glBegin(GL_QUADS)
-        for point_index, material_index, normal_index in zip(
-                self._vertex_indexes, self._material_indexes,
-                self._normal_indexes):
-            if material_index:
-                pass # @TODO
-            if normal_index:
-                glNormal(*self._geometry._normals[normal_index])
-            glVertex(*self._geometry._vertexes[point_index])
-        glEnd()
+        # Slashes and double slashes of every token, to check that all face
+        # corners have the same v, v/t, v//n or v/t/n form.
+        token_ids = numpy.cumsum(is_token_start) - 1
+        is_slash = buffer == ord('/')
+        is_double_slash = is_slash & numpy.concatenate((is_slash[1:],
+                                                        [False]))
+        self.token_lines = token_lines
+        self.token_slash_counts = numpy.bincount(
+            token_ids[is_slash], minlength=len(token_starts))
+        self.token_double_slash_counts = numpy.bincount(
+            token_ids[is_double_slash], minlength=len(token_starts))
+        self.is_command_token = numpy.zeros(len(token_starts), dtype=bool)
+        self.is_command_token[first_tokens] = True
 
-    def draw_wireframe(self, opacity=1.0):
-        glBegin(GL_LINE_LOOP)
-        for index in self._vertex_indexes:
-            glVertex(*self._geometry._vertexes[index])
-        glEnd()
+        c0 = buffer[command_starts]
+        c1 = buffer[command_starts + 1]
+        c1_space = is_space[command_starts + 1]
+        c2_space = is_space[command_starts + 2]
 
+        kinds = numpy.full(line_count, _LINE_IGNORED, dtype=numpy.int8)
+        kinds[command_lines[(c0 == ord('v')) & c1_space]] = _LINE_VERTEX
+        kinds[command_lines[(c0 == ord('v')) & (c1 == ord('n'))
+                            & c2_space]] = _LINE_NORMAL
+        kinds[command_lines[(c0 == ord('f')) & c1_space]] = _LINE_FACE
+        kinds[command_lines[(c0 == ord('l')) & c1_space]] = _LINE_LINE
+        kinds[command_lines[(c0 == ord('o')) | (c0 == ord('u'))
+                            | (c0 == ord('m'))]] = _LINE_KEYWORD
+        self.kinds = kinds
 
-class Line(AbstractPrimitive):
-    def get_vertexes(self):
-        return [self._geometry._vertexes[index]
-                for index in self._vertex_indexes]
+        # Blank out the command names so that each block is a plain list of
+        # numbers, and turn "v/t/n" separators into spaces.
+        work = buffer.copy()
+        work[command_starts] = ord(' ')
+        work[command_starts[kinds[command_lines] == _LINE_NORMAL]
+             + 1] = ord(' ')
+        work[work == ord('/')] = ord(' ')
 
-    def fill(self, opacity=1.0):
-        pass
+        self.buffer = buffer
+        self.work = work
+        self.byte_kinds = kinds[line_ids]
 
-    def draw_wireframe(self, opacity=1.0):
-        glBegin(GL_LINES)
-        for point_index, material_index, normal_index in zip(
-                self._vertex_indexes, self._material_indexes,
-                self._normal_indexes):
-            if material_index:
-                pass # @TODO
-            if normal_index:
-                glNormal(*self._geometry._normals[normal_index])
-            glVertex(*self._geometry._vertexes[point_index])
-        glEnd()
+    def get_lines(self, kind):
+        return numpy.flatnonzero(self.kinds == kind)
+
+    def get_block(self, *kinds, **kwargs):
+        source = self.buffer if kwargs.get('raw') else self.work
+        mask = self.byte_kinds == kinds[0]
+        for kind in kinds[1:]:
+            mask |= self.byte_kinds == kind
+        return source[mask]
+
+    def parse_vectors(self, kind):
+        # Lines with other than three components are left to the line
+        # parser, even when their total would add up.
+        lines = self.get_lines(kind)
+        if numpy.any(self.token_counts[lines] != 4):
+            raise _UnsupportedLayout()
+        count = len(lines)
+        return _parse_numbers(self.get_block(kind).tobytes(), numpy.float64,
+                              count * 3).reshape(-1, 3)
+
+    def get_keywords(self):
+        # (line index, command, args) of every "o", "usemtl" and "mtllib".
+        keywords = []
+        for line_index in self.get_lines(_LINE_KEYWORD).tolist():
+            parts = self.data[self.line_starts[line_index]:
+                              self.newlines[line_index]].split()
+            keywords.append((line_index, parts[0].decode('utf-8'),
+                             [part.decode('utf-8') for part in parts[1:]]))
+        return keywords
+
+
+def _parse_obj_bulk(data):
+    # Anything the fast path does not understand raises _UnsupportedLayout
+    # so the line parser can take over.
+    scan = _ObjScan(data)
+    kinds = scan.kinds
+    token_counts = scan.token_counts
+
+    vertexes = scan.parse_vectors(_LINE_VERTEX)
+    normals = scan.parse_vectors(_LINE_NORMAL)
+
+    # Walk the few keyword lines in order to know which object and material
+    # every face belongs to.
+    object_names = []
+    material_names = []
+    mtl_filenames = []
+    object_changes = []
+    material_changes = []
+    for line_index, command, args in scan.get_keywords():
+        if command == 'o':
+            object_names.append(args[0])
+            object_changes.append(line_index)
+        elif command == 'usemtl':
+            material_names.append(args[0])
+            material_changes.append(line_index)
+        elif command == 'mtllib':
+            mtl_filenames.append(args[0])
+
+    primitive_lines = numpy.flatnonzero((kinds == _LINE_FACE)
+                                        | (kinds == _LINE_LINE))
+    corner_counts = token_counts[primitive_lines] - 1
+    is_line = kinds[primitive_lines] == _LINE_LINE
+    if numpy.any(is_line & (corner_counts != 2)) \
+            or numpy.any(~is_line & (corner_counts < 3)):
+        raise ValueError('Invalid number of parameters.')
+
+    corner_total = int(corner_counts.sum())
+    token_kinds = kinds[scan.token_lines]
+    is_corner = ((token_kinds == _LINE_FACE) | (token_kinds == _LINE_LINE)) \
+        & ~scan.is_command_token
+    slash_counts = scan.token_slash_counts[is_corner]
+    double_slash_counts = scan.token_double_slash_counts[is_corner]
+
+    # Every corner must have the form of the first one.
+    if not len(slash_counts):
+        layout = (0, 0)
+    elif numpy.any(slash_counts != slash_counts[0]) \
+            or numpy.any(double_slash_counts != double_slash_counts[0]):
+        raise _UnsupportedLayout()
+    else:
+        layout = (int(slash_counts[0]), int(double_slash_counts[0]))
+
+    if layout == (0, 0):
+        width, normal_column = 1, None
+    elif layout == (1, 0):
+        width, normal_column = 2, None
+    elif layout == (2, 1):
+        width, normal_column = 2, 1
+    elif layout == (2, 0):
+        width, normal_column = 3, 2
+    else:
+        raise _UnsupportedLayout()
+
+    corners = _parse_numbers(
+        scan.get_block(_LINE_FACE, _LINE_LINE).tobytes(), numpy.int64,
+        corner_total * width).reshape(-1, width) - 1
+    if len(corners) and corners.min() < 0:
+        raise _UnsupportedLayout()
+    corner_vertexes = corners[:, 0].astype(numpy.int32)
+    if normal_column is None:
+        corner_normals = numpy.full(len(corners), -1, dtype=numpy.int32)
+    else:
+        corner_normals = corners[:, normal_column].astype(numpy.int32)
+
+    object_ids = numpy.searchsorted(object_changes, primitive_lines) - 1
+    material_ids = numpy.searchsorted(material_changes, primitive_lines) - 1
+
+    def object_name_of(object_id):
+        return object_names[object_id] if object_id >= 0 else None
+
+    def material_name_of(material_id):
+        return material_names[material_id] if material_id >= 0 else None
+
+    # Objects are created in order of their first primitive, and objects
+    # sharing a name are merged, just like the line parser does.
+    object_order = []
+    primitives_by_name = {}
+    for object_id in object_ids[numpy.sort(numpy.unique(
+            object_ids, return_index=True)[1])].tolist():
+        name = object_name_of(object_id)
+        if name not in primitives_by_name:
+            object_order.append(name)
+            primitives_by_name[name] = []
+        primitives_by_name[name].append(object_id)
+
+    def gather(selection):
+        in_selection = numpy.repeat(selection, corner_counts)
+        return (corner_vertexes[in_selection], corner_normals[in_selection],
+                corner_counts[selection].astype(numpy.int32))
+
+    def material_runs(selection):
+        ids = material_ids[selection]
+        if not len(ids):
+            return []
+        starts = numpy.flatnonzero(numpy.concatenate(
+            ([True], ids[1:] != ids[:-1])))
+        stops = numpy.concatenate((starts[1:], [len(ids)]))
+        return [(material_name_of(ids[start]), start, stop)
+                for start, stop in zip(starts.tolist(), stops.tolist())]
+
+    objects = {}
+    for name in object_order:
+        in_object = numpy.isin(object_ids, primitives_by_name[name])
+        result = GeometryObject(name)
+
+        selection = in_object & ~is_line
+        result.polygons, result.polygon_normals, result.polygon_sizes = \
+            gather(selection)
+        result.polygon_runs = material_runs(selection)
+
+        result.lines = gather(in_object & is_line)[0].reshape(-1, 2)
+        objects[name] = result
+
+    return (vertexes.astype(numpy.float32), normals.astype(numpy.float32),
+            objects, mtl_filenames)
+
+
+def _parse_obj_data(data):
+    try:
+        return _parse_obj_bulk(data)
+    except _UnsupportedLayout:
+        return _parse_obj_lines(data.decode('utf-8').splitlines())
+
+
+class LazySource(object):
+    # Index of an OBJ file built by Geometry.index_obj. The file is split
+    # into segments at every "o" line; each segment is a (start, stop) byte
+    # range with the [start, stop) ranges of the vertexes and normals it
+    # defines, counted from the beginning of the file, and the material in
+    # use where it starts. The offsets place the file's vertexes and normals
+    # inside the arrays of the owning Geometry.
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.segments = []
+        self.vertex_offset = 0
+        self.normal_offset = 0
+        self.loaded_segments = set()
+
+    def rebased(self, vertex_offset, normal_offset):
+        result = LazySource(self.filepath)
+        result.segments = self.segments
+        result.vertex_offset = self.vertex_offset + vertex_offset
+        result.normal_offset = self.normal_offset + normal_offset
+        result.loaded_segments = set(self.loaded_segments)
+        return result
+
+    def read_segments(self, segment_indexes, with_materials=False):
+        chunks = []
+        with open(self.filepath, 'rb') as fh:
+            for segment_index in segment_indexes:
+                start, stop, _, _, material_name = \
+                    self.segments[segment_index]
+                if with_materials and material_name is not None:
+                    chunks.append(b'usemtl ' + material_name.encode('utf-8')
+                                  + b'\n')
+                fh.seek(start)
+                chunks.append(fh.read(stop - start) + b'\n')
+        return b''.join(chunks)
+
+    def store_vectors(self, geometry, segment_indexes, vertexes, normals):
+        # Copies the vertexes and normals parsed from the given segments,
+        # in order, into the arrays of the geometry.
+        vertex_start = 0
+        normal_start = 0
+        for segment_index in segment_indexes:
+            _, _, vertex_range, normal_range, _ = self.segments[segment_index]
+            vertex_stop = vertex_start + vertex_range[1] - vertex_range[0]
+            normal_stop = normal_start + normal_range[1] - normal_range[0]
+            if segment_index not in self.loaded_segments:
+                start = self.vertex_offset + vertex_range[0]
+                geometry._vertexes[start:start + vertex_stop - vertex_start] = \
+                    vertexes[vertex_start:vertex_stop]
+                start = self.normal_offset + normal_range[0]
+                geometry._normals[start:start + normal_stop - normal_start] = \
+                    normals[normal_start:normal_stop]
+                self.loaded_segments.add(segment_index)
+            vertex_start = vertex_stop
+            normal_start = normal_stop
+
+    def load_vectors(self, geometry, segment_indexes):
+        # Parses the vertexes and normals of the given segments into the
+        # arrays of the geometry, skipping faces.
+        segment_indexes = [segment_index for segment_index in segment_indexes
+                           if segment_index not in self.loaded_segments]
+        if not segment_indexes:
+            return
+
+        data = self.read_segments(segment_indexes)
+        try:
+            scan = _ObjScan(data)
+            vertexes = scan.parse_vectors(_LINE_VERTEX)
+            normals = scan.parse_vectors(_LINE_NORMAL)
+        except _UnsupportedLayout:
+            vertexes, normals = _parse_obj_lines(
+                data.decode('utf-8').splitlines())[:2]
+        self.store_vectors(geometry, segment_indexes, vertexes, normals)
+
+    def load_vectors_for(self, geometry, vertex_indexes, normal_indexes):
+        # Makes sure the given file-relative indexes are loaded, whichever
+        # segment defines them.
+        segment_indexes = set()
+        for indexes, column in ((vertex_indexes, 2), (normal_indexes, 3)):
+            indexes = indexes[indexes >= 0]
+            if not len(indexes):
+                continue
+            range_starts = [segment[column][0] for segment in self.segments]
+            segment_indexes.update(numpy.unique(numpy.searchsorted(
+                range_starts, indexes, side='right') - 1).tolist())
+        self.load_vectors(geometry, sorted(segment_indexes))
+
+
+class LazyObject(object):
+    # Placeholder for an indexed object whose faces have not been parsed.
+    def __init__(self, name, source, source_name=None, segment_indexes=None):
+        self.name = name
+        self.source = source
+        self.source_name = name if source_name is None else source_name
+        self.segment_indexes = segment_indexes or []
+        self.material_names = {}
+        self._bounds = None
+
+    def rebased(self, name, source, material_names):
+        result = LazyObject(name, source, self.source_name,
+                            self.segment_indexes)
+        result.material_names = dict(
+            (original_name, material_names.get(current_name, current_name))
+            for original_name, current_name in self.material_names.items())
+        for material_name, new_name in material_names.items():
+            result.material_names.setdefault(material_name, new_name)
+        result._bounds = self._bounds
+        return result
+
+    def get_bounds(self, geometry):
+        # Box of the vertexes defined in the object's own segments, which
+        # is what exporters such as Blender write. The exact box replaces
+        # it once the object is loaded.
+        if self._bounds is None:
+            self.source.load_vectors(geometry, self.segment_indexes)
+            vertexes = [
+                geometry._vertexes[self.source.vertex_offset + vertex_start:
+                                   self.source.vertex_offset + vertex_stop]
+                for vertex_start, vertex_stop in (
+                    self.source.segments[segment_index][2]
+                    for segment_index in self.segment_indexes)]
+            vertexes = numpy.concatenate(vertexes)
+            self._bounds = GeometryObject(self.name).bounds
+            if len(vertexes):
+                self._bounds = numpy.array([vertexes.min(axis=0),
+                                            vertexes.max(axis=0)],
+                                           dtype=numpy.float32)
+        return self._bounds
+
+    def load(self, geometry):
+        source = self.source
+        data = source.read_segments(self.segment_indexes, with_materials=True)
+        vertexes, normals, objects, _ = _parse_obj_data(data)
+        source.store_vectors(geometry, self.segment_indexes, vertexes,
+                             normals)
+
+        # Face indexes are relative to the whole file, so vectors defined in
+        # other segments may still have to be loaded.
+        object = objects[self.source_name]
+        source.load_vectors_for(
+            geometry,
+            numpy.concatenate((object.polygons, object.lines.ravel())),
+            object.polygon_normals)
+
+        object.triangulate(geometry._vertexes[source.vertex_offset:])
+        object = object.rebased(self.name, source.vertex_offset,
+                                source.normal_offset, self.material_names)
+        object.group_by_material()
+        object.update_bounds(geometry._vertexes)
+        return object
+
+
+class PackedObject(object):
+    # One GeometryObject laid out for array drawing. OBJ faces index
+    # positions and normals separately, so every distinct (vertex, normal)
+    # pair becomes one interleaved vertex. The index array holds the
+    # triangles and the unique wireframe edges, in this order.
+    def __init__(self, geometry, object):
+        face_vertexes = numpy.concatenate((
+            object.triangles.ravel(),
+            object.lines.ravel())).astype(numpy.int64)
+        face_normals = numpy.concatenate((
+            object.triangle_normals.ravel(),
+            numpy.full(object.lines.size, -1))).astype(numpy.int64)
+
+        keys = face_vertexes * (len(geometry._normals) + 1) + face_normals + 1
+        keys, first_corners, corner_indexes = numpy.unique(
+            keys, return_index=True, return_inverse=True)
+        corner_indexes = corner_indexes.ravel().astype(numpy.uint32)
+
+        vertex_indexes = face_vertexes[first_corners]
+        normal_indexes = face_normals[first_corners]
+        self.vertex_data = numpy.zeros((len(keys), 6), dtype=numpy.float32)
+        self.vertex_data[:, :3] = geometry._vertexes[vertex_indexes]
+        has_normal = normal_indexes >= 0
+        self.vertex_data[has_normal, 3:] = \
+            geometry._normals[normal_indexes[has_normal]]
+        self.has_normals = bool(numpy.any(has_normal))
+
+        triangles = corner_indexes[:object.triangles.size]
+
+        # Edges only need positions, so any packed vertex of an OBJ vertex
+        # will do.
+        packed_vertexes = numpy.zeros(vertex_indexes.max(initial=-1) + 1,
+                                      dtype=numpy.uint32)
+        packed_vertexes[vertex_indexes] = numpy.arange(len(vertex_indexes))
+        edges = packed_vertexes[object.edges.ravel()]
+
+        self.index_data = numpy.concatenate(
+            (triangles, edges)).astype(numpy.uint32)
+        self.triangle_offset = 0
+        self.edge_offset = len(triangles)
+        self.edge_count = len(edges)
+
+    @property
+    def vertex_count(self):
+        return len(self.vertex_data)
+
+    def transform(self, matrices):
+        # Returns the vertex data of every instance, one after the other.
+        matrices = numpy.asarray(matrices, dtype=numpy.float32)
+        positions = (numpy.einsum('nij,vj->nvi', matrices[:, :3, :3],
+                                  self.vertex_data[:, :3])
+                     + matrices[:, numpy.newaxis, :3, 3])
+        normals = numpy.einsum('nij,vj->nvi', matrices[:, :3, :3],
+                               self.vertex_data[:, 3:])
+        return numpy.concatenate((positions, normals), axis=2).reshape(-1, 6)
+
+    def repeat_indexes(self, offset, count, instance_count):
+        indexes = self.index_data[offset:offset + count]
+        return (indexes[numpy.newaxis, :]
+                + (numpy.arange(instance_count, dtype=numpy.uint32)
+                   * self.vertex_count)[:, numpy.newaxis]).ravel()
+
+
+class ObjectBuffers(object):
+    # Vertex and index buffer objects holding one PackedObject.
+    def __init__(self, packed):
+        self.packed = packed
+        self.has_normals = packed.has_normals
+
+        self.vertex_buffer, self.index_buffer = glGenBuffers(2)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vertex_buffer)
+        glBufferData(GL_ARRAY_BUFFER, packed.vertex_data.nbytes,
+                     packed.vertex_data, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, packed.index_data.nbytes,
+                     packed.index_data, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    @property
+    def triangle_offset(self):
+        return self.packed.triangle_offset
+
+    @property
+    def edge_offset(self):
+        return self.packed.edge_offset
+
+    @property
+    def edge_count(self):
+        return self.packed.edge_count
+
+    def delete(self):
+        glDeleteBuffers(2, [self.vertex_buffer, self.index_buffer])
+
+    def bind(self, with_normals=True):
+        glBindBuffer(GL_ARRAY_BUFFER, self.vertex_buffer)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 24, ctypes.c_void_p(0))
+        if with_normals and self.has_normals:
+            glEnableClientState(GL_NORMAL_ARRAY)
+            glNormalPointer(GL_FLOAT, 24, ctypes.c_void_p(12))
+
+    def unbind(self):
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def draw_elements(self, mode, offset, count):
+        glDrawElements(mode, count, GL_UNSIGNED_INT,
+                       ctypes.c_void_p(4 * offset))
+
+    def draw_elements_instanced(self, mode, offset, count, instance_count):
+        glDrawElementsInstanced(mode, count, GL_UNSIGNED_INT,
+                                ctypes.c_void_p(4 * offset), instance_count)
+
+
+INSTANCING_VERTEX_SHADER = """
+#version 120
+attribute mat4 instance_matrix;
+
+void main() {
+    gl_FrontColor = gl_Color;
+    gl_Position = gl_ModelViewProjectionMatrix
+        * (instance_matrix * gl_Vertex);
+}
+"""
+
+
+class InstancingProgram(object):
+    # Vertex shader taking a per-instance model matrix from a buffer with
+    # attribute divisor 1. Fragments still go through the fixed pipeline.
+    MATRIX_LOCATION = 1
+
+    def __init__(self):
+        shader = glCreateShader(GL_VERTEX_SHADER)
+        glShaderSource(shader, INSTANCING_VERTEX_SHADER)
+        glCompileShader(shader)
+        if not glGetShaderiv(shader, GL_COMPILE_STATUS):
+            raise RuntimeError(glGetShaderInfoLog(shader))
+
+        self.program = glCreateProgram()
+        glAttachShader(self.program, shader)
+        glBindAttribLocation(self.program, self.MATRIX_LOCATION,
+                             'instance_matrix')
+        glLinkProgram(self.program)
+        glDeleteShader(shader)
+        if not glGetProgramiv(self.program, GL_LINK_STATUS):
+            raise RuntimeError(glGetProgramInfoLog(self.program))
+
+        self.matrix_location = self.MATRIX_LOCATION
+        self.matrix_buffer = glGenBuffers(1)
+
+    @staticmethod
+    def is_supported():
+        return all(map(bool, (glCreateShader, glDrawElementsInstanced,
+                              glVertexAttribDivisor, glGenBuffers)))
+
+    def begin(self, matrices):
+        # GLSL matrices are column-major, so each row of the transposed
+        # matrices feeds one column attribute.
+        columns = numpy.ascontiguousarray(
+            numpy.asarray(matrices, dtype=numpy.float32).transpose(0, 2, 1))
+
+        glUseProgram(self.program)
+        glBindBuffer(GL_ARRAY_BUFFER, self.matrix_buffer)
+        glBufferData(GL_ARRAY_BUFFER, columns.nbytes, columns,
+                     GL_STREAM_DRAW)
+        for column in range(4):
+            location = self.matrix_location + column
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(location, 4, GL_FLOAT, GL_FALSE, 64,
+                                  ctypes.c_void_p(16 * column))
+            glVertexAttribDivisor(location, 1)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def end(self):
+        for column in range(4):
+            location = self.matrix_location + column
+            glVertexAttribDivisor(location, 0)
+            glDisableVertexAttribArray(location)
+        glUseProgram(0)
 
 
 class Geometry(object):
-    _vertexes = []
-    _normals = []
-    _objects = {}
+    # Objects are uploaded to buffer objects on first use. Immediate mode is
+    # used when this is disabled or the GL lacks buffer objects.
+    use_buffer_objects = True
+
+    # Instanced draws use a vertex shader when the GL supports it, and
+    # otherwise transform all copies on the CPU into one vertex array.
+    use_instancing = True
+
+    # Each fill and wireframe is compiled into display lists the first time
+    # it is drawn. Fills get one list per material run holding only the
+    # geometry, and the color is set before calling each, so fades and
+    # color overrides reuse the same lists.
+    use_display_lists = True
+
+    def __init__(self):
+        self._vertexes = numpy.zeros((0, 3), dtype=numpy.float32)
+        self._normals = numpy.zeros((0, 3), dtype=numpy.float32)
+        self._materials = {}
+        self._material_colors = {}
+        self._objects = {}
+        self._mtl_filepaths = []
+        self._buffers = {}
+        self._packed = {}
+        self._display_lists = {}
+        self._instancing_program = None
+
+        # Optional profiling.FrameProfiler told about every draw.
+        self.profiler = None
 
     def read_mtl(self, filepath):
         fh = open(filepath)
@@ -154,109 +961,427 @@ class Geometry(object):
                 material_data['d'] = 1.0 - float(args[0])
 
     def read_obj(self, filepath):
-        self._vertexes = []
-        self._normals = []
+        self.invalidate_display_lists()
+        self.release_buffers()
         self._materials = {}
         self._objects = {}
+        self._mtl_filepaths = []
 
-        fh = open(filepath)
-        current_material_name = None
-        current_object_name = None
+        with open(filepath, 'rb') as fh:
+            data = fh.read()
 
-        def add_primitive(primitive):
-            self._objects.setdefault(current_object_name, []).append(primitive)
+        try:
+            vertexes, normals, objects, mtl_filenames = _parse_obj_bulk(data)
+        except _UnsupportedLayout:
+            vertexes, normals, objects, mtl_filenames = _parse_obj_lines(
+                data.decode('utf-8').splitlines())
 
-        for line in fh:
-            line = line.strip()
-            if not line or line.startswith('#'):
-                continue
+        for mtl_filename in mtl_filenames:
+            mtl_filepath = os.path.join(os.path.dirname(filepath),
+                                        mtl_filename)
+            self._mtl_filepaths.append(mtl_filepath)
+            self.read_mtl(mtl_filepath)
 
-            parts = line.split(' ')
-            command = parts[0]
-            args = parts[1:]
+        self._vertexes = vertexes
+        self._normals = normals
+        self._objects = objects
 
-            if command == 'o':
-                current_object_name = args[0]
+        for object in self._objects.values():
+            object.triangulate(self._vertexes)
+            object.group_by_material()
+            object.update_bounds(self._vertexes)
+        self.update_material_colors()
 
-            elif command == 'mtllib':
-                self.read_mtl(os.path.join(os.path.dirname(filepath), args[0]))
+    def index_obj(self, filepath):
+        # Lazy counterpart of read_obj: only indexes where every object is
+        # in the file. Faces are parsed the first time an object is drawn,
+        # and vertexes when needed for drawing or for bounds.
+        self.invalidate_display_lists()
+        self.release_buffers()
+        self._materials = {}
+        self._objects = {}
+        self._mtl_filepaths = []
+
+        with open(filepath, 'rb') as fh:
+            data = fh.read()
+        scan = _ObjScan(data)
 
+        object_lines = [0]
+        object_names = [None]
+        material_lines = []
+        material_names = []
+        for line_index, command, args in scan.get_keywords():
+            if command == 'o':
+                object_lines.append(line_index)
+                object_names.append(args[0])
             elif command == 'usemtl':
-                current_material_name = args[0]
+                material_lines.append(line_index)
+                material_names.append(args[0])
+            elif command == 'mtllib':
+                mtl_filepath = os.path.join(os.path.dirname(filepath),
+                                            args[0])
+                self._mtl_filepaths.append(mtl_filepath)
+                self.read_mtl(mtl_filepath)
 
-            elif command == 'v':
-                self._vertexes.append(
-                    (float(args[0]), float(args[1]), float(args[2])))
+        line_count = len(scan.newlines)
+        vertex_lines = scan.get_lines(_LINE_VERTEX)
+        normal_lines = scan.get_lines(_LINE_NORMAL)
+        primitive_lines = numpy.flatnonzero((scan.kinds == _LINE_FACE)
+                                            | (scan.kinds == _LINE_LINE))
 
-            elif command == 'vn':
-                self._normals.append(
-                    (float(args[0]), float(args[1]), float(args[2])))
+        source = LazySource(filepath)
+        for object_name, first_line, next_line in zip(
+                object_names, object_lines, object_lines[1:] + [line_count]):
+            material_index = numpy.searchsorted(material_lines,
+                                                first_line) - 1
+            source.segments.append((
+                min(int(scan.line_starts[first_line]), len(data)),
+                min(int(scan.line_starts[next_line])
+                    if next_line < line_count else len(data), len(data)),
+                tuple(numpy.searchsorted(
+                    vertex_lines, (first_line, next_line)).tolist()),
+                tuple(numpy.searchsorted(
+                    normal_lines, (first_line, next_line)).tolist()),
+                material_names[material_index]
+                if material_index >= 0 else None))
 
-            elif command == 'l':
-                if len(args) == 2:
-                    add_primitive(Line(
-                        self, material_name=current_material_name, *args))
-                else:
-                    raise ValueError('Invalid number of parameters.')
-
-            elif command == 'f':
-                if len(args) == 3:
-                    add_primitive(Triangle(
-                        self, material_name=current_material_name, *args))
-                elif len(args) == 4:
-                    add_primitive(Quadrangle(
-                        self, material_name=current_material_name, *args))
+            primitive_range = numpy.searchsorted(primitive_lines,
+                                                 (first_line, next_line))
+            if primitive_range[1] > primitive_range[0]:
+                segment_index = len(source.segments) - 1
+                if object_name in self._objects:
+                    self._objects[object_name].segment_indexes.append(
+                        segment_index)
                 else:
-                    raise ValueError('Invalid number of parameters.')
+                    self._objects[object_name] = LazyObject(
+                        object_name, source, segment_indexes=[segment_index])
+
+        self._vertexes = numpy.zeros((len(vertex_lines), 3),
+                                     dtype=numpy.float32)
+        self._normals = numpy.zeros((len(normal_lines), 3),
+                                    dtype=numpy.float32)
+        self.update_material_colors()
+
+    def _get_object(self, object_name):
+        object = self._objects[object_name]
+        if isinstance(object, LazyObject):
+            object = object.load(self)
+            self._objects[object_name] = object
+        return object
+
+    def load_all(self):
+        # Loads every lazy object now, e.g. before forking workers that
+        # should share them.
+        for object_name in self.object_names:
+            self._get_object(object_name)
+
+    def merge(self, other, namespace):
+        # Appends the objects of another geometry. Objects and differing
+        # materials whose names are already taken are renamed to
+        # "namespace/name". Returns the (old, new) names of renamed objects.
+        vertex_offset = len(self._vertexes)
+        normal_offset = len(self._normals)
+        self._vertexes = numpy.concatenate((self._vertexes, other._vertexes))
+        self._normals = numpy.concatenate((self._normals, other._normals))
+        self._mtl_filepaths.extend(other._mtl_filepaths)
+
+        material_names = {}
+        for material_name, material in other._materials.items():
+            if material_name in self._materials \
+                    and self._materials[material_name] != material:
+                material_names[material_name] = '%s/%s' % (namespace,
+                                                            material_name)
+            else:
+                material_names[material_name] = material_name
+            self._materials[material_names[material_name]] = material
+        self.update_material_colors()
+
+        renamed = []
+        sources = {}
+        for object in other._objects.values():
+            object_name = object.name
+            if object_name in self._objects:
+                object_name = '%s/%s' % (namespace, object.name)
+                renamed.append((object.name, object_name))
+
+            if isinstance(object, LazyObject):
+                if object.source not in sources:
+                    sources[object.source] = object.source.rebased(
+                        vertex_offset, normal_offset)
+                self._objects[object_name] = object.rebased(
+                    object_name, sources[object.source], material_names)
+            else:
+                self._objects[object_name] = object.rebased(
+                    object_name, vertex_offset, normal_offset,
+                    material_names)
+
+        return renamed
 
     @property
     def object_names(self):
         return list(self._objects.keys())
 
-    def fill(self, object_name, *args, **kwargs):
-        for primitive in self._objects[object_name]:
-            primitive.fill(*args, **kwargs)
+    def update_material_colors(self):
+        self._material_colors = {}
+        for material_name, material in self._materials.items():
+            diffuse_color = list(material.get('Kd', DEFAULT_DIFFUSE_COLOR))
+            if len(diffuse_color) == 3:
+                diffuse_color.append(1.0)
+            self._material_colors[material_name] = tuple(diffuse_color)
+
+    def get_color(self, material_name, opacity=1.0, color=None):
+        # color, when given, replaces the material's color.
+        if color is None:
+            color = self._material_colors.get(
+                material_name, DEFAULT_DIFFUSE_COLOR + (1.0,))
+        red, green, blue, alpha = color
+        return red, green, blue, alpha * opacity
+
+    def _emit_faces(self, mode, faces, face_normals):
+        vertexes = self._vertexes
+        normals = self._normals
+
+        glBegin(mode)
+        for face, face_normal in zip(faces.tolist(), face_normals.tolist()):
+            for point_index, normal_index in zip(face, face_normal):
+                if normal_index >= 0:
+                    glNormal(*normals[normal_index])
+                glVertex(*vertexes[point_index])
+        glEnd()
+
+    def release_buffers(self):
+        for buffers in self._buffers.values():
+            if buffers is not None:
+                buffers.delete()
+        self._buffers = {}
+        self._packed = {}
+
+    def _get_packed(self, object_name):
+        if object_name not in self._packed:
+            self._packed[object_name] = PackedObject(
+                self, self._get_object(object_name))
+        return self._packed[object_name]
+
+    def _get_buffers(self, object_name):
+        if object_name not in self._buffers:
+            if self.use_buffer_objects and bool(glGenBuffers):
+                self._buffers[object_name] = ObjectBuffers(
+                    self._get_packed(object_name))
+            else:
+                self._buffers[object_name] = None
+        return self._buffers[object_name]
+
+    def _get_instancing_program(self):
+        if self._instancing_program is None:
+            self._instancing_program = False
+            if self.use_instancing and self.use_buffer_objects \
+                    and InstancingProgram.is_supported():
+                try:
+                    self._instancing_program = InstancingProgram()
+                except (RuntimeError, GLError):
+                    pass
+        return self._instancing_program
+
+    def invalidate_display_lists(self):
+        for first_list, count in self._display_lists.values():
+            glDeleteLists(first_list, count)
+        self._display_lists = {}
+
+    def _get_display_lists(self, key, count, compile_function):
+        # Compiles count consecutive display lists the first time, list
+        # index holding what compile_function(index) draws, and returns the
+        # first of them.
+        if key not in self._display_lists:
+            first_list = glGenLists(count)
+            for index in range(count):
+                glNewList(first_list + index, GL_COMPILE)
+                compile_function(index)
+                glEndList()
+            self._display_lists[key] = (first_list, count)
+        return self._display_lists[key][0]
+
+    def _count_draw(self, draw_calls, vertexes):
+        if self.profiler is not None:
+            self.profiler.count_draw(draw_calls, vertexes)
+
+    def fill(self, object_name, opacity=1.0, color=None):
+        # color is an RGBA tuple used for every material instead of their
+        # own colors.
+        object = self._get_object(object_name)
+        runs = object.triangle_runs
+
+        if not (self.use_display_lists and bool(glGenLists)):
+            self._count_draw(len(runs), object.triangles.size)
+            self._fill(object_name, opacity, color)
+            return
+
+        if not runs:
+            return
+        first_list = self._get_display_lists(
+            (object_name, 'fill'), len(runs),
+            lambda index: self._fill_run(object_name, *runs[index][1:]))
+        self._count_draw(len(runs), object.triangles.size)
+        for index, (material_name, start, stop) in enumerate(runs):
+            glColor(*self.get_color(material_name, opacity, color))
+            glCallList(first_list + index)
 
     def draw_wireframe(self, object_name):
-        for primitive in self._objects[object_name]:
-            primitive.draw_wireframe()
+        self._count_draw(1, self._get_object(object_name).edges.size)
 
-    def get_vertexes(self, object_name):
-        vertexes = set()
-        for primitive in self._objects[object_name]:
-            vertexes.update(primitive.get_vertexes())
-        return list(vertexes)
+        if not (self.use_display_lists and bool(glGenLists)):
+            self._draw_wireframe(object_name)
+            return
 
-    def get_bounds(self, objects=None):
-        if objects is None:
-            objects = self.object_names
+        glCallList(self._get_display_lists(
+            (object_name, 'wireframe'), 1,
+            lambda index: self._draw_wireframe(object_name)))
 
-        vertexes = set()
+    def _fill(self, object_name, opacity, color=None):
+        object = self._get_object(object_name)
+        buffers = self._get_buffers(object_name)
 
-        bounds_min = (0.0, 0.0, 0.0)
-        bounds_max = (0.0, 0.0, 0.0)
+        if buffers is None:
+            self._fill_immediate(object, opacity, color)
+            return
 
-        for object_name in objects:
-            object = self._objects[object_name]
-            for primitive in object:
-                vertexes.update(primitive.get_vertexes())
+        buffers.bind()
+        for material_name, start, stop in object.triangle_runs:
+            glColor(*self.get_color(material_name, opacity, color))
+            buffers.draw_elements(GL_TRIANGLES,
+                                  buffers.triangle_offset + start * 3,
+                                  (stop - start) * 3)
+        buffers.unbind()
 
-        for vertex in vertexes:
-            if bounds_min is None:
-                bounds_min = vertex
-                bounds_max = vertex
-            else:
-                bounds_min = list(map(min, zip(bounds_min, vertex)))
-                bounds_max = list(map(max, zip(bounds_max, vertex)))
+    def _fill_run(self, object_name, start, stop):
+        # Triangles start to stop of the object, in the current color.
+        object = self._get_object(object_name)
+        buffers = self._get_buffers(object_name)
+
+        if buffers is None:
+            self._emit_faces(GL_TRIANGLES, object.triangles[start:stop],
+                             object.triangle_normals[start:stop])
+            return
+
+        buffers.bind()
+        buffers.draw_elements(GL_TRIANGLES,
+                              buffers.triangle_offset + start * 3,
+                              (stop - start) * 3)
+        buffers.unbind()
+
+    def _draw_wireframe(self, object_name):
+        object = self._get_object(object_name)
+        buffers = self._get_buffers(object_name)
+
+        if buffers is None:
+            self._draw_wireframe_immediate(object)
+            return
+
+        buffers.bind(with_normals=False)
+        buffers.draw_elements(GL_LINES, buffers.edge_offset,
+                              buffers.edge_count)
+        buffers.unbind()
+
+    def _draw_instances(self, object_name, matrices, draws):
+        # draws is a list of (mode, offset, count, color) index ranges of
+        # the packed object, color being None to keep the current one.
+        matrices = numpy.asarray(matrices, dtype=numpy.float32)
+        if not len(matrices):
+            return
+        self._count_draw(len(draws), len(matrices) * sum(
+            count for mode, offset, count, color in draws))
+
+        program = self._get_instancing_program()
+        if program:
+            buffers = self._get_buffers(object_name)
+            buffers.bind()
+            program.begin(matrices)
+            for mode, offset, count, color in draws:
+                if color is not None:
+                    glColor(*color)
+                buffers.draw_elements_instanced(mode, offset, count,
+                                                len(matrices))
+            program.end()
+            buffers.unbind()
+            return
+
+        packed = self._get_packed(object_name)
+        vertex_data = packed.transform(matrices)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 24, vertex_data)
+        if packed.has_normals:
+            glEnableClientState(GL_NORMAL_ARRAY)
+            glNormalPointer(GL_FLOAT, 24,
+                            ctypes.c_void_p(vertex_data.ctypes.data + 12))
+        for mode, offset, count, color in draws:
+            if color is not None:
+                glColor(*color)
+            indexes = packed.repeat_indexes(offset, count, len(matrices))
+            glDrawElements(mode, len(indexes), GL_UNSIGNED_INT, indexes)
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+
+    def fill_instances(self, object_name, matrices, opacity=1.0,
+                       color=None):
+        object = self._get_object(object_name)
+        packed = self._get_packed(object_name)
+
+        draws = [(GL_TRIANGLES, packed.triangle_offset + start * 3,
+                  (stop - start) * 3,
+                  self.get_color(material_name, opacity, color))
+                 for material_name, start, stop in object.triangle_runs]
+
+        self._draw_instances(object_name, matrices, draws)
+
+    def draw_wireframe_instances(self, object_name, matrices):
+        packed = self._get_packed(object_name)
+        self._draw_instances(
+            object_name, matrices,
+            [(GL_LINES, packed.edge_offset, packed.edge_count, None)])
+
+    def _fill_immediate(self, object, opacity, color=None):
+        for material_name, start, stop in object.triangle_runs:
+            glColor(*self.get_color(material_name, opacity, color))
+            self._emit_faces(GL_TRIANGLES, object.triangles[start:stop],
+                             object.triangle_normals[start:stop])
+
+    def _draw_wireframe_immediate(self, object):
+        vertexes = self._vertexes
+
+        glBegin(GL_LINES)
+        for index in object.edges.ravel().tolist():
+            glVertex(*vertexes[index])
+        glEnd()
+
+    def get_material_names(self, object_name):
+        return [material_name for material_name, start, stop
+                in self._get_object(object_name).triangle_runs]
+
+    def get_vertex_array(self, object_name):
+        return self._vertexes[self._get_object(object_name).vertex_indexes]
+
+    def get_vertexes(self, object_name):
+        return [tuple(vertex)
+                for vertex in self.get_vertex_array(object_name).tolist()]
+
+    def _get_object_bounds(self, object_name):
+        object = self._objects[object_name]
+        if isinstance(object, LazyObject):
+            return object.get_bounds(self)
+        return object.bounds
+
+    def get_bounds(self, objects=None):
+        if objects is None:
+            objects = self.object_names
 
-        if bounds_min is None:
-            return (-1.0, -1.0, -1.0), (1.0, 1.0, 1.0)
+        # The origin is always part of the bounds.
+        bounds = numpy.array([self._get_object_bounds(object_name)
+                              for object_name in objects]
+                             + [numpy.zeros((2, 3))]).astype(numpy.float64)
+        bounds_min = bounds[:, 0].min(axis=0)
+        bounds_max = bounds[:, 1].max(axis=0)
 
-        for index in range(len(bounds_min)):
-            if bounds_min[index] == bounds_max[index]:
-                bounds_min = list(bounds_min)
-                bounds_max = list(bounds_max)
-                bounds_min[index] -= 0.5
-                bounds_max[index] += 0.5
+        flat = bounds_min == bounds_max
+        bounds_min[flat] -= 0.5
+        bounds_max[flat] += 0.5
 
-        return tuple(bounds_min), tuple(bounds_max)
+        return tuple(bounds_min.tolist()), tuple(bounds_max.tolist())
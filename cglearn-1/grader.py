@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import argparse
+import traceback
+import collections
+import importlib.util
+import multiprocessing
+import multiprocessing.connection
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+import numpy
+
+import offscreen
+import scoring
+
+
+# Renders every student module of a directory with one configuration,
+# headlessly, at a set of phases and times. The geometry is loaded once and
+# inherited by forked workers, one process per module, so a module that
+# crashes or hangs only loses its own results.
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("configuration_filepath", metavar="CONFIG_FILE",
+                    help="JSON configuration file to load")
+parser.add_argument("modules", metavar="MODULE", nargs='+',
+                    help="student module files, or directories of them")
+parser.add_argument("--output-dir", default="grading",
+                    help="directory for the images and manifest.json "
+                         "(default grading)")
+parser.add_argument("--size", type=offscreen.parse_size, default=(400, 400),
+                    metavar="WIDTHxHEIGHT",
+                    help="image size (default 400x400)")
+parser.add_argument("--phase", type=int, action="append", dest="phases",
+                    help="phase to render; may be repeated (default 0)")
+parser.add_argument("--time", type=float, action="append", dest="times",
+                    help="time in milliseconds to render; may be repeated "
+                         "(default 0)")
+parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                    help="modules rendered at the same time")
+parser.add_argument("--timeout", type=float, default=30.0,
+                    help="seconds a module may take for all its images")
+parser.add_argument("--ids", action="store_true",
+                    help="also write id images, every object in a flat "
+                         "color")
+parser.add_argument("--reference", metavar="DIR", default=None,
+                    help="directory with the images of a reference "
+                         "solution, graded with the same options and "
+                         "--ids; every image is scored against it")
+parser.add_argument("--software", action="store_true",
+                    help="render with the NumPy rasterizer instead of "
+                         "OpenGL")
+
+if __name__ == '__main__':
+    options = parser.parse_args()
+    if options.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    # The platform is chosen before anything imports OpenGL.
+    offscreen.select_platform(software=options.software)
+    if options.reference is not None:
+        options.ids = True
+
+import config
+from cglearn import Viewer
+from clock import Clock
+
+
+def find_module_filepaths(paths):
+    module_filepaths = []
+    for path in paths:
+        if os.path.isdir(path):
+            module_filepaths.extend(
+                os.path.join(path, entry) for entry in sorted(os.listdir(path))
+                if entry.endswith('.py') and not entry.startswith('_'))
+        else:
+            module_filepaths.append(path)
+    return module_filepaths
+
+
+def get_module_name(module_filepath):
+    return os.path.splitext(os.path.basename(module_filepath))[0]
+
+
+def get_output_names(module_filepaths):
+    # Name of the image directory of every module: its path relative to the
+    # directory holding all of them, without the extension, so modules of
+    # the same name in different directories do not overwrite each other.
+    directories = [os.path.dirname(os.path.abspath(module_filepath))
+                   for module_filepath in module_filepaths]
+    root = os.path.commonpath(directories) if directories else ''
+    return [os.path.splitext(os.path.relpath(os.path.abspath(module_filepath),
+                                             root))[0].replace(os.sep, '/')
+            for module_filepath in module_filepaths]
+
+
+# Clear color of the viewer's renders, 0.1 gray.
+BACKGROUND_COLOR = (26, 26, 26)
+
+
+def get_image_filename(phase, time):
+    return 'phase%d-%06dms.png' % (phase, int(round(time)))
+
+
+def get_ids_filename(image_filename):
+    root, extension = os.path.splitext(image_filename)
+    return root + '-ids' + extension
+
+
+def import_student_module(module_filepath):
+    # The module's own directory goes first on the path, so it can import
+    # its neighbours as it would when run by cglearn.
+    module_name = get_module_name(module_filepath)
+    module_dir = os.path.dirname(os.path.abspath(module_filepath))
+    if sys.path[0] != module_dir:
+        sys.path.insert(0, module_dir)
+    spec = importlib.util.spec_from_file_location(module_name,
+                                                  module_filepath)
+    student_module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = student_module
+    spec.loader.exec_module(student_module)
+    return student_module
+
+
+def render_module(configuration, module_filepath, output_name, shots,
+                  options, connection):
+    # Runs in the worker process. Sends back a dict with the images written
+    # and, on failure, the traceback.
+    #
+    # Every phase starts over from a fresh import of the module and a fresh
+    # viewer, and goes through its times in increasing order, so an image
+    # does not depend on the shots rendered before it and time never runs
+    # backwards.
+    result = {'images': [], 'error': None}
+    try:
+        width, height = options.size
+        gl_context = offscreen.create_context(width, height)
+
+        image_dir = os.path.join(options.output_dir, output_name)
+        os.makedirs(image_dir, exist_ok=True)
+        for phase, shot_times in shots:
+            student_module = import_student_module(module_filepath)
+            compor_cena = getattr(student_module,
+                                  configuration.callback_name)
+            processar_teclado = getattr(student_module, "processar_teclado",
+                                        lambda key: None)
+
+            viewer = Viewer(configuration, compor_cena, processar_teclado,
+                            clock=Clock(Clock.FIXED_STEP))
+            viewer.profiler.enabled = False
+            viewer.init_gl()
+            viewer.set_phase(phase)
+
+            for shot_time in shot_times:
+                viewer.advance_frame(shot_time)
+                pixels = viewer.render_image(width, height)
+
+                image_filename = get_image_filename(phase, shot_time)
+                image_filepath = os.path.join(image_dir, image_filename)
+                offscreen.write_png(image_filepath, pixels)
+                image = {
+                    'phase': phase,
+                    'time': shot_time,
+                    'path': os.path.relpath(image_filepath,
+                                            options.output_dir),
+                }
+
+                if options.ids:
+                    ids_filepath = os.path.join(
+                        image_dir, get_ids_filename(image_filename))
+                    offscreen.write_png(ids_filepath, scoring.encode_ids(
+                        viewer.render_id_image(width, height)))
+                    image['ids_path'] = os.path.relpath(ids_filepath,
+                                                        options.output_dir)
+                result['images'].append(image)
+
+        gl_context.destroy()
+    except BaseException:
+        result['error'] = traceback.format_exc()
+
+    connection.send(result)
+    connection.close()
+
+
+class Job(object):
+    def __init__(self, module_filepath, module_name):
+        self.module_filepath = module_filepath
+        self.module_name = module_name
+        self.process = None
+        self.connection = None
+        self.start_time = None
+        self.result = None
+        self.status = None
+        self.seconds = None
+
+    def get_manifest_entry(self):
+        entry = {
+            'module': self.module_name,
+            'path': self.module_filepath,
+            'status': self.status,
+            'seconds': round(self.seconds, 3),
+            'images': [],
+            'error': None,
+        }
+        if self.result is not None:
+            entry['images'] = self.result['images']
+            entry['error'] = self.result['error']
+        if self.status == 'timeout':
+            entry['error'] = 'Timed out after %.1f s.' % self.seconds
+        elif self.status == 'crashed':
+            entry['error'] = 'Worker exited with code %s.' \
+                % self.process.exitcode
+        return entry
+
+
+def run_jobs(configuration, jobs, shots, options):
+    # Keeps up to options.jobs workers running. A worker is done when its
+    # result arrives; one that exits without a result crashed, and one
+    # that outlives the timeout is killed.
+    fork = multiprocessing.get_context('fork')
+    pending = collections.deque(jobs)
+    running = []
+
+    def finish(job, status):
+        job.seconds = time.perf_counter() - job.start_time
+        job.status = status
+        job.connection.close()
+        running.remove(job)
+        print("%s: %s (%.1f s)" % (job.module_name, status, job.seconds))
+
+    while pending or running:
+        while pending and len(running) < options.jobs:
+            job = pending.popleft()
+            receiver, sender = fork.Pipe(duplex=False)
+            job.process = fork.Process(
+                target=render_module,
+                args=(configuration, job.module_filepath, job.module_name,
+                      shots, options, sender))
+            job.start_time = time.perf_counter()
+            job.process.start()
+            sender.close()
+            job.connection = receiver
+            running.append(job)
+
+        now = time.perf_counter()
+        timeout = max(0.0, min(job.start_time + options.timeout
+                               for job in running) - now)
+        multiprocessing.connection.wait(
+            [job.connection for job in running]
+            + [job.process.sentinel for job in running], timeout)
+
+        for job in list(running):
+            remaining = max(0.0, job.start_time + options.timeout
+                            - time.perf_counter())
+            if job.connection.poll():
+                try:
+                    job.result = job.connection.recv()
+                except EOFError:
+                    join_or_kill(job.process, remaining)
+                    finish(job, 'crashed')
+                    continue
+                # A worker left hanging after sending its result, by a
+                # thread of the module for instance, is killed at the
+                # timeout; its images are kept.
+                join_or_kill(job.process, remaining)
+                finish(job, 'ok' if job.result['error'] is None else 'error')
+            elif not job.process.is_alive():
+                finish(job, 'crashed')
+            elif remaining <= 0.0:
+                job.process.kill()
+                job.process.join()
+                finish(job, 'timeout')
+
+
+def join_or_kill(process, timeout):
+    process.join(timeout)
+    if process.is_alive():
+        process.kill()
+        process.join()
+
+
+def score_job(job, object_names, options):
+    # Scores the images of a job against the reference images of the same
+    # shots, all at once, and stores the results in its image entries:
+    # the share of matching covered pixels, the IoU of the covered pixels
+    # and the IoU of every object. Shots without a reference get None.
+    def has_reference(image):
+        filename = os.path.basename(image['path'])
+        return all(os.path.exists(os.path.join(options.reference, name))
+                   for name in (filename, get_ids_filename(filename)))
+
+    images = [image for image in job.result['images']
+              if has_reference(image)]
+    for image in job.result['images']:
+        image['score'] = image['iou'] = image['object_ious'] = None
+    if not images:
+        return
+
+    def load(filepaths):
+        return numpy.stack([offscreen.read_png(filepath)
+                            for filepath in filepaths])
+
+    filenames = [os.path.basename(image['path']) for image in images]
+    pixels = load(os.path.join(options.output_dir, image['path'])
+                  for image in images)
+    references = load(os.path.join(options.reference, filename)
+                      for filename in filenames)
+    if references.shape != pixels.shape:
+        print("*** Atencao: As imagens de referencia em %s nao tem o "
+              "tamanho das imagens de %s." % (options.reference,
+                                              job.module_name),
+              file=sys.stderr)
+        return
+    ids = scoring.decode_ids(load(
+        os.path.join(options.output_dir, image['ids_path'])
+        for image in images))
+    reference_ids = scoring.decode_ids(load(
+        os.path.join(options.reference, get_ids_filename(filename))
+        for filename in filenames))
+
+    scores = scoring.score_images(pixels, references, BACKGROUND_COLOR)
+    ious = scoring.get_ious(ids > 0, reference_ids > 0)
+    object_ious = scoring.get_object_ious(ids, reference_ids,
+                                          len(object_names))
+    for index, image in enumerate(images):
+        image['score'] = round(float(scores[index]), 4)
+        image['iou'] = round(float(ious[index]), 4)
+        # Objects in neither image are left out.
+        image['object_ious'] = collections.OrderedDict(
+            (object_name, round(float(iou), 4))
+            for object_name, iou in zip(object_names, object_ious[index])
+            if not numpy.isnan(iou))
+
+
+def main(options):
+    configuration = config.load_config_file(
+        options.configuration_filepath)
+    # Lazy objects would be loaded again by every worker.
+    if configuration.lazy:
+        configuration.geometry.load_all()
+
+    phases = options.phases or [0]
+    times = sorted(set(options.times or [0.0]))
+    shots = [(phase, times) for phase in sorted(set(phases))]
+
+    module_filepaths = find_module_filepaths(options.modules)
+    jobs = [Job(module_filepath, output_name)
+            for module_filepath, output_name in zip(
+                module_filepaths, get_output_names(module_filepaths))]
+    os.makedirs(options.output_dir, exist_ok=True)
+    run_jobs(configuration, jobs, shots, options)
+
+    if options.reference is not None:
+        object_names = configuration.geometry.object_names
+        for job in jobs:
+            if job.result is not None and job.result['images']:
+                score_job(job, object_names, options)
+
+    manifest = {
+        'config': options.configuration_filepath,
+        'reference': options.reference,
+        'size': list(options.size),
+        'shots': [{'phase': phase, 'time': shot_time}
+                  for phase, shot_times in shots
+                  for shot_time in shot_times],
+        'modules': [job.get_manifest_entry() for job in jobs],
+    }
+    with open(os.path.join(options.output_dir, 'manifest.json'), 'w') as fh:
+        json.dump(manifest, fh, indent=1)
+
+    failed = sum(job.status != 'ok' for job in jobs)
+    if failed:
+        print("*** Atencao: %d de %d modulos falharam." % (failed, len(jobs)),
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main(options)
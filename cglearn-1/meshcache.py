@@ -0,0 +1,190 @@
+import os
+import sys
+import struct
+
+import numpy
+
+from geometry import Geometry, GeometryObject
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+# Cache layout: magic, little-endian uint64 header length, JSON header,
+# then every array as raw bytes aligned to ALIGNMENT. The header holds the
+# materials, the object table and the offset, dtype and shape of each array.
+CACHE_MAGIC = b'CGLMESH\x00'
+CACHE_VERSION = 5
+CACHE_SUFFIX = '.meshcache'
+ALIGNMENT = 64
+
+
+class StaleCacheError(Exception):
+    pass
+
+
+def get_cache_filepath(obj_filepath):
+    return obj_filepath + CACHE_SUFFIX
+
+
+def _get_source_key(filepath):
+    stat = os.stat(filepath)
+    return [os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size]
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_cache(geometry, obj_filepath, cache_filepath=None):
+    if cache_filepath is None:
+        cache_filepath = get_cache_filepath(obj_filepath)
+
+    arrays = []
+    array_table = {}
+
+    def add_array(key, array):
+        array = numpy.ascontiguousarray(array)
+        array_table[key] = {
+            'dtype': array.dtype.newbyteorder('<').str,
+            'shape': list(array.shape),
+        }
+        arrays.append((key, array.astype(array_table[key]['dtype'],
+                                         copy=False)))
+
+    add_array('vertexes', geometry._vertexes)
+    add_array('normals', geometry._normals)
+
+    object_table = []
+    for index, object in enumerate(geometry._objects.values()):
+        object_data = {'name': object.name}
+        for field in GeometryObject.ARRAY_FIELDS:
+            key = '%d/%s' % (index, field)
+            add_array(key, getattr(object, field))
+            object_data[field] = key
+        for field in GeometryObject.RUN_FIELDS:
+            object_data[field] = [list(run) for run in getattr(object, field)]
+        object_table.append(object_data)
+
+    sources = [_get_source_key(obj_filepath)]
+    sources.extend(_get_source_key(mtl_filepath)
+                   for mtl_filepath in geometry._mtl_filepaths)
+
+    # Offsets are relative to the start of the data section, which begins
+    # at the first aligned position after the header.
+    offset = 0
+    for key, array in arrays:
+        offset = _align(offset)
+        array_table[key]['offset'] = offset
+        offset += array.nbytes
+
+    header = json.dumps({
+        'version': CACHE_VERSION,
+        'sources': sources,
+        'mtl_filepaths': geometry._mtl_filepaths,
+        'materials': geometry._materials,
+        'objects': object_table,
+        'arrays': array_table,
+    }).encode('utf-8')
+
+    data_start = _align(len(CACHE_MAGIC) + 8 + len(header))
+
+    temp_filepath = cache_filepath + '.tmp'
+    with open(temp_filepath, 'wb') as fh:
+        fh.write(CACHE_MAGIC)
+        fh.write(struct.pack('<Q', len(header)))
+        fh.write(header)
+        for key, array in arrays:
+            fh.seek(data_start + array_table[key]['offset'])
+            fh.write(array.tobytes())
+        fh.truncate(data_start + offset)
+    os.replace(temp_filepath, cache_filepath)
+
+
+def read_cache(obj_filepath, cache_filepath=None):
+    if cache_filepath is None:
+        cache_filepath = get_cache_filepath(obj_filepath)
+
+    with open(cache_filepath, 'rb') as fh:
+        if fh.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+            raise StaleCacheError('Invalid magic.')
+        header_length, = struct.unpack('<Q', fh.read(8))
+        header = json.loads(fh.read(header_length).decode('utf-8'))
+
+    if header['version'] != CACHE_VERSION:
+        raise StaleCacheError('Cache version mismatch.')
+
+    source_filepaths = [obj_filepath] + header['mtl_filepaths']
+    if len(source_filepaths) != len(header['sources']):
+        raise StaleCacheError('Source list mismatch.')
+    for filepath, source in zip(source_filepaths, header['sources']):
+        if _get_source_key(filepath) != source:
+            raise StaleCacheError('%s changed.' % filepath)
+
+    data_start = _align(len(CACHE_MAGIC) + 8 + header_length)
+    mapping = numpy.memmap(cache_filepath, dtype=numpy.uint8, mode='r')
+
+    def get_array(key):
+        entry = header['arrays'][key]
+        dtype = numpy.dtype(entry['dtype'])
+        start = data_start + entry['offset']
+        stop = start + dtype.itemsize * int(numpy.prod(entry['shape']))
+        if stop > len(mapping):
+            raise StaleCacheError('Truncated cache.')
+        return mapping[start:stop].view(dtype).reshape(entry['shape'])
+
+    geometry = Geometry()
+    geometry._vertexes = get_array('vertexes')
+    geometry._normals = get_array('normals')
+    geometry._materials = header['materials']
+    geometry._mtl_filepaths = header['mtl_filepaths']
+
+    for object_data in header['objects']:
+        object = GeometryObject(object_data['name'])
+        for field in GeometryObject.ARRAY_FIELDS:
+            setattr(object, field, get_array(object_data[field]))
+        for field in GeometryObject.RUN_FIELDS:
+            setattr(object, field,
+                    [tuple(run) for run in object_data[field]])
+        geometry._objects[object.name] = object
+
+    geometry.update_material_colors()
+    return geometry
+
+
+def try_read_cache(obj_filepath):
+    cache_filepath = get_cache_filepath(obj_filepath)
+    if not os.path.exists(cache_filepath):
+        return None
+
+    try:
+        return read_cache(obj_filepath, cache_filepath)
+    except (StaleCacheError, OSError, ValueError, KeyError, TypeError,
+            struct.error):
+        return None
+
+
+def compile_obj(obj_filepath):
+    cache_filepath = get_cache_filepath(obj_filepath)
+
+    geometry = Geometry()
+    geometry.read_obj(obj_filepath)
+
+    try:
+        write_cache(geometry, obj_filepath, cache_filepath)
+    except OSError as error:
+        print("*** Atencao: Nao foi possivel gravar o cache %s: %s"
+              % (cache_filepath, error), file=sys.stderr)
+
+    return geometry
+
+
+def load_obj(obj_filepath, rebuild=False):
+    if not rebuild:
+        geometry = try_read_cache(obj_filepath)
+        if geometry is not None:
+            return geometry
+
+    return compile_obj(obj_filepath)
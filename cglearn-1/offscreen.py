@@ -0,0 +1,229 @@
+import os
+import zlib
+import argparse
+import struct
+import ctypes
+import ctypes.util
+import importlib.util
+
+import numpy
+
+import softgl
+
+
+class OffscreenError(Exception):
+    pass
+
+
+def parse_size(text):
+    # argparse type for image sizes given as WIDTHxHEIGHT.
+    try:
+        width, height = map(int, text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected WIDTHxHEIGHT: %r" % text)
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError("expected WIDTHxHEIGHT: %r" % text)
+    return width, height
+
+
+class EGLContext(object):
+    # OpenGL context drawing into a pbuffer, with no window system. Needs
+    # PYOPENGL_PLATFORM=egl to be set before OpenGL is first imported. Mesa
+    # uses its surfaceless platform unless EGL_PLATFORM says otherwise.
+    def __init__(self, width, height):
+        os.environ.setdefault('EGL_PLATFORM', 'surfaceless')
+        try:
+            from OpenGL import EGL
+        except ImportError as error:
+            raise OffscreenError('EGL is not available: %s' % error)
+
+        self._egl = EGL
+        self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        try:
+            major, minor = EGL.EGLint(), EGL.EGLint()
+            if not EGL.eglInitialize(self.display, ctypes.pointer(major),
+                                     ctypes.pointer(minor)):
+                raise OffscreenError('eglInitialize failed.')
+
+            attributes = (EGL.EGLint * 13)(
+                EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+                EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8,
+                EGL.EGL_BLUE_SIZE, 8, EGL.EGL_DEPTH_SIZE, 24,
+                EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT, EGL.EGL_NONE)
+            config = EGL.EGLConfig()
+            config_count = EGL.EGLint()
+            if not EGL.eglChooseConfig(self.display, attributes,
+                                       ctypes.pointer(config), 1,
+                                       ctypes.pointer(config_count)) \
+                    or config_count.value < 1:
+                raise OffscreenError('No suitable EGL configuration.')
+
+            surface_attributes = (EGL.EGLint * 5)(
+                EGL.EGL_WIDTH, width, EGL.EGL_HEIGHT, height, EGL.EGL_NONE)
+            self.surface = EGL.eglCreatePbufferSurface(self.display, config,
+                                                       surface_attributes)
+            EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+            self.context = EGL.eglCreateContext(self.display, config,
+                                                EGL.EGL_NO_CONTEXT, None)
+            if not EGL.eglMakeCurrent(self.display, self.surface,
+                                      self.surface, self.context):
+                raise OffscreenError('eglMakeCurrent failed.')
+        except EGL.EGLError as error:
+            raise OffscreenError(str(error))
+
+    def destroy(self):
+        EGL = self._egl
+        EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE,
+                           EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+        EGL.eglDestroySurface(self.display, self.surface)
+        EGL.eglDestroyContext(self.display, self.context)
+        EGL.eglTerminate(self.display)
+
+
+class OSMesaContext(object):
+    # OpenGL context rendering on the CPU into a client buffer. Needs
+    # PYOPENGL_PLATFORM=osmesa to be set before OpenGL is first imported.
+    def __init__(self, width, height):
+        try:
+            from OpenGL import osmesa, arrays
+            from OpenGL.GL import GL_UNSIGNED_BYTE
+        except ImportError as error:
+            raise OffscreenError('OSMesa is not available: %s' % error)
+
+        self._osmesa = osmesa
+        self.context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24,
+                                                     0, 0, None)
+        if not self.context:
+            raise OffscreenError('OSMesaCreateContextExt failed.')
+        self.buffer = arrays.GLubyteArray.zeros((height, width, 4))
+        if not osmesa.OSMesaMakeCurrent(self.context, self.buffer,
+                                        GL_UNSIGNED_BYTE, width, height):
+            raise OffscreenError('OSMesaMakeCurrent failed.')
+
+    def destroy(self):
+        self._osmesa.OSMesaDestroyContext(self.context)
+
+
+def is_gl_available():
+    # Whether PyOpenGL is installed and EGL can open a display, or OSMesa
+    # was asked for. Probed with ctypes so that OpenGL is not imported yet.
+    if importlib.util.find_spec('OpenGL') is None:
+        return False
+    if os.environ.get('PYOPENGL_PLATFORM') == 'osmesa':
+        return True
+
+    library_name = ctypes.util.find_library('EGL')
+    if library_name is None:
+        return False
+    os.environ.setdefault('EGL_PLATFORM', 'surfaceless')
+    try:
+        egl = ctypes.CDLL(library_name)
+    except OSError:
+        return False
+
+    egl.eglGetDisplay.restype = ctypes.c_void_p
+    egl.eglGetDisplay.argtypes = [ctypes.c_void_p]
+    egl.eglInitialize.argtypes = [ctypes.c_void_p, ctypes.c_void_p,
+                                  ctypes.c_void_p]
+    egl.eglTerminate.argtypes = [ctypes.c_void_p]
+    display = egl.eglGetDisplay(None)
+    if not display or not egl.eglInitialize(display, None, None):
+        return False
+    egl.eglTerminate(display)
+    return True
+
+
+def select_platform(software=False):
+    # Picks what headless renders draw with, before OpenGL is first
+    # imported: EGL through PyOpenGL, or the software renderer standing in
+    # for the OpenGL modules when asked for or when EGL is not usable.
+    if software or not is_gl_available():
+        softgl.install()
+    else:
+        os.environ.setdefault('PYOPENGL_PLATFORM', 'egl')
+
+
+def create_context(width, height):
+    # Makes an offscreen context of the given size current, according to
+    # the platform PyOpenGL was set up with.
+    if softgl.is_installed():
+        return softgl.SoftwareContext(width, height)
+    if os.environ.get('PYOPENGL_PLATFORM') == 'osmesa':
+        return OSMesaContext(width, height)
+    if os.environ.get('PYOPENGL_PLATFORM') == 'egl':
+        return EGLContext(width, height)
+    raise OffscreenError('PYOPENGL_PLATFORM must be "egl" or "osmesa".')
+
+
+def read_pixels(width, height):
+    # (height, width, 3) uint8 copy of the color buffer, top row first.
+    from OpenGL.GL import (glFinish, glPixelStorei, glReadPixels,
+                           GL_PACK_ALIGNMENT, GL_RGB, GL_UNSIGNED_BYTE)
+
+    glFinish()
+    glPixelStorei(GL_PACK_ALIGNMENT, 1)
+    data = glReadPixels(0, 0, width, height, GL_RGB, GL_UNSIGNED_BYTE)
+    pixels = numpy.frombuffer(data, dtype=numpy.uint8)
+    return pixels.reshape(height, width, 3)[::-1].copy()
+
+
+def _png_chunk(tag, data):
+    return (struct.pack('>I', len(data)) + tag + data
+            + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+
+def write_png(filepath, pixels, compress_level=6):
+    # Writes a (height, width, 3 or 4) uint8 array, top row first, as an
+    # 8-bit RGB or RGBA PNG. Rows are stored unfiltered.
+    pixels = numpy.ascontiguousarray(pixels, dtype=numpy.uint8)
+    height, width, channels = pixels.shape
+    color_type = {3: 2, 4: 6}[channels]
+
+    rows = numpy.zeros((height, 1 + width * channels), dtype=numpy.uint8)
+    rows[:, 1:] = pixels.reshape(height, width * channels)
+
+    with open(filepath, 'wb') as fh:
+        fh.write(b'\x89PNG\r\n\x1a\n')
+        fh.write(_png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height,
+                                                 8, color_type, 0, 0, 0)))
+        fh.write(_png_chunk(b'IDAT', zlib.compress(rows.tobytes(),
+                                                   compress_level)))
+        fh.write(_png_chunk(b'IEND', b''))
+
+
+def read_png(filepath):
+    # Reads back the PNGs write_png writes: 8-bit RGB or RGBA, not
+    # interlaced, every row unfiltered. Returns (height, width, channels)
+    # uint8 pixels, top row first.
+    with open(filepath, 'rb') as fh:
+        data = fh.read()
+    if data[:8] != b'\x89PNG\r\n\x1a\n':
+        raise ValueError('%s is not a PNG file.' % filepath)
+
+    header = None
+    compressed = []
+    position = 8
+    while position < len(data):
+        length, tag = struct.unpack('>I4s', data[position:position + 8])
+        chunk = data[position + 8:position + 8 + length]
+        if tag == b'IHDR':
+            header = struct.unpack('>IIBBBBB', chunk)
+        elif tag == b'IDAT':
+            compressed.append(chunk)
+        elif tag == b'IEND':
+            break
+        position += 12 + length
+
+    if header is None:
+        raise ValueError('%s has no header.' % filepath)
+    width, height, bit_depth, color_type, compression, filtering, \
+        interlace = header
+    channels = {2: 3, 6: 4}.get(color_type)
+    if bit_depth != 8 or channels is None or interlace != 0:
+        raise ValueError('Unsupported PNG layout in %s.' % filepath)
+
+    rows = numpy.frombuffer(zlib.decompress(b''.join(compressed)),
+                            dtype=numpy.uint8).reshape(height, -1)
+    if numpy.any(rows[:, 0] != 0):
+        raise ValueError('Unsupported PNG row filters in %s.' % filepath)
+    return rows[:, 1:].reshape(height, width, channels)
@@ -0,0 +1,209 @@
+import os
+import csv
+import time
+import collections
+import contextlib
+
+from OpenGL.GL import *
+from OpenGL.GLUT import *
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+class FrameRecord(object):
+    # Wall time in seconds, draw calls and vertexes of one frame. stages
+    # and objects map names to [seconds, draw_calls, vertexes]; objects are
+    # the Context.draw calls, which also count in the stage they ran in.
+    def __init__(self, index, start_time):
+        self.index = index
+        self.start_time = start_time
+        self.total_time = 0.0
+        self.draw_calls = 0
+        self.vertexes = 0
+        self.stages = collections.OrderedDict()
+        self.objects = collections.OrderedDict()
+
+
+class FrameProfiler(object):
+    # Keeps the records of the last `capacity` frames. Times are taken on
+    # the CPU, so GL work that the driver defers shows up in the stage that
+    # waits for it, usually the buffer swap.
+    HUD_FONT = GLUT_BITMAP_8_BY_13
+    HUD_LINE_HEIGHT = 15
+    HUD_OBJECT_COUNT = 5
+
+    def __init__(self, capacity=600, enabled=True):
+        self.enabled = enabled
+        self.frames = collections.deque(maxlen=capacity)
+        self.show_hud = False
+        self._frame_count = 0
+        self._current = None
+        self._stages = []
+        self._objects = []
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        self._current = FrameRecord(self._frame_count, time.perf_counter())
+        self._stages = []
+        self._objects = []
+
+    def end_frame(self):
+        if self._current is None:
+            return
+        self._current.total_time = (time.perf_counter()
+                                    - self._current.start_time)
+        self.frames.append(self._current)
+        self._frame_count += 1
+        self._current = None
+
+    @staticmethod
+    def _add(entries, name, seconds, draw_calls=0, vertexes=0):
+        entry = entries.get(name)
+        if entry is None:
+            entry = entries[name] = [0.0, 0, 0]
+        entry[0] += seconds
+        entry[1] += draw_calls
+        entry[2] += vertexes
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self._current is None:
+            yield
+            return
+
+        self._stages.append(name)
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._stages.pop()
+            if self._current is not None:
+                self._add(self._current.stages, name,
+                          time.perf_counter() - start_time)
+
+    @contextlib.contextmanager
+    def object(self, name):
+        if self._current is None:
+            yield
+            return
+
+        self._objects.append(name)
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._objects.pop()
+            if self._current is not None:
+                self._add(self._current.objects, name,
+                          time.perf_counter() - start_time)
+
+    def count_draw(self, draw_calls, vertexes):
+        if self._current is None:
+            return
+        self._current.draw_calls += draw_calls
+        self._current.vertexes += vertexes
+        if self._stages:
+            self._add(self._current.stages, self._stages[-1], 0.0,
+                      draw_calls, vertexes)
+        if self._objects:
+            self._add(self._current.objects, self._objects[-1], 0.0,
+                      draw_calls, vertexes)
+
+    def get_summary(self, frame_count=60):
+        # Averages over the last frames: (fps, ms per frame, stages and
+        # objects as {name: (ms, draw_calls, vertexes)}).
+        frames = list(self.frames)[-frame_count:]
+        if not frames:
+            return 0.0, 0.0, {}, {}
+
+        elapsed = frames[-1].start_time - frames[0].start_time
+        fps = (len(frames) - 1) / elapsed if elapsed > 0 else 0.0
+        frame_ms = 1000.0 * sum(frame.total_time
+                                for frame in frames) / len(frames)
+
+        def average(field):
+            totals = collections.OrderedDict()
+            for frame in frames:
+                for name, entry in getattr(frame, field).items():
+                    self._add(totals, name, *entry)
+            return collections.OrderedDict(
+                (name, (1000.0 * seconds / len(frames),
+                        draw_calls // len(frames),
+                        vertexes // len(frames)))
+                for name, (seconds, draw_calls, vertexes) in totals.items())
+
+        return fps, frame_ms, average('stages'), average('objects')
+
+    def get_hud_lines(self):
+        fps, frame_ms, stages, objects = self.get_summary()
+        lines = ['%.1f fps  %.2f ms' % (fps, frame_ms)]
+        for name, (ms, draw_calls, vertexes) in stages.items():
+            lines.append('%-20s %7.2f ms %5d draws %8d verts'
+                         % (name[:20], ms, draw_calls, vertexes))
+
+        slowest = sorted(objects.items(), key=lambda item: -item[1][0])
+        for name, (ms, draw_calls, vertexes) in \
+                slowest[:self.HUD_OBJECT_COUNT]:
+            lines.append('  %-18s %7.2f ms %5d draws %8d verts'
+                         % (str(name)[:18], ms, draw_calls, vertexes))
+        return lines
+
+    def draw_hud(self, window_width, window_height):
+        if not self.show_hud:
+            return
+
+        glMatrixMode(GL_PROJECTION)
+        glPushMatrix()
+        glLoadIdentity()
+        glOrtho(0, window_width, 0, window_height, -1, 1)
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glLoadIdentity()
+        glPushAttrib(GL_ENABLE_BIT | GL_CURRENT_BIT)
+        glDisable(GL_DEPTH_TEST)
+
+        glColor(1.0, 1.0, 1.0, 1.0)
+        y = window_height - self.HUD_LINE_HEIGHT
+        for line in self.get_hud_lines():
+            glRasterPos2f(5, y)
+            for character in line.encode('ascii', 'replace'):
+                glutBitmapCharacter(self.HUD_FONT, character)
+            y -= self.HUD_LINE_HEIGHT
+
+        glPopAttrib()
+        glPopMatrix()
+        glMatrixMode(GL_PROJECTION)
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+
+    def get_rows(self):
+        # One row per frame total, stage and object of every kept frame.
+        for frame in self.frames:
+            yield (frame.index, 'frame', '',
+                   round(1000.0 * frame.total_time, 4),
+                   frame.draw_calls, frame.vertexes)
+            for kind, entries in (('stage', frame.stages),
+                                  ('object', frame.objects)):
+                for name, (seconds, draw_calls, vertexes) in entries.items():
+                    yield (frame.index, kind, name,
+                           round(1000.0 * seconds, 4), draw_calls, vertexes)
+
+    def dump(self, filepath):
+        # Writes the kept frames as CSV, or as JSON when the file name ends
+        # with ".json".
+        fields = ('frame', 'kind', 'name', 'ms', 'draw_calls', 'vertexes')
+
+        if os.path.splitext(filepath)[1].lower() == '.json':
+            with open(filepath, 'w') as fh:
+                json.dump([dict(zip(fields, row)) for row in self.get_rows()],
+                          fh, indent=1)
+            return
+
+        with open(filepath, 'w', newline='') as fh:
+            writer = csv.writer(fh)
+            writer.writerow(fields)
+            writer.writerows(self.get_rows())
@@ -0,0 +1,236 @@
+import numpy
+
+from transformation import pose_matrices
+
+
+class SceneNode(object):
+    # Handle to a node of a SceneGraph. Nodes draw an object of the scene,
+    # or nothing when object_name is None, at their world matrix: the
+    # product of the local matrices from the root down to them.
+    def __init__(self, graph, index):
+        self._graph = graph
+        self.index = index
+
+    @property
+    def object_name(self):
+        return self._graph._object_names[self.index]
+
+    @property
+    def parent(self):
+        parent = self._graph._parents[self.index]
+        return self._graph.nodes[parent] if parent >= 0 else None
+
+    @property
+    def matrix(self):
+        return self._graph._local_matrices[self.index].copy()
+
+    @property
+    def world_matrix(self):
+        self._graph.update()
+        return self._graph._world_matrices[self.index].copy()
+
+    def set_parent(self, parent):
+        self._graph.set_parent(self, parent)
+
+    def set_matrix(self, matrix):
+        self._graph.set_matrices([self], [matrix])
+
+    def set_pose(self, x, y, angle, scale=1.0):
+        # See transformation.pose_matrices.
+        self._graph.set_matrices([self],
+                                 pose_matrices([(x, y, angle, scale)]))
+
+
+class SceneGraph(object):
+    # Retained scene: a forest of nodes with local matrices, kept in flat
+    # (capacity, 4, 4) arrays. World matrices are cached; moving a node
+    # only marks it, and update recomputes the subtrees of the marked
+    # nodes, one vectorized product per tree level, so a frame where few
+    # nodes move costs about as much as those nodes and their descendants.
+    #
+    # Nodes are also kept in preorder, where every subtree is a contiguous
+    # range. The order and the levels only change when nodes are added or
+    # reparented, and the draw list, the nodes with an object grouped by
+    # object, when nodes are added.
+    def __init__(self):
+        self.nodes = []
+        self._object_names = []
+        self._parents = numpy.zeros(0, dtype=numpy.int64)
+        self._local_matrices = numpy.zeros((0, 4, 4))
+        self._world_matrices = numpy.zeros((0, 4, 4))
+        self._children = []
+
+        self._moved = []
+        self._is_structure_valid = True
+        self._preorder = numpy.zeros(0, dtype=numpy.int64)
+        self._preorder_positions = numpy.zeros(0, dtype=numpy.int64)
+        self._subtree_ends = numpy.zeros(0, dtype=numpy.int64)
+        self._depths = numpy.zeros(0, dtype=numpy.int64)
+        self._draw_list = None
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _grow(self, count):
+        capacity = len(self._parents)
+        if count <= capacity:
+            return
+        capacity = max(count, 2 * capacity, 16)
+
+        def resized(array, fill):
+            grown = numpy.empty((capacity,) + array.shape[1:],
+                                dtype=array.dtype)
+            grown[:len(array)] = array
+            grown[len(array):] = fill
+            return grown
+
+        self._parents = resized(self._parents, -1)
+        self._local_matrices = resized(self._local_matrices,
+                                       numpy.identity(4))
+        self._world_matrices = resized(self._world_matrices,
+                                       numpy.identity(4))
+
+    def add_node(self, object_name=None, parent=None, matrix=None):
+        index = len(self.nodes)
+        self._grow(index + 1)
+        node = SceneNode(self, index)
+        self.nodes.append(node)
+        self._object_names.append(object_name)
+        self._children.append([])
+
+        if parent is not None:
+            if parent._graph is not self:
+                raise ValueError('The parent belongs to another scene graph.')
+            self._parents[index] = parent.index
+            self._children[parent.index].append(index)
+        if matrix is not None:
+            self._local_matrices[index] = matrix
+
+        self._is_structure_valid = False
+        self._draw_list = None
+        return node
+
+    def set_parent(self, node, parent):
+        # Moves node, with its subtree, under parent, or to the roots when
+        # parent is None. The local matrix is kept.
+        if parent is not None:
+            if parent._graph is not self:
+                raise ValueError('The parent belongs to another scene graph.')
+            ancestor = parent.index
+            while ancestor >= 0:
+                if ancestor == node.index:
+                    raise ValueError('A node cannot be moved under itself.')
+                ancestor = self._parents[ancestor]
+
+        old_parent = self._parents[node.index]
+        if old_parent >= 0:
+            self._children[old_parent].remove(node.index)
+        if parent is None:
+            self._parents[node.index] = -1
+        else:
+            self._parents[node.index] = parent.index
+            self._children[parent.index].append(node.index)
+        self._is_structure_valid = False
+
+    def set_matrices(self, nodes, matrices):
+        # Sets the local matrices of many nodes, given as nodes or as an
+        # array of node indexes, at once.
+        if isinstance(nodes, numpy.ndarray):
+            indexes = nodes.astype(numpy.int64)
+        else:
+            indexes = numpy.array([node.index for node in nodes],
+                                  dtype=numpy.int64)
+        self._local_matrices[indexes] = matrices
+        self._moved.append(indexes)
+
+    def _update_structure(self):
+        count = len(self.nodes)
+        preorder = []
+        subtree_ends = numpy.zeros(count, dtype=numpy.int64)
+        depths = numpy.zeros(count, dtype=numpy.int64)
+
+        # Iterative depth-first walk; an entry of None closes a subtree.
+        roots = [index for index in range(count)
+                 if self._parents[index] < 0]
+        stack = [(index, 0) for index in reversed(roots)]
+        while stack:
+            index, depth = stack.pop()
+            if depth is None:
+                subtree_ends[index] = len(preorder)
+                continue
+            depths[index] = depth
+            preorder.append(index)
+            stack.append((index, None))
+            stack.extend((child, depth + 1)
+                         for child in reversed(self._children[index]))
+
+        self._preorder = numpy.array(preorder, dtype=numpy.int64)
+        self._preorder_positions = numpy.empty(count, dtype=numpy.int64)
+        self._preorder_positions[self._preorder] = numpy.arange(count)
+        self._subtree_ends = subtree_ends
+        self._depths = depths
+        self._is_structure_valid = True
+
+    def _update_world_matrices(self, indexes):
+        # indexes must hold the whole subtrees of the nodes they hold.
+        depths = self._depths[indexes]
+        for depth in range(int(depths.max(initial=-1)) + 1):
+            level = indexes[depths == depth]
+            if depth == 0:
+                self._world_matrices[level] = self._local_matrices[level]
+            else:
+                self._world_matrices[level] = numpy.matmul(
+                    self._world_matrices[self._parents[level]],
+                    self._local_matrices[level])
+
+    def update(self):
+        if not self._is_structure_valid:
+            self._update_structure()
+            del self._moved[:]
+            self._update_world_matrices(self._preorder)
+            return
+        if not self._moved:
+            return
+
+        moved = numpy.concatenate(self._moved)
+        del self._moved[:]
+
+        # Subtrees are the preorder ranges of the moved nodes. Ranges nested
+        # in an earlier one belong to a moved ancestor and are dropped.
+        starts = numpy.unique(self._preorder_positions[moved])
+        ends = self._subtree_ends[self._preorder[starts]]
+        previous_ends = numpy.maximum.accumulate(
+            numpy.concatenate(([0], ends[:-1])))
+        is_outermost = starts >= previous_ends
+        starts = starts[is_outermost]
+        lengths = ends[is_outermost] - starts
+
+        positions = numpy.arange(lengths.sum()) + numpy.repeat(
+            starts - (numpy.cumsum(lengths) - lengths), lengths)
+        self._update_world_matrices(self._preorder[positions])
+
+    def get_world_matrices(self):
+        # (node count, 4, 4) world matrices of every node.
+        self.update()
+        return self._world_matrices[:len(self.nodes)]
+
+    def get_draw_list(self, geometry):
+        # (object name, node indexes) pairs, sorted by the materials of the
+        # objects and then by name, so objects sharing materials are drawn
+        # one after the other.
+        if self._draw_list is None:
+            indexes_by_object = {}
+            for index, object_name in enumerate(self._object_names):
+                if object_name is not None:
+                    indexes_by_object.setdefault(object_name, []).append(
+                        index)
+            object_names = sorted(
+                indexes_by_object,
+                key=lambda object_name: (
+                    [material_name or '' for material_name
+                     in geometry.get_material_names(object_name)],
+                    object_name))
+            self._draw_list = [
+                (object_name, numpy.array(indexes_by_object[object_name]))
+                for object_name in object_names]
+        return self._draw_list
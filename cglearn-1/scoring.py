@@ -0,0 +1,130 @@
+import collections
+
+import numpy
+
+
+# Comparison of renders with reference renders. Every function works on a
+# single image or on a whole batch at once: color images are
+# (..., height, width, channels) uint8 arrays and masks and id images are
+# (..., height, width), the leading axes being any batch shape.
+
+
+def get_id_colors(object_names):
+    # Flat RGBA color of every object for id renders. The id, i + 1 for the
+    # i-th object, is stored in the color bytes, red first; black is left
+    # for the background.
+    id_colors = collections.OrderedDict()
+    for index, object_name in enumerate(object_names):
+        object_id = index + 1
+        id_colors[object_name] = ((object_id & 0xff) / 255.0,
+                                  ((object_id >> 8) & 0xff) / 255.0,
+                                  ((object_id >> 16) & 0xff) / 255.0,
+                                  1.0)
+    return id_colors
+
+
+def decode_ids(pixels):
+    # Object ids of the pixels of id renders.
+    pixels = numpy.asarray(pixels, dtype=numpy.int32)
+    return pixels[..., 0] | (pixels[..., 1] << 8) | (pixels[..., 2] << 16)
+
+
+def encode_ids(ids):
+    # (..., 3) uint8 colors of id images, as id renders draw them, so they
+    # can be saved as images and read back with decode_ids.
+    ids = numpy.asarray(ids, dtype=numpy.int32)
+    return numpy.stack((ids & 0xff, (ids >> 8) & 0xff, (ids >> 16) & 0xff),
+                       axis=-1).astype(numpy.uint8)
+
+
+def get_color_distances(images, references):
+    # Largest difference over the RGB channels of every pixel.
+    images = numpy.asarray(images, dtype=numpy.int16)[..., :3]
+    references = numpy.asarray(references, dtype=numpy.int16)[..., :3]
+    return numpy.abs(images - references).max(axis=-1)
+
+
+def get_mismatch_masks(images, references, tolerance=0, radius=0):
+    # Pixels whose color differs from the reference by more than tolerance,
+    # and from every reference pixel up to radius pixels away, so that
+    # edges off by a pixel or two can be forgiven.
+    images = numpy.asarray(images, dtype=numpy.int16)[..., :3]
+    references = numpy.asarray(references, dtype=numpy.int16)[..., :3]
+    height, width = images.shape[-3:-1]
+
+    padding = [(0, 0)] * (references.ndim - 3) \
+        + [(radius, radius), (radius, radius), (0, 0)]
+    padded = numpy.pad(references, padding, mode='edge')
+
+    matched = numpy.zeros(images.shape[:-1], dtype=bool)
+    for dy in range(2 * radius + 1):
+        for dx in range(2 * radius + 1):
+            shifted = padded[..., dy:dy + height, dx:dx + width, :]
+            matched |= numpy.abs(images - shifted).max(axis=-1) <= tolerance
+    return ~matched
+
+
+def get_coverage_masks(images, background, tolerance=0):
+    # Pixels that differ from the background color.
+    background = numpy.asarray(background, dtype=numpy.int16)[:3]
+    images = numpy.asarray(images, dtype=numpy.int16)[..., :3]
+    return numpy.abs(images - background).max(axis=-1) > tolerance
+
+
+def get_ious(masks, reference_masks):
+    # Intersection over union of every pair of masks; 1.0 when both are
+    # empty.
+    masks = numpy.asarray(masks, dtype=bool)
+    reference_masks = numpy.asarray(reference_masks, dtype=bool)
+    intersections = (masks & reference_masks).sum(axis=(-2, -1))
+    unions = (masks | reference_masks).sum(axis=(-2, -1))
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return numpy.where(unions > 0, intersections / unions, 1.0)
+
+
+def get_object_ious(ids, reference_ids, object_count):
+    # (..., object_count) intersection over union of the coverage of every
+    # object, from id images. NaN for objects absent from both images.
+    # Ids above object_count count as background.
+    ids = numpy.asarray(ids, dtype=numpy.int64)
+    reference_ids = numpy.asarray(reference_ids, dtype=numpy.int64)
+    batch_shape = ids.shape[:-2]
+    ids = ids.reshape(-1, ids.shape[-2] * ids.shape[-1])
+    reference_ids = reference_ids.reshape(ids.shape)
+    ids = numpy.where(ids <= object_count, ids, 0)
+    reference_ids = numpy.where(reference_ids <= object_count,
+                                reference_ids, 0)
+
+    # Pixel counts of every (frame, id) pair, from one bincount each.
+    label_count = object_count + 1
+    frame_offsets = (numpy.arange(len(ids)) * label_count)[:, numpy.newaxis]
+    bin_count = len(ids) * label_count
+
+    def count(labels):
+        return numpy.bincount(labels.reshape(-1), minlength=bin_count) \
+            .reshape(len(ids), label_count)[:, 1:]
+
+    same = ids == reference_ids
+    intersections = count(numpy.where(same, ids, 0) + frame_offsets)
+    unions = (count(ids + frame_offsets)
+              + count(reference_ids + frame_offsets) - intersections)
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        ious = numpy.where(unions > 0, intersections / unions, numpy.nan)
+    return ious.reshape(batch_shape + (object_count,))
+
+
+def score_images(images, references, background, tolerance=16, radius=1):
+    # Share of the pixels covered in either image that match the reference,
+    # in [0, 1]; 1.0 when neither covers anything. See get_mismatch_masks
+    # for tolerance and radius.
+    covered = (get_coverage_masks(images, background, tolerance)
+               | get_coverage_masks(references, background, tolerance))
+    mismatched = covered & get_mismatch_masks(images, references,
+                                              tolerance, radius)
+
+    covered_counts = covered.sum(axis=(-2, -1))
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return numpy.where(covered_counts > 0,
+                           1.0 - mismatched.sum(axis=(-2, -1))
+                           / covered_counts, 1.0)
@@ -0,0 +1,825 @@
+import sys
+import math
+import time
+import types
+import ctypes
+
+import numpy
+from numpy.lib.stride_tricks import as_strided
+
+from softraster import Framebuffer
+
+
+# Software stand-in for the parts of OpenGL.GL, OpenGL.GLU and OpenGL.GLUT
+# that the viewer and the student modules use. install() registers this
+# module's gl*, glu* and glut* names as those modules, so code doing
+# "from OpenGL.GL import *" draws into a NumPy framebuffer instead.
+#
+# Supported: the matrix stacks, glBegin/glEnd, client vertex and color
+# arrays, buffer objects, depth testing and SRC_ALPHA/ONE_MINUS_SRC_ALPHA
+# blending. Lighting, textures, line widths and point sizes are ignored.
+# Display lists and shaders are reported as unavailable (None), as on a GL
+# lacking them, so callers take their fallback paths.
+
+
+GL_FALSE = 0
+GL_TRUE = 1
+
+GL_POINTS = 0x0000
+GL_LINES = 0x0001
+GL_LINE_LOOP = 0x0002
+GL_LINE_STRIP = 0x0003
+GL_TRIANGLES = 0x0004
+GL_TRIANGLE_STRIP = 0x0005
+GL_TRIANGLE_FAN = 0x0006
+GL_QUADS = 0x0007
+GL_QUAD_STRIP = 0x0008
+GL_POLYGON = 0x0009
+
+GL_CURRENT_BIT = 0x00000001
+GL_DEPTH_BUFFER_BIT = 0x00000100
+GL_ENABLE_BIT = 0x00002000
+GL_COLOR_BUFFER_BIT = 0x00004000
+GL_ALL_ATTRIB_BITS = 0x000fffff
+
+GL_MODELVIEW = 0x1700
+GL_PROJECTION = 0x1701
+GL_VIEWPORT = 0x0BA2
+GL_MODELVIEW_MATRIX = 0x0BA6
+GL_PROJECTION_MATRIX = 0x0BA7
+GL_CURRENT_COLOR = 0x0B00
+GL_COLOR_CLEAR_VALUE = 0x0C22
+
+GL_POINT_SMOOTH = 0x0B10
+GL_LINE_SMOOTH = 0x0B20
+GL_CULL_FACE = 0x0B44
+GL_LIGHTING = 0x0B50
+GL_DEPTH_TEST = 0x0B71
+GL_NORMALIZE = 0x0BA1
+GL_BLEND = 0x0BE2
+GL_TEXTURE_2D = 0x0DE1
+
+GL_NEVER = 0x0200
+GL_LESS = 0x0201
+GL_EQUAL = 0x0202
+GL_LEQUAL = 0x0203
+GL_GREATER = 0x0204
+GL_NOTEQUAL = 0x0205
+GL_GEQUAL = 0x0206
+GL_ALWAYS = 0x0207
+
+GL_ZERO = 0
+GL_ONE = 1
+GL_SRC_ALPHA = 0x0302
+GL_ONE_MINUS_SRC_ALPHA = 0x0303
+
+GL_FRONT = 0x0404
+GL_BACK = 0x0405
+GL_FRONT_AND_BACK = 0x0408
+GL_POINT = 0x1B00
+GL_LINE = 0x1B01
+GL_FILL = 0x1B02
+GL_FLAT = 0x1D00
+GL_SMOOTH = 0x1D01
+
+GL_BYTE = 0x1400
+GL_UNSIGNED_BYTE = 0x1401
+GL_SHORT = 0x1402
+GL_UNSIGNED_SHORT = 0x1403
+GL_INT = 0x1404
+GL_UNSIGNED_INT = 0x1405
+GL_FLOAT = 0x1406
+GL_DOUBLE = 0x140A
+
+GL_RGB = 0x1907
+GL_RGBA = 0x1908
+GL_UNPACK_ALIGNMENT = 0x0CF5
+GL_PACK_ALIGNMENT = 0x0D05
+
+GL_VERTEX_ARRAY = 0x8074
+GL_NORMAL_ARRAY = 0x8075
+GL_COLOR_ARRAY = 0x8076
+
+GL_ARRAY_BUFFER = 0x8892
+GL_ELEMENT_ARRAY_BUFFER = 0x8893
+GL_STREAM_DRAW = 0x88E0
+GL_STATIC_DRAW = 0x88E4
+GL_DYNAMIC_DRAW = 0x88E8
+
+GL_COMPILE = 0x1300
+GL_COMPILE_AND_EXECUTE = 0x1301
+GL_VERTEX_SHADER = 0x8B31
+GL_COMPILE_STATUS = 0x8B81
+GL_LINK_STATUS = 0x8B82
+
+GL_VENDOR = 0x1F00
+GL_RENDERER = 0x1F01
+GL_VERSION = 0x1F02
+
+GLUT_RGB = 0x0000
+GLUT_RGBA = 0x0000
+GLUT_SINGLE = 0x0000
+GLUT_DOUBLE = 0x0002
+GLUT_DEPTH = 0x0010
+GLUT_LEFT_BUTTON = 0x0000
+GLUT_MIDDLE_BUTTON = 0x0001
+GLUT_RIGHT_BUTTON = 0x0002
+GLUT_DOWN = 0x0000
+GLUT_UP = 0x0001
+GLUT_WINDOW_WIDTH = 0x0066
+GLUT_WINDOW_HEIGHT = 0x0067
+GLUT_ELAPSED_TIME = 0x02BC
+GLUT_BITMAP_8_BY_13 = ctypes.c_void_p(0x0003)
+GLUT_BITMAP_9_BY_15 = ctypes.c_void_p(0x0002)
+GLUT_BITMAP_HELVETICA_12 = ctypes.c_void_p(0x0007)
+
+
+class GLError(Exception):
+    pass
+
+
+_ARRAY_TYPES = {
+    GL_BYTE: numpy.int8,
+    GL_UNSIGNED_BYTE: numpy.uint8,
+    GL_SHORT: numpy.int16,
+    GL_UNSIGNED_SHORT: numpy.uint16,
+    GL_INT: numpy.int32,
+    GL_UNSIGNED_INT: numpy.uint32,
+    GL_FLOAT: numpy.float32,
+    GL_DOUBLE: numpy.float64,
+}
+
+
+class _ArrayPointer(object):
+    # Where a client array or an index list comes from: a buffer object
+    # and a byte offset, or memory handed over by the caller.
+    def __init__(self, size, type, stride, pointer, buffer_name):
+        self.size = size
+        self.dtype = numpy.dtype(_ARRAY_TYPES[type])
+        self.stride = stride or size * self.dtype.itemsize
+        if buffer_name:
+            self.buffer_name = buffer_name
+            self.offset = _get_offset(pointer)
+            self.data = None
+        else:
+            self.buffer_name = None
+            self.offset = 0
+            self.data = _as_bytes(pointer, self.dtype)
+
+    def read(self, first, count):
+        # (count, size) array of the elements first to first + count.
+        if self.buffer_name is None:
+            raw = self.data
+        else:
+            raw = _state.buffers[self.buffer_name]
+        start = self.offset + first * self.stride
+        row_bytes = self.size * self.dtype.itemsize
+        available = (len(raw) - start - row_bytes) // self.stride + 1
+        if count > available:
+            raise GLError('Array access out of bounds.')
+        rows = as_strided(raw[start:], shape=(count, row_bytes),
+                          strides=(self.stride, 1))
+        return numpy.ascontiguousarray(rows).view(self.dtype).reshape(
+            count, self.size)
+
+
+def _get_offset(pointer):
+    if pointer is None:
+        return 0
+    if isinstance(pointer, ctypes.c_void_p):
+        return pointer.value or 0
+    return int(pointer)
+
+
+def _as_bytes(data, dtype):
+    if isinstance(data, ctypes.c_void_p):
+        raise GLError('Raw pointers need a bound buffer object.')
+    array = numpy.ascontiguousarray(data)
+    if array.dtype.kind not in 'uif' or array.dtype.kind == 'f' \
+            and dtype.kind != 'f':
+        array = array.astype(dtype)
+    elif array.dtype != dtype and array.dtype.itemsize != dtype.itemsize:
+        array = array.astype(dtype)
+    return array.reshape(-1).view(numpy.uint8)
+
+
+class _State(object):
+    def __init__(self, width=400, height=400):
+        self.framebuffer = Framebuffer(width, height)
+        self.viewport = [0, 0, width, height]
+        self.matrix_mode = GL_MODELVIEW
+        self.stacks = {GL_MODELVIEW: [numpy.identity(4)],
+                       GL_PROJECTION: [numpy.identity(4)]}
+        self.color = numpy.array([1.0, 1.0, 1.0, 1.0])
+        self.clear_color = numpy.zeros(4)
+        self.clear_depth = 1.0
+        self.enabled = set()
+        self.blend_function = (GL_ONE, GL_ZERO)
+        self.depth_function = GL_LESS
+        self.depth_mask = True
+        self.attribute_stack = []
+
+        self.client_state = set()
+        self.vertex_pointer = None
+        self.color_pointer = None
+        self.buffers = {}
+        self.next_buffer_name = 1
+        self.bound_buffers = {GL_ARRAY_BUFFER: 0, GL_ELEMENT_ARRAY_BUFFER: 0}
+
+        self.primitive_mode = None
+        self.primitive_vertexes = []
+        self.primitive_colors = []
+
+        self.start_time = time.perf_counter()
+
+    @property
+    def matrix(self):
+        return self.stacks[self.matrix_mode][-1]
+
+    @matrix.setter
+    def matrix(self, value):
+        self.stacks[self.matrix_mode][-1] = value
+
+
+_state = _State()
+
+
+class SoftwareContext(object):
+    # Counterpart of offscreen.EGLContext: resizes the framebuffer and
+    # resets the GL state.
+    def __init__(self, width, height):
+        global _state
+        _state = _State(width, height)
+        self.framebuffer = _state.framebuffer
+
+    def destroy(self):
+        pass
+
+
+def get_framebuffer():
+    return _state.framebuffer
+
+
+# Vertex processing
+
+def _assemble(mode, count):
+    # Returns the primitive kind ('points', 'lines' or 'triangles') and the
+    # (primitives, corners) vertex indexes of a glBegin/glDrawArrays mode.
+    indexes = numpy.arange(count)
+
+    if mode == GL_POINTS:
+        return 'points', indexes[:, numpy.newaxis]
+
+    if mode == GL_LINES:
+        return 'lines', indexes[:count // 2 * 2].reshape(-1, 2)
+
+    if mode in (GL_LINE_STRIP, GL_LINE_LOOP):
+        lines = numpy.stack((indexes[:-1], indexes[1:]), axis=1)
+        if mode == GL_LINE_LOOP and count > 2:
+            lines = numpy.concatenate((lines, [[count - 1, 0]]))
+        return 'lines', lines.reshape(-1, 2)
+
+    if mode == GL_TRIANGLES:
+        return 'triangles', indexes[:count // 3 * 3].reshape(-1, 3)
+
+    if mode == GL_TRIANGLE_STRIP:
+        starts = indexes[:max(count - 2, 0)]
+        return 'triangles', numpy.stack((starts, starts + 1, starts + 2),
+                                        axis=1)
+
+    if mode in (GL_TRIANGLE_FAN, GL_POLYGON):
+        starts = indexes[1:max(count - 1, 1)]
+        return 'triangles', numpy.stack(
+            (numpy.zeros_like(starts), starts, starts + 1), axis=1)
+
+    if mode == GL_QUADS:
+        starts = indexes[:count // 4 * 4:4]
+        return 'triangles', numpy.stack(
+            (starts, starts + 1, starts + 2,
+             starts, starts + 2, starts + 3), axis=1).reshape(-1, 3)
+
+    if mode == GL_QUAD_STRIP:
+        starts = indexes[:max(count - 2, 0) // 2 * 2:2]
+        return 'triangles', numpy.stack(
+            (starts, starts + 1, starts + 3,
+             starts, starts + 3, starts + 2), axis=1).reshape(-1, 3)
+
+    raise GLError('Invalid primitive mode %r.' % mode)
+
+
+def _draw(mode, positions, colors, elements=None):
+    # positions is (n, 2 to 4) in object coordinates and colors (n, 4).
+    # elements optionally picks the vertexes, as in glDrawElements.
+    positions = numpy.asarray(positions, dtype=numpy.float64)
+    vertexes = numpy.zeros((len(positions), 4))
+    vertexes[:, 3] = 1.0
+    vertexes[:, :positions.shape[1]] = positions
+
+    matrix = _state.stacks[GL_PROJECTION][-1].dot(
+        _state.stacks[GL_MODELVIEW][-1])
+    clip = vertexes.dot(matrix.T)
+    in_front = clip[:, 3] > 0
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        ndc = clip[:, :3] / clip[:, 3:]
+
+    x, y, width, height = _state.viewport
+    window = numpy.empty((len(ndc), 3))
+    window[:, 0] = x + (ndc[:, 0] + 1.0) * 0.5 * width
+    window[:, 1] = y + (ndc[:, 1] + 1.0) * 0.5 * height
+    window[:, 2] = (ndc[:, 2] + 1.0) * 0.5
+
+    count = len(vertexes) if elements is None else len(elements)
+    kind, primitives = _assemble(mode, count)
+    if elements is not None:
+        primitives = numpy.asarray(elements, dtype=numpy.int64)[primitives]
+    primitives = primitives[in_front[primitives].all(axis=1)]
+
+    framebuffer = _state.framebuffer
+    framebuffer.depth_test = GL_DEPTH_TEST in _state.enabled \
+        and _state.depth_function != GL_ALWAYS
+    framebuffer.depth_less_equal = _state.depth_function == GL_LEQUAL
+    framebuffer.depth_write = _state.depth_mask
+    framebuffer.blend = GL_BLEND in _state.enabled \
+        and _state.blend_function != (GL_ONE, GL_ZERO)
+    framebuffer.clip_rectangle = _state.viewport
+
+    primitive_positions = window[primitives]
+    primitive_colors = numpy.asarray(colors, dtype=numpy.float64)[primitives]
+    if kind == 'points':
+        framebuffer.draw_points(primitive_positions[:, 0],
+                                primitive_colors[:, 0])
+    elif kind == 'lines':
+        framebuffer.draw_lines(primitive_positions, primitive_colors)
+    else:
+        framebuffer.draw_triangles(primitive_positions, primitive_colors)
+
+
+def _current_colors(count):
+    return numpy.broadcast_to(_state.color, (count, 4))
+
+
+def _read_colors(first, count):
+    if GL_COLOR_ARRAY not in _state.client_state \
+            or _state.color_pointer is None:
+        return _current_colors(count)
+
+    pointer = _state.color_pointer
+    colors = pointer.read(first, count).astype(numpy.float64)
+    if pointer.dtype.kind in 'ui':
+        colors /= numpy.iinfo(pointer.dtype).max
+    if colors.shape[1] == 3:
+        colors = numpy.concatenate((colors, numpy.ones((count, 1))), axis=1)
+    return colors
+
+
+# Matrices
+
+def glMatrixMode(mode):
+    _state.matrix_mode = mode
+
+
+def glLoadIdentity():
+    _state.matrix = numpy.identity(4)
+
+
+def glLoadMatrixf(matrix):
+    _state.matrix = numpy.array(matrix, dtype=numpy.float64).reshape(4, 4).T
+
+
+glLoadMatrixd = glLoadMatrixf
+
+
+def glMultMatrixf(matrix):
+    _state.matrix = _state.matrix.dot(
+        numpy.array(matrix, dtype=numpy.float64).reshape(4, 4).T)
+
+
+glMultMatrixd = glMultMatrixf
+
+
+def glPushMatrix():
+    stack = _state.stacks[_state.matrix_mode]
+    stack.append(stack[-1].copy())
+
+
+def glPopMatrix():
+    stack = _state.stacks[_state.matrix_mode]
+    if len(stack) < 2:
+        raise GLError('Stack underflow.')
+    stack.pop()
+
+
+def glTranslate(x, y, z):
+    matrix = numpy.identity(4)
+    matrix[:3, 3] = x, y, z
+    _state.matrix = _state.matrix.dot(matrix)
+
+
+glTranslatef = glTranslated = glTranslate
+
+
+def glRotate(angle, x, y, z):
+    axis = numpy.array([x, y, z], dtype=numpy.float64)
+    length = numpy.linalg.norm(axis)
+    if length == 0:
+        return
+    x, y, z = axis / length
+    c = math.cos(math.radians(angle))
+    s = math.sin(math.radians(angle))
+
+    matrix = numpy.identity(4)
+    matrix[:3, :3] = [
+        [x * x * (1 - c) + c, x * y * (1 - c) - z * s, x * z * (1 - c) + y * s],
+        [y * x * (1 - c) + z * s, y * y * (1 - c) + c, y * z * (1 - c) - x * s],
+        [x * z * (1 - c) - y * s, y * z * (1 - c) + x * s, z * z * (1 - c) + c],
+    ]
+    _state.matrix = _state.matrix.dot(matrix)
+
+
+glRotatef = glRotated = glRotate
+
+
+def glScale(x, y, z):
+    _state.matrix = _state.matrix.dot(numpy.diag([x, y, z, 1.0]))
+
+
+glScalef = glScaled = glScale
+
+
+def glOrtho(left, right, bottom, top, near, far):
+    matrix = numpy.identity(4)
+    matrix[0, 0] = 2.0 / (right - left)
+    matrix[1, 1] = 2.0 / (top - bottom)
+    matrix[2, 2] = -2.0 / (far - near)
+    matrix[:3, 3] = (-(right + left) / (right - left),
+                     -(top + bottom) / (top - bottom),
+                     -(far + near) / (far - near))
+    _state.matrix = _state.matrix.dot(matrix)
+
+
+def glFrustum(left, right, bottom, top, near, far):
+    matrix = numpy.zeros((4, 4))
+    matrix[0, 0] = 2.0 * near / (right - left)
+    matrix[1, 1] = 2.0 * near / (top - bottom)
+    matrix[0, 2] = (right + left) / (right - left)
+    matrix[1, 2] = (top + bottom) / (top - bottom)
+    matrix[2, 2] = -(far + near) / (far - near)
+    matrix[2, 3] = -2.0 * far * near / (far - near)
+    matrix[3, 2] = -1.0
+    _state.matrix = _state.matrix.dot(matrix)
+
+
+def glViewport(x, y, width, height):
+    _state.viewport = [int(x), int(y), int(width), int(height)]
+
+
+def glGetFloatv(name):
+    return _get(name).astype(numpy.float32)
+
+
+def glGetDoublev(name):
+    return _get(name).astype(numpy.float64)
+
+
+def glGetIntegerv(name):
+    return _get(name).astype(numpy.int32)
+
+
+def _get(name):
+    # Matrices come back transposed, like PyOpenGL's column-major arrays.
+    if name == GL_MODELVIEW_MATRIX:
+        return _state.stacks[GL_MODELVIEW][-1].T.copy()
+    if name == GL_PROJECTION_MATRIX:
+        return _state.stacks[GL_PROJECTION][-1].T.copy()
+    if name == GL_VIEWPORT:
+        return numpy.array(_state.viewport)
+    if name == GL_CURRENT_COLOR:
+        return _state.color.copy()
+    if name == GL_COLOR_CLEAR_VALUE:
+        return _state.clear_color.copy()
+    raise GLError('Unsupported query %r.' % name)
+
+
+# State
+
+def glEnable(capability):
+    _state.enabled.add(capability)
+
+
+def glDisable(capability):
+    _state.enabled.discard(capability)
+
+
+def glIsEnabled(capability):
+    return capability in _state.enabled
+
+
+def glBlendFunc(source, destination):
+    _state.blend_function = (source, destination)
+
+
+def glDepthFunc(function):
+    _state.depth_function = function
+
+
+def glDepthMask(flag):
+    _state.depth_mask = bool(flag)
+
+
+def glPushAttrib(mask):
+    _state.attribute_stack.append((
+        set(_state.enabled), _state.color.copy(), _state.blend_function,
+        _state.depth_function, _state.depth_mask))
+
+
+def glPopAttrib():
+    (_state.enabled, _state.color, _state.blend_function,
+     _state.depth_function, _state.depth_mask) = \
+        _state.attribute_stack.pop()
+
+
+def glColor(*args):
+    if len(args) == 1:
+        args = tuple(args[0])
+    color = numpy.ones(4)
+    color[:len(args)] = args
+    _state.color = color
+
+
+glColor3f = glColor3d = glColor4f = glColor4d = glColor
+glColor3fv = glColor3dv = glColor4fv = glColor4dv = glColor
+
+
+def glColor3ub(red, green, blue):
+    glColor(red / 255.0, green / 255.0, blue / 255.0)
+
+
+def glClearColor(red, green, blue, alpha):
+    _state.clear_color = numpy.array([red, green, blue, alpha])
+
+
+def glClearDepth(depth):
+    _state.clear_depth = depth
+
+
+def glClear(mask):
+    _state.framebuffer.clear(
+        _state.clear_color if mask & GL_COLOR_BUFFER_BIT else None,
+        _state.clear_depth if mask & GL_DEPTH_BUFFER_BIT else None)
+
+
+def _ignore(*args):
+    pass
+
+
+glLineWidth = glPointSize = glShadeModel = glPolygonMode = _ignore
+glHint = glPixelStorei = glFinish = glFlush = _ignore
+glRasterPos2f = glRasterPos2d = glRasterPos3f = glRasterPos3d = _ignore
+glNormal = glNormal3f = glNormal3d = glNormal3fv = _ignore
+glNormalPointer = _ignore
+
+
+def glGetString(name):
+    return {GL_VENDOR: b'cglearn', GL_RENDERER: b'softgl',
+            GL_VERSION: b'1.5 softgl'}.get(name, b'')
+
+
+def glGetError():
+    return 0
+
+
+# Immediate mode
+
+def glBegin(mode):
+    _state.primitive_mode = mode
+    _state.primitive_vertexes = []
+    _state.primitive_colors = []
+
+
+def glVertex(*args):
+    if len(args) == 1:
+        args = tuple(args[0])
+    vertex = [0.0, 0.0, 0.0, 1.0]
+    vertex[:len(args)] = args
+    _state.primitive_vertexes.append(vertex)
+    _state.primitive_colors.append(_state.color)
+
+
+glVertex2f = glVertex2d = glVertex3f = glVertex3d = glVertex
+glVertex2fv = glVertex2dv = glVertex3fv = glVertex3dv = glVertex
+
+
+def glEnd():
+    if _state.primitive_vertexes:
+        _draw(_state.primitive_mode, _state.primitive_vertexes,
+              _state.primitive_colors)
+    _state.primitive_mode = None
+    _state.primitive_vertexes = []
+    _state.primitive_colors = []
+
+
+# Arrays and buffer objects
+
+def glEnableClientState(array):
+    _state.client_state.add(array)
+
+
+def glDisableClientState(array):
+    _state.client_state.discard(array)
+
+
+def glVertexPointer(size, type, stride, pointer):
+    _state.vertex_pointer = _ArrayPointer(
+        size, type, stride, pointer, _state.bound_buffers[GL_ARRAY_BUFFER])
+
+
+def glColorPointer(size, type, stride, pointer):
+    _state.color_pointer = _ArrayPointer(
+        size, type, stride, pointer, _state.bound_buffers[GL_ARRAY_BUFFER])
+
+
+def glDrawArrays(mode, first, count):
+    if GL_VERTEX_ARRAY not in _state.client_state or count <= 0:
+        return
+    _draw(mode, _state.vertex_pointer.read(first, count),
+          _read_colors(first, count))
+
+
+def glDrawElements(mode, count, type, indices):
+    if GL_VERTEX_ARRAY not in _state.client_state or count <= 0:
+        return
+    elements = _ArrayPointer(1, type, 0, indices,
+                             _state.bound_buffers[GL_ELEMENT_ARRAY_BUFFER])
+    elements = elements.read(0, count).reshape(-1).astype(numpy.int64)
+
+    # Only the range of vertexes the indexes refer to is read.
+    first = int(elements.min())
+    vertex_count = int(elements.max()) - first + 1
+    _draw(mode, _state.vertex_pointer.read(first, vertex_count),
+          _read_colors(first, vertex_count), elements - first)
+
+
+def glGenBuffers(count):
+    names = numpy.arange(_state.next_buffer_name,
+                         _state.next_buffer_name + count, dtype=numpy.uint32)
+    _state.next_buffer_name += count
+    for name in names.tolist():
+        _state.buffers[name] = numpy.zeros(0, dtype=numpy.uint8)
+    return int(names[0]) if count == 1 else names
+
+
+def glBindBuffer(target, name):
+    _state.bound_buffers[target] = int(name)
+
+
+def glBufferData(target, size, data, usage):
+    name = _state.bound_buffers[target]
+    if data is None:
+        _state.buffers[name] = numpy.zeros(size, dtype=numpy.uint8)
+    else:
+        _state.buffers[name] = numpy.frombuffer(
+            numpy.ascontiguousarray(data).tobytes()[:size], dtype=numpy.uint8)
+
+
+def glDeleteBuffers(count, names):
+    for name in numpy.asarray(names).reshape(-1)[:count].tolist():
+        _state.buffers.pop(int(name), None)
+
+
+# Unavailable features, tested for with bool() by their callers.
+glGenLists = glNewList = glEndList = glCallList = glDeleteLists = None
+glCreateShader = glShaderSource = glCompileShader = glDeleteShader = None
+glGetShaderiv = glGetShaderInfoLog = glAttachShader = glLinkProgram = None
+glCreateProgram = glUseProgram = glGetProgramiv = glGetProgramInfoLog = None
+glBindAttribLocation = glVertexAttribPointer = None
+glEnableVertexAttribArray = glDisableVertexAttribArray = None
+glDrawElementsInstanced = glVertexAttribDivisor = None
+
+
+def glReadPixels(x, y, width, height, format, type):
+    # Bottom row first, as GL returns it.
+    if type != GL_UNSIGNED_BYTE or format not in (GL_RGB, GL_RGBA):
+        raise GLError('Only GL_RGB and GL_RGBA bytes can be read.')
+    channels = 3 if format == GL_RGB else 4
+    pixels = _state.framebuffer.get_pixels(channels)
+    return pixels[y:y + height, x:x + width].tobytes()
+
+
+# GLU
+
+def gluOrtho2D(left, right, bottom, top):
+    glOrtho(left, right, bottom, top, -1.0, 1.0)
+
+
+def gluPerspective(fovy, aspect, near, far):
+    top = near * math.tan(math.radians(fovy) / 2.0)
+    glFrustum(-top * aspect, top * aspect, -top, top, near, far)
+
+
+def gluLookAt(eye_x, eye_y, eye_z, center_x, center_y, center_z,
+              up_x, up_y, up_z):
+    eye = numpy.array([eye_x, eye_y, eye_z], dtype=numpy.float64)
+    forward = numpy.array([center_x, center_y, center_z]) - eye
+    forward /= numpy.linalg.norm(forward)
+    side = numpy.cross(forward, [up_x, up_y, up_z])
+    side /= numpy.linalg.norm(side)
+    up = numpy.cross(side, forward)
+
+    matrix = numpy.identity(4)
+    matrix[0, :3] = side
+    matrix[1, :3] = up
+    matrix[2, :3] = -forward
+    _state.matrix = _state.matrix.dot(matrix)
+    glTranslate(*-eye)
+
+
+def gluProject(x, y, z, modelview=None, projection=None, viewport=None):
+    if modelview is None:
+        modelview = _get(GL_MODELVIEW_MATRIX)
+    if projection is None:
+        projection = _get(GL_PROJECTION_MATRIX)
+    if viewport is None:
+        viewport = _state.viewport
+
+    clip = numpy.asarray(projection, dtype=numpy.float64).reshape(4, 4).T.dot(
+        numpy.asarray(modelview, dtype=numpy.float64).reshape(4, 4).T.dot(
+            [x, y, z, 1.0]))
+    ndc = clip[:3] / clip[3]
+    return (viewport[0] + (ndc[0] + 1.0) * 0.5 * viewport[2],
+            viewport[1] + (ndc[1] + 1.0) * 0.5 * viewport[3],
+            (ndc[2] + 1.0) * 0.5)
+
+
+# GLUT. There are no windows; only what headless renders touch works.
+
+def glutInit(*args):
+    return list(args[0]) if args else []
+
+
+glutInitDisplayMode = glutInitWindowSize = glutInitWindowPosition = _ignore
+glutDisplayFunc = glutReshapeFunc = glutMouseFunc = glutMotionFunc = _ignore
+glutKeyboardFunc = glutIdleFunc = glutTimerFunc = _ignore
+glutPostRedisplay = glutSwapBuffers = glutBitmapCharacter = _ignore
+
+
+def glutCreateWindow(title):
+    raise GLError('The software renderer cannot open windows.')
+
+
+def glutMainLoop():
+    raise GLError('The software renderer cannot open windows.')
+
+
+def glutGet(name):
+    if name == GLUT_ELAPSED_TIME:
+        return int(1000 * (time.perf_counter() - _state.start_time))
+    if name == GLUT_WINDOW_WIDTH:
+        return _state.framebuffer.width
+    if name == GLUT_WINDOW_HEIGHT:
+        return _state.framebuffer.height
+    return 0
+
+
+# Installation
+
+def _get_namespace(is_member):
+    names = [name for name in globals() if is_member(name)]
+    namespace = dict((name, globals()[name]) for name in names)
+    namespace['__all__'] = names
+    return namespace
+
+
+def is_installed():
+    return getattr(sys.modules.get('OpenGL.GL'), '__softgl__', False)
+
+
+def install():
+    # Must run before anything imports OpenGL.
+    if is_installed():
+        return
+    if 'OpenGL' in sys.modules:
+        raise RuntimeError('OpenGL was already imported.')
+
+    def is_glut(name):
+        return name.startswith('glut') or name.startswith('GLUT_')
+
+    def is_glu(name):
+        return name.startswith('glu') and not is_glut(name)
+
+    def is_gl(name):
+        return name.startswith('GL_') or name == 'GLError' \
+            or name.startswith('gl') and not is_glu(name) \
+            and not is_glut(name)
+
+    package = types.ModuleType('OpenGL')
+    package.__path__ = []
+    package.__softgl__ = True
+    sys.modules['OpenGL'] = package
+
+    for submodule_name, is_member in (('GL', is_gl), ('GLU', is_glu),
+                                      ('GLUT', is_glut)):
+        module = types.ModuleType('OpenGL.' + submodule_name)
+        module.__dict__.update(_get_namespace(is_member))
+        module.__softgl__ = True
+        setattr(package, submodule_name, module)
+        sys.modules['OpenGL.' + submodule_name] = module
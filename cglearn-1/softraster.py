@@ -0,0 +1,387 @@
+import numpy
+
+
+class Framebuffer(object):
+    # RGBA color and depth buffers filled by vectorized rasterization. Rows
+    # go bottom to top as in GL; colors are floats in [0, 1] and depths are
+    # window depths in [0, 1].
+    #
+    # Primitives come in window coordinates: x and y in pixels and z the
+    # window depth. Fragments are resolved in submission order, so depth
+    # testing and blending behave as if primitives were drawn one by one.
+    SAMPLES_PER_BATCH = 1 << 22
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.color = numpy.zeros((height, width, 4), dtype=numpy.float32)
+        self.depth = numpy.ones((height, width), dtype=numpy.float32)
+
+        self.depth_test = False
+        self.depth_less_equal = False
+        self.depth_write = True
+        self.blend = False
+
+        # (x, y, width, height) outside of which nothing is drawn, like the
+        # GL viewport clips; None for the whole buffer.
+        self.clip_rectangle = None
+
+    def _get_clip_bounds(self):
+        # Pixel bounds (min_x, min_y, max_x, max_y), max excluded.
+        if self.clip_rectangle is None:
+            return 0, 0, self.width, self.height
+        x, y, width, height = self.clip_rectangle
+        return (max(x, 0), max(y, 0), min(x + width, self.width),
+                min(y + height, self.height))
+
+    def clear(self, color=None, depth=None):
+        if color is not None:
+            self.color[:] = color
+        if depth is not None:
+            self.depth[:] = depth
+
+    def write_fragments(self, pixels, depths, colors):
+        # pixels are flat indexes into the buffers. Fragments hitting the
+        # same pixel are resolved as if written one by one, in submission
+        # order, without looping over them.
+        if not len(pixels):
+            return
+
+        # Adding zero turns -0.0 into 0.0, so depth bits sort like depths.
+        depths = numpy.asarray(depths, dtype=numpy.float32) \
+            + numpy.float32(0.0)
+        keep = (depths >= 0.0) & (depths <= 1.0)
+        if not numpy.all(keep):
+            pixels, depths, colors = pixels[keep], depths[keep], colors[keep]
+            if not len(pixels):
+                return
+
+        if not self.blend:
+            self._write_opaque_fragments(pixels, depths, colors)
+        else:
+            self._write_blended_fragments(pixels, depths, colors)
+
+    def _write_blended_fragments(self, pixels, depths, colors):
+        # Fragments are grouped by pixel, keeping their order. Blending
+        # fragments 0..n-1 over a color C gives
+        #
+        #   C * prod(1 - a_j) + sum(c_i * a_i * prod(1 - a_j for j > i))
+        #
+        # so every group is composed with cumulative sums of log(1 - a).
+        color = self.color.reshape(-1, 4)
+        depth = self.depth.reshape(-1)
+
+        order = numpy.argsort(pixels, kind='stable')
+        pixels = pixels[order]
+        depths = depths[order]
+        colors = colors[order]
+        is_first = numpy.concatenate(([True], pixels[1:] != pixels[:-1]))
+        groups = numpy.cumsum(is_first) - 1
+
+        if self.depth_test:
+            stored = depth[pixels]
+            if self.depth_write:
+                # A fragment is tested against the least depth written
+                # before it. The running minimum is taken over the depth
+                # bits, shifted down by group so that groups never mix.
+                shift = groups.astype(numpy.int64) << 32
+                keys = depths.view(numpy.int32).astype(numpy.int64) - shift
+                bounds = stored.view(numpy.int32).astype(numpy.int64) - shift
+                running = numpy.minimum.accumulate(keys)
+                previous = numpy.concatenate(([0], running[:-1]))
+                bounds = numpy.where(is_first, bounds,
+                                     numpy.minimum(bounds, previous))
+                if self.depth_less_equal:
+                    passed = keys <= bounds
+                else:
+                    passed = keys < bounds
+            elif self.depth_less_equal:
+                passed = depths <= stored
+            else:
+                passed = depths < stored
+
+            pixels = pixels[passed]
+            depths = depths[passed]
+            colors = colors[passed]
+            if not len(pixels):
+                return
+            is_first = numpy.concatenate(([True], pixels[1:] != pixels[:-1]))
+            groups = numpy.cumsum(is_first) - 1
+            if self.depth_write:
+                # Passing depths only decrease within a group.
+                is_last = numpy.concatenate((is_first[1:], [True]))
+                depth[pixels[is_last]] = depths[is_last]
+
+        colors = colors.astype(numpy.float64)
+        alphas = numpy.clip(colors[:, 3], 0.0, 1.0)
+        opaque = alphas >= 1.0
+        with numpy.errstate(divide='ignore'):
+            logs = numpy.where(opaque, 0.0, numpy.log1p(-alphas))
+
+        # Sums over the fragments after each one in its group, opaque
+        # fragments counted apart since their factor is zero.
+        group_starts = numpy.flatnonzero(is_first)
+        group_ends = numpy.append(group_starts[1:], len(pixels)) - 1
+        log_sums = numpy.cumsum(logs)
+        opaque_counts = numpy.cumsum(opaque)
+        later_logs = log_sums[group_ends][groups] - log_sums
+        later_opaque = opaque_counts[group_ends][groups] - opaque_counts
+        weights = numpy.where(later_opaque > 0, 0.0,
+                              numpy.exp(later_logs)) * alphas
+
+        first_logs = log_sums[group_starts] - logs[group_starts]
+        first_opaque = opaque_counts[group_starts] - opaque[group_starts]
+        total_logs = log_sums[group_ends] - first_logs
+        total_opaque = opaque_counts[group_ends] - first_opaque
+        kept = numpy.where(total_opaque > 0, 0.0, numpy.exp(total_logs))
+
+        group_pixels = pixels[group_starts]
+        color[group_pixels] = (
+            color[group_pixels] * kept[:, numpy.newaxis]
+            + numpy.add.reduceat(colors * weights[:, numpy.newaxis],
+                                 group_starts))
+
+    def _write_opaque_fragments(self, pixels, depths, colors):
+        # Without blending only one fragment per pixel decides the result,
+        # so it is picked directly instead of going through layers.
+        color = self.color.reshape(-1, 4)
+        depth = self.depth.reshape(-1)
+        order = numpy.arange(len(pixels))
+
+        if self.depth_test and self.depth_write:
+            # The stored depth only decreases, so the winner is the
+            # fragment of least depth: the first of equals with "less",
+            # the last with "less or equal".
+            tie_order = -order if self.depth_less_equal else order
+            sorted_indexes = numpy.lexsort((tie_order, depths, pixels))
+            sorted_pixels = pixels[sorted_indexes]
+            is_first = numpy.concatenate(
+                ([True], sorted_pixels[1:] != sorted_pixels[:-1]))
+            winners = sorted_indexes[is_first]
+        else:
+            # The last fragment that passes wins.
+            if self.depth_test:
+                if self.depth_less_equal:
+                    passed = depths <= depth[pixels]
+                else:
+                    passed = depths < depth[pixels]
+                order = order[passed]
+            sorted_indexes = order[numpy.argsort(pixels[order],
+                                                 kind='stable')]
+            sorted_pixels = pixels[sorted_indexes]
+            is_last = numpy.concatenate(
+                (sorted_pixels[1:] != sorted_pixels[:-1], [True])) \
+                if len(sorted_pixels) else numpy.zeros(0, dtype=bool)
+            winners = sorted_indexes[is_last]
+
+        winner_pixels = pixels[winners]
+        if self.depth_test and self.depth_write:
+            winner_depths = depths[winners]
+            if self.depth_less_equal:
+                passed = winner_depths <= depth[winner_pixels]
+            else:
+                passed = winner_depths < depth[winner_pixels]
+            winners = winners[passed]
+            winner_pixels = winner_pixels[passed]
+            depth[winner_pixels] = winner_depths[passed]
+        color[winner_pixels] = colors[winners]
+
+    def draw_points(self, positions, colors):
+        # positions is (n, 3) and colors (n, 4).
+        min_x, min_y, max_x, max_y = self._get_clip_bounds()
+        x = numpy.floor(positions[:, 0]).astype(numpy.int64)
+        y = numpy.floor(positions[:, 1]).astype(numpy.int64)
+        inside = (x >= min_x) & (x < max_x) & (y >= min_y) & (y < max_y)
+        self.write_fragments((y * self.width + x)[inside],
+                             positions[inside, 2], colors[inside])
+
+    def draw_lines(self, positions, colors):
+        # positions is (n, 2, 3) and colors (n, 2, 4). Each line is sampled
+        # once per pixel along its major axis.
+        if not len(positions):
+            return
+
+        # Lines are first cut to the clip bounds (Liang-Barsky), so long
+        # lines leaving the viewport cost no more than visible ones.
+        min_x, min_y, max_x, max_y = self._get_clip_bounds()
+        deltas = positions[:, 1] - positions[:, 0]
+        starts = numpy.zeros(len(positions))
+        ends = numpy.ones(len(positions))
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            for axis, low, high in ((0, min_x, max_x), (1, min_y, max_y)):
+                delta = deltas[:, axis]
+                start = positions[:, 0, axis]
+                t_low = (low - start) / delta
+                t_high = (high - start) / delta
+                is_null = delta == 0
+                inside = (start >= low) & (start <= high)
+                entering = numpy.where(is_null,
+                                       numpy.where(inside, 0.0, 2.0),
+                                       numpy.minimum(t_low, t_high))
+                leaving = numpy.where(is_null,
+                                      numpy.where(inside, 1.0, -1.0),
+                                      numpy.maximum(t_low, t_high))
+                starts = numpy.maximum(starts, entering)
+                ends = numpy.minimum(ends, leaving)
+
+        visible = starts < ends
+        positions, colors, deltas = (positions[visible], colors[visible],
+                                     deltas[visible])
+        starts = starts[visible][:, numpy.newaxis, numpy.newaxis]
+        ends = ends[visible][:, numpy.newaxis, numpy.newaxis]
+        color_deltas = colors[:, 1] - colors[:, 0]
+        positions = positions[:, :1] + numpy.concatenate(
+            (starts, ends), axis=1) * deltas[:, numpy.newaxis]
+        colors = colors[:, :1] + numpy.concatenate(
+            (starts, ends), axis=1) * color_deltas[:, numpy.newaxis]
+        if not len(positions):
+            return
+
+        deltas = positions[:, 1] - positions[:, 0]
+        lengths = numpy.ceil(numpy.abs(deltas[:, :2]).max(axis=1))
+        counts = numpy.maximum(lengths, 1).astype(numpy.int64)
+
+        line_ids = numpy.repeat(numpy.arange(len(positions)), counts)
+        steps = numpy.arange(len(line_ids)) - numpy.repeat(
+            numpy.cumsum(counts) - counts, counts)
+        t = ((steps + 0.5) / counts[line_ids])[:, numpy.newaxis]
+
+        samples = positions[line_ids, 0] + t * deltas[line_ids]
+        sample_colors = (colors[line_ids, 0] * (1.0 - t)
+                         + colors[line_ids, 1] * t)
+        self.draw_points(samples, sample_colors)
+
+    def draw_triangles(self, positions, colors):
+        # positions is (n, 3, 3) and colors (n, 3, 4). Pixel centers are
+        # tested against the three edge functions; pixels on an edge belong
+        # to a triangle only for its top and left edges, so triangles
+        # sharing an edge never both draw it.
+        if not len(positions):
+            return
+
+        x = positions[:, :, 0].astype(numpy.float64)
+        y = positions[:, :, 1].astype(numpy.float64)
+        areas = ((x[:, 1] - x[:, 0]) * (y[:, 2] - y[:, 0])
+                 - (x[:, 2] - x[:, 0]) * (y[:, 1] - y[:, 0]))
+
+        # Make every triangle counterclockwise; faces are not culled.
+        clockwise = areas < 0
+        swap = numpy.array([0, 2, 1])
+        positions = numpy.where(clockwise[:, numpy.newaxis, numpy.newaxis],
+                                positions[:, swap], positions)
+        colors = numpy.where(clockwise[:, numpy.newaxis, numpy.newaxis],
+                             colors[:, swap], colors)
+        x = numpy.where(clockwise[:, numpy.newaxis], x[:, swap], x)
+        y = numpy.where(clockwise[:, numpy.newaxis], y[:, swap], y)
+        areas = numpy.abs(areas)
+
+        clip_min_x, clip_min_y, clip_max_x, clip_max_y = \
+            self._get_clip_bounds()
+        min_x = numpy.maximum(numpy.ceil(x.min(axis=1) - 0.5), clip_min_x)
+        max_x = numpy.minimum(numpy.floor(x.max(axis=1) - 0.5),
+                              clip_max_x - 1)
+        min_y = numpy.maximum(numpy.ceil(y.min(axis=1) - 0.5), clip_min_y)
+        max_y = numpy.minimum(numpy.floor(y.max(axis=1) - 0.5),
+                              clip_max_y - 1)
+        widths = numpy.maximum(max_x - min_x + 1, 0).astype(numpy.int64)
+        heights = numpy.maximum(max_y - min_y + 1, 0).astype(numpy.int64)
+
+        visible = (areas > 0) & numpy.isfinite(areas) \
+            & (widths > 0) & (heights > 0)
+        triangles = numpy.flatnonzero(visible)
+        sample_counts = widths[triangles] * heights[triangles]
+
+        # Bounding boxes are expanded into samples a batch of triangles at
+        # a time to bound memory use.
+        cumulative_counts = numpy.cumsum(sample_counts)
+        batch_start = 0
+        while batch_start < len(triangles):
+            done = cumulative_counts[batch_start - 1] if batch_start else 0
+            batch_end = max(batch_start + 1, int(numpy.searchsorted(
+                cumulative_counts, done + self.SAMPLES_PER_BATCH,
+                side='right')))
+            batch = triangles[batch_start:batch_end]
+            self._fill_triangles(
+                x[batch], y[batch], positions[batch, :, 2], colors[batch],
+                areas[batch], min_x[batch].astype(numpy.int64),
+                min_y[batch].astype(numpy.int64), widths[batch],
+                sample_counts[batch_start:batch_end])
+            batch_start = batch_end
+
+    def _fill_triangles(self, x, y, z, colors, areas, min_x, min_y, widths,
+                        sample_counts):
+        # Each row of a bounding box is first narrowed to the span the edge
+        # functions allow, widened by a pixel for rounding, so thin
+        # triangles do not test their whole box.
+        heights = sample_counts // widths
+        row_ids = numpy.repeat(numpy.arange(len(x)), heights)
+        row_y = min_y[row_ids] + numpy.arange(len(row_ids)) - numpy.repeat(
+            numpy.cumsum(heights) - heights, heights) + 0.5
+        span_start = min_x[row_ids].astype(numpy.float64)
+        span_end = span_start + widths[row_ids] - 1
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            for corner in range(3):
+                a = (corner + 1) % 3
+                b = (corner + 2) % 3
+                edge_x = (x[:, b] - x[:, a])[row_ids]
+                edge_y = (y[:, b] - y[:, a])[row_ids]
+                # The edge function is edge_x * (row_y - ay) - edge_y *
+                # (sample_x - ax), zero at sample_x = crossing.
+                crossing = x[:, a][row_ids] + edge_x * (
+                    row_y - y[:, a][row_ids]) / edge_y
+                upper = numpy.floor(crossing - 0.5) + 1
+                lower = numpy.ceil(crossing - 0.5) - 1
+                span_end = numpy.where(edge_y > 0,
+                                       numpy.minimum(span_end, upper),
+                                       span_end)
+                span_start = numpy.where(edge_y < 0,
+                                         numpy.maximum(span_start, lower),
+                                         span_start)
+
+        span_counts = numpy.maximum(span_end - span_start + 1,
+                                    0).astype(numpy.int64)
+        sample_rows = numpy.repeat(numpy.arange(len(row_ids)), span_counts)
+        triangle_ids = row_ids[sample_rows]
+        pixel_x = (span_start[sample_rows].astype(numpy.int64)
+                   + numpy.arange(len(sample_rows)) - numpy.repeat(
+                       numpy.cumsum(span_counts) - span_counts, span_counts))
+        pixel_y = (row_y[sample_rows] - 0.5).astype(numpy.int64)
+        sample_x = pixel_x + 0.5
+        sample_y = pixel_y + 0.5
+
+        # weights[k] is the edge function of the edge opposite to corner k,
+        # which is twice the area of the sub-triangle facing that corner.
+        weights = []
+        inside = numpy.ones(len(triangle_ids), dtype=bool)
+        for corner in range(3):
+            a = (corner + 1) % 3
+            b = (corner + 2) % 3
+            ax = x[:, a][triangle_ids]
+            ay = y[:, a][triangle_ids]
+            edge_x = (x[:, b] - x[:, a])[triangle_ids]
+            edge_y = (y[:, b] - y[:, a])[triangle_ids]
+            weight = edge_x * (sample_y - ay) - edge_y * (sample_x - ax)
+
+            # Counterclockwise with y up: left edges go down, top edges go
+            # left.
+            is_top_left = (edge_y < 0) | ((edge_y == 0) & (edge_x < 0))
+            inside &= (weight > 0) | ((weight == 0) & is_top_left)
+            weights.append(weight)
+
+        triangle_ids = triangle_ids[inside]
+        barycentric = numpy.stack([weight[inside] for weight in weights],
+                                  axis=1) / areas[triangle_ids, numpy.newaxis]
+
+        depths = (barycentric * z[triangle_ids]).sum(axis=1)
+        fragment_colors = numpy.einsum('nk,nkc->nc', barycentric,
+                                       colors[triangle_ids])
+        self.write_fragments(
+            pixel_y[inside] * self.width + pixel_x[inside],
+            depths.astype(numpy.float32),
+            fragment_colors.astype(numpy.float32))
+
+    def get_pixels(self, channels=3):
+        # (height, width, channels) uint8 image, bottom row first.
+        return numpy.clip(numpy.rint(self.color[:, :, :channels] * 255), 0,
+                          255).astype(numpy.uint8)
@@ -0,0 +1,181 @@
+import os
+import re
+import glob
+
+import numpy
+import pytest
+
+from geometry import Geometry, _UnsupportedLayout, _parse_obj_bulk, \
+    _parse_obj_lines
+
+
+RES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'res')
+OBJ_FILEPATHS = sorted(glob.glob(os.path.join(RES_DIR, '*.obj')))
+
+
+def parse_obj_baseline(lines):
+    # The regular expression parser read_obj used before the NumPy arrays,
+    # kept as the reference, taking polygons of any size. Objects are lists
+    # of (material_name, vertex indexes, normal indexes) faces and lists of
+    # vertex index pairs, with -1 for a missing normal.
+    vertexes = []
+    normals = []
+    objects = {}
+    mtl_filenames = []
+
+    current_material_name = None
+    current_object_name = None
+
+    def parse_args(args):
+        vertex_indexes = []
+        normal_indexes = []
+        for arg in args:
+            m = re.match(r'(\d+)(?:/(\d*)(?:/(\d*)?))?$', arg)
+            vertex_indexes.append(int(m.group(1)) - 1)
+            if m.group(3):
+                normal_indexes.append(int(m.group(3)) - 1)
+            else:
+                normal_indexes.append(-1)
+        return tuple(vertex_indexes), tuple(normal_indexes)
+
+    def get_object():
+        return objects.setdefault(current_object_name, ([], []))
+
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        parts = line.split(' ')
+        command = parts[0]
+        args = parts[1:]
+
+        if command == 'o':
+            current_object_name = args[0]
+
+        elif command == 'mtllib':
+            mtl_filenames.append(args[0])
+
+        elif command == 'usemtl':
+            current_material_name = args[0]
+
+        elif command == 'v':
+            vertexes.append(
+                (float(args[0]), float(args[1]), float(args[2])))
+
+        elif command == 'vn':
+            normals.append(
+                (float(args[0]), float(args[1]), float(args[2])))
+
+        elif command == 'l':
+            if len(args) == 2:
+                get_object()[1].append(parse_args(args)[0])
+            else:
+                raise ValueError('Invalid number of parameters.')
+
+        elif command == 'f':
+            if len(args) >= 3:
+                get_object()[0].append(
+                    (current_material_name,) + parse_args(args))
+            else:
+                raise ValueError('Invalid number of parameters.')
+
+    return (numpy.array(vertexes, dtype=numpy.float32).reshape(-1, 3),
+            numpy.array(normals, dtype=numpy.float32).reshape(-1, 3),
+            objects, mtl_filenames)
+
+
+def get_faces(object):
+    # Faces of a parsed object in the form of parse_obj_baseline.
+    starts = numpy.concatenate(([0], numpy.cumsum(object.polygon_sizes)))
+    faces = []
+    for material_name, start, stop in object.polygon_runs:
+        for index in range(start, stop):
+            corners = slice(starts[index], starts[index + 1])
+            faces.append((material_name,
+                          tuple(object.polygons[corners].tolist()),
+                          tuple(object.polygon_normals[corners].tolist())))
+    assert len(faces) == len(object.polygon_sizes)
+    return faces
+
+
+def assert_matches_baseline(result, data):
+    vertexes, normals, objects, mtl_filenames = parse_obj_baseline(
+        data.decode('utf-8').splitlines())
+    result_vertexes, result_normals, result_objects, result_mtl_filenames = \
+        result
+
+    assert numpy.array_equal(result_vertexes, vertexes)
+    assert numpy.array_equal(result_normals, normals)
+    assert result_mtl_filenames == mtl_filenames
+    assert list(result_objects) == list(objects)
+    for name, (faces, lines) in objects.items():
+        result_object = result_objects[name]
+        assert get_faces(result_object) == faces, name
+        assert [tuple(line) for line in result_object.lines.tolist()] \
+            == lines, name
+
+
+def assert_parsers_match_baseline(data):
+    assert_matches_baseline(_parse_obj_bulk(data), data)
+    assert_matches_baseline(
+        _parse_obj_lines(data.decode('utf-8').splitlines()), data)
+
+
+@pytest.mark.parametrize('obj_filepath', OBJ_FILEPATHS,
+                         ids=os.path.basename)
+def test_parsers_match_baseline(obj_filepath):
+    with open(obj_filepath, 'rb') as fh:
+        data = fh.read()
+    assert_parsers_match_baseline(data)
+
+
+@pytest.mark.parametrize('data', [
+    b'v 0 0 0\nv 1 0 0\nv 0 1 0\n'
+    b'f 1 2 3\n',
+    b'v 0 0 0\nv 1 0 0\nv 0 1 0\nvn 0 0 1\n'
+    b'o a\nusemtl m\nf 1//1 2//1 3//1\nusemtl n\nf 3//1 2//1 1//1\n'
+    b'o b\nl 1//1 2//1\n',
+    b'v 0 0 0\nv 1 0 0\nv 0 1 0\nv 1 1 0\nvn 0 0 1\nvn 0 1 0\n'
+    b'usemtl m\nf 1/1/1 2/2/2 4/3/1 3/4/2\nf 1/1/2 2/1/2 3/1/1\n'
+    b'usemtl n\nf 4/1/1 3/1/1 2/1/1 1/1/1\n',
+    b'v 0 0 0\nv 1 0 0\nv 2 1 0\nv 1 2 0\nv 0 1 0\n'
+    b'f 1 2 3 4 5\nf 1 2 3\nf 5 4 3 2 1\n',
+], ids=['plain', 'normals-objects-lines', 'quads', 'pentagons'])
+def test_parsers_match_baseline_on_samples(data):
+    assert_parsers_match_baseline(data)
+
+
+MIXED_FACES = (b'v 0 0 0\nv 1 0 0\nv 0 1 0\nv 1 1 0\nv 2 1 0\nv 2 2 0\n'
+               b'vt 0 0\nvn 0 0 1\n'
+               b'f 1/1/1 2/1/1 3/1/1\nf 4 5 6\n')
+
+
+@pytest.mark.parametrize('data', [
+    # Slash totals that add up to a single form over the whole file.
+    MIXED_FACES,
+    b'v 0 0 0\nv 1 0 0\nv 0 1 0\nvt 0 0\n'
+    b'f 1/1 2/1/1 3\n',
+    # Four and two components add up to twice three.
+    b'v 0 0 0 1\nv 1 0\nv 0 1 0\n'
+    b'f 1 2 3\n',
+], ids=['mixed-lines', 'mixed-corners', 'vertex-components'])
+def test_bulk_parser_rejects_mixed_forms(data):
+    with pytest.raises(_UnsupportedLayout):
+        _parse_obj_bulk(data)
+
+
+def test_line_parser_matches_baseline_on_mixed_forms():
+    assert_matches_baseline(
+        _parse_obj_lines(MIXED_FACES.decode('utf-8').splitlines()),
+        MIXED_FACES)
+
+
+def test_read_obj_falls_back_on_mixed_forms(tmpdir):
+    obj_filepath = tmpdir.join('mixed.obj')
+    obj_filepath.write_binary(MIXED_FACES)
+
+    geometry = Geometry()
+    geometry.read_obj(str(obj_filepath))
+    object, = geometry._objects.values()
+    assert object.triangles.tolist() == [[0, 1, 2], [3, 4, 5]]
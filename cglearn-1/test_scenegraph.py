@@ -0,0 +1,82 @@
+import numpy
+import pytest
+
+from scenegraph import SceneGraph
+from transformation import pose_matrices
+
+
+def get_full_world_matrices(graph):
+    # World matrices recomputed from scratch, parents first.
+    world_matrices = {}
+
+    def get_world_matrix(node):
+        if node.index not in world_matrices:
+            parent = node.parent
+            if parent is None:
+                world_matrices[node.index] = node.matrix
+            else:
+                world_matrices[node.index] = numpy.matmul(
+                    get_world_matrix(parent), node.matrix)
+        return world_matrices[node.index]
+
+    return numpy.array([get_world_matrix(node) for node in graph.nodes])
+
+
+def get_random_matrices(random, count):
+    return pose_matrices(random.random((count, 4)) * [10.0, 10.0, 360.0, 2.0])
+
+
+def test_dirty_updates_match_full_recompute():
+    random = numpy.random.default_rng(0)
+    graph = SceneGraph()
+    for index in range(500):
+        parent = graph.nodes[random.integers(len(graph.nodes))] \
+            if graph.nodes and random.random() < 0.9 else None
+        graph.add_node('object%d' % (index % 3), parent,
+                       get_random_matrices(random, 1)[0])
+    assert numpy.allclose(graph.get_world_matrices(),
+                          get_full_world_matrices(graph))
+
+    for step in range(40):
+        # A few nodes, given as nodes or as index arrays, move every step.
+        count = int(random.integers(1, 20))
+        moved = random.choice(len(graph.nodes), count)
+        if step % 2:
+            graph.set_matrices(moved, get_random_matrices(random, count))
+        else:
+            graph.set_matrices([graph.nodes[index] for index in moved],
+                               get_random_matrices(random, count))
+        graph.nodes[random.integers(len(graph.nodes))].set_pose(1.0, 2.0,
+                                                                30.0)
+
+        if step % 5 == 0:
+            node = graph.nodes[random.integers(len(graph.nodes))]
+            parent = graph.nodes[random.integers(len(graph.nodes))]
+            try:
+                node.set_parent(parent)
+            except ValueError:
+                node.set_parent(None)
+        if step % 7 == 0:
+            graph.add_node('object0', graph.nodes[random.integers(
+                len(graph.nodes))], get_random_matrices(random, 1)[0])
+
+        assert numpy.allclose(graph.get_world_matrices(),
+                              get_full_world_matrices(graph))
+
+
+def test_reparented_subtrees_follow_their_new_parent():
+    graph = SceneGraph()
+    first = graph.add_node(matrix=pose_matrices([(1.0, 0.0, 0.0)])[0])
+    second = graph.add_node(matrix=pose_matrices([(0.0, 5.0, 90.0)])[0])
+    child = graph.add_node('object', first,
+                           pose_matrices([(2.0, 0.0, 0.0)])[0])
+    grandchild = graph.add_node('object', child,
+                                pose_matrices([(1.0, 0.0, 0.0)])[0])
+    assert numpy.allclose(grandchild.world_matrix[:2, 3], (4.0, 0.0))
+
+    child.set_parent(second)
+    assert numpy.allclose(grandchild.world_matrix[:2, 3], (0.0, 8.0))
+    assert child.parent is second
+
+    with pytest.raises(ValueError):
+        second.set_parent(grandchild)
@@ -0,0 +1,67 @@
+import numpy
+import pytest
+
+import offscreen
+import scoring
+
+
+BACKGROUND = (26, 26, 26)
+
+
+def make_pair():
+    # A 6x6 red square, and the same square one pixel to the right.
+    reference = numpy.full((20, 20, 3), BACKGROUND, dtype=numpy.uint8)
+    reference[5:11, 5:11] = (255, 0, 0)
+    image = numpy.full((20, 20, 3), BACKGROUND, dtype=numpy.uint8)
+    image[5:11, 6:12] = (255, 0, 0)
+
+    reference_ids = numpy.zeros((20, 20), dtype=numpy.int32)
+    reference_ids[5:11, 5:11] = 1
+    ids = numpy.zeros((20, 20), dtype=numpy.int32)
+    ids[5:11, 6:12] = 1
+    return image, reference, ids, reference_ids
+
+
+def test_score_images_of_a_known_pair():
+    image, reference, ids, reference_ids = make_pair()
+
+    # 42 pixels are covered in either image, and the two columns covered
+    # by only one of them mismatch.
+    assert scoring.score_images(image, reference, BACKGROUND,
+                                radius=0) == pytest.approx(30 / 42)
+    # A pixel off is forgiven with radius 1.
+    assert scoring.score_images(image, reference, BACKGROUND) == 1.0
+    assert scoring.score_images(reference, reference, BACKGROUND) == 1.0
+
+    batch = scoring.score_images(numpy.stack((image, reference)),
+                                 numpy.stack((reference, reference)),
+                                 BACKGROUND, radius=0)
+    assert batch == pytest.approx([30 / 42, 1.0])
+
+
+def test_ious_of_a_known_pair():
+    image, reference, ids, reference_ids = make_pair()
+
+    assert scoring.get_ious(ids > 0, reference_ids > 0) \
+        == pytest.approx(30 / 42)
+
+    object_ious = scoring.get_object_ious(ids[numpy.newaxis],
+                                          reference_ids[numpy.newaxis], 2)
+    assert object_ious.shape == (1, 2)
+    assert object_ious[0, 0] == pytest.approx(30 / 42)
+    # The second object is in neither image.
+    assert numpy.isnan(object_ious[0, 1])
+
+
+def test_images_survive_png_files(tmpdir):
+    image, reference, ids, reference_ids = make_pair()
+    ids[0, 0] = 0x123456
+
+    image_filepath = str(tmpdir.join('image.png'))
+    ids_filepath = str(tmpdir.join('image-ids.png'))
+    offscreen.write_png(image_filepath, image)
+    offscreen.write_png(ids_filepath, scoring.encode_ids(ids))
+
+    assert numpy.array_equal(offscreen.read_png(image_filepath), image)
+    assert numpy.array_equal(
+        scoring.decode_ids(offscreen.read_png(ids_filepath)), ids)
@@ -0,0 +1,97 @@
+import itertools
+
+import numpy
+import pytest
+
+from softraster import Framebuffer
+
+
+def write_one_by_one(framebuffer, pixels, depths, colors):
+    # Fragments written in order, the way GL defines the result.
+    color = framebuffer.color.reshape(-1, 4)
+    depth = framebuffer.depth.reshape(-1)
+    for pixel, fragment_depth, fragment_color in zip(pixels, depths, colors):
+        if not 0.0 <= fragment_depth <= 1.0:
+            continue
+        if framebuffer.depth_test:
+            if framebuffer.depth_less_equal:
+                passed = fragment_depth <= depth[pixel]
+            else:
+                passed = fragment_depth < depth[pixel]
+            if not passed:
+                continue
+            if framebuffer.depth_write:
+                depth[pixel] = fragment_depth
+        if framebuffer.blend:
+            alpha = fragment_color[3]
+            color[pixel] = fragment_color * alpha + color[pixel] * (1 - alpha)
+        else:
+            color[pixel] = fragment_color
+
+
+def make_framebuffer(blend, depth_test, depth_less_equal, depth_write,
+                     width=7, height=5):
+    framebuffer = Framebuffer(width, height)
+    framebuffer.blend = blend
+    framebuffer.depth_test = depth_test
+    framebuffer.depth_less_equal = depth_less_equal
+    framebuffer.depth_write = depth_write
+    framebuffer.clear(color=(0.3, 0.2, 0.1, 1.0), depth=0.6)
+    return framebuffer
+
+
+@pytest.mark.parametrize('blend, depth_test, depth_less_equal, depth_write',
+                         list(itertools.product((False, True), repeat=4)))
+def test_write_fragments_matches_writing_one_by_one(
+        blend, depth_test, depth_less_equal, depth_write):
+    random = numpy.random.default_rng(1)
+    for trial in range(50):
+        count = int(random.integers(1, 300))
+        pixels = random.integers(0, 7 * 5, count)
+        # Few distinct depths, so ties are common.
+        depths = random.choice(numpy.linspace(-0.1, 1.1, 13),
+                               count).astype(numpy.float32)
+        colors = random.random((count, 4)).astype(numpy.float32)
+        colors[random.random(count) < 0.2, 3] = 1.0
+        colors[random.random(count) < 0.1, 3] = 0.0
+
+        framebuffers = [make_framebuffer(blend, depth_test, depth_less_equal,
+                                         depth_write) for index in range(2)]
+        framebuffers[0].write_fragments(pixels, depths, colors)
+        write_one_by_one(framebuffers[1], pixels, depths, colors)
+
+        assert numpy.array_equal(framebuffers[0].depth,
+                                 framebuffers[1].depth)
+        assert numpy.allclose(framebuffers[0].color, framebuffers[1].color,
+                              atol=1e-5)
+
+
+def draw_random_triangles(framebuffer, seed):
+    random = numpy.random.default_rng(seed)
+    count = 40
+    positions = random.random((count, 3, 3)) \
+        * [framebuffer.width * 1.4, framebuffer.height * 1.4, 1.0] \
+        - [framebuffer.width * 0.2, framebuffer.height * 0.2, 0.0]
+    colors = random.random((count, 3, 4))
+    framebuffer.draw_triangles(positions, colors)
+
+
+@pytest.mark.parametrize('blend', (False, True))
+def test_clip_rectangle_only_masks_triangles(blend):
+    full = make_framebuffer(blend, True, False, True, 40, 30)
+    draw_random_triangles(full, 2)
+
+    whole = make_framebuffer(blend, True, False, True, 40, 30)
+    whole.clip_rectangle = (0, 0, 40, 30)
+    draw_random_triangles(whole, 2)
+    assert numpy.array_equal(whole.color, full.color)
+    assert numpy.array_equal(whole.depth, full.depth)
+
+    clipped = make_framebuffer(blend, True, False, True, 40, 30)
+    clipped.clip_rectangle = (5, 3, 20, 10)
+    draw_random_triangles(clipped, 2)
+    untouched = make_framebuffer(blend, True, False, True, 40, 30)
+    inside = (slice(3, 13), slice(5, 25))
+    assert numpy.array_equal(clipped.color[inside], full.color[inside])
+    clipped.color[inside] = untouched.color[inside]
+    assert numpy.array_equal(clipped.color, untouched.color)
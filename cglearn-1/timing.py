@@ -1,11 +1,46 @@
+import collections
+
+import numpy
+
 from OpenGL.GL import *
 from OpenGL.GLUT import *
 
 
+def get_glut_time():
+    return glutGet(GLUT_ELAPSED_TIME)
+
+
 class Timing(object):
-    def __init__(self):
-        self._last_time = glutGet(GLUT_ELAPSED_TIME)
-        self._items = {}
+    # Animated values ("tracks") keyed by name. Every track moves from a
+    # start value at a start time to an end value at an end time, and may
+    # have more keyframes queued after that. Start and end values of all
+    # tracks live in flat arrays, one entry per component, so all values
+    # are evaluated in one vectorized step the first time one is read
+    # after update_time.
+    #
+    # clock returns the current time in milliseconds.
+    LINEAR = 0
+    COSINE = 1
+
+    def __init__(self, clock=get_glut_time):
+        self._clock = clock
+        self._last_time = clock()
+
+        self._tracks = {}
+        self._kinds = []
+        self._shapes = []
+        self._offsets = numpy.zeros(0, dtype=numpy.int64)
+        self._sizes = numpy.zeros(0, dtype=numpy.int64)
+        self._start_times = numpy.zeros(0)
+        self._end_times = numpy.zeros(0)
+        self._easings = numpy.zeros(0, dtype=numpy.int8)
+        self._start_values = numpy.zeros(0)
+        self._end_values = numpy.zeros(0)
+        self._component_tracks = numpy.zeros(0, dtype=numpy.int64)
+        self._keyframes = []
+
+        self._values = numpy.zeros(0)
+        self._is_evaluated = False
 
     @staticmethod
     def interpolate(a, b, t):
@@ -26,33 +61,132 @@ class Timing(object):
         return self._last_time
 
     def update_time(self):
-        self._last_time = glutGet(GLUT_ELAPSED_TIME)
+        self._last_time = self._clock()
+        self._is_evaluated = False
+
+    def has_transitions(self):
+        # Whether some value is still changing after the last update_time.
+        # Values read after the next update_time reach their final value.
+        return bool(numpy.any(self._end_times > self.last_time)) \
+            or any(self._keyframes)
+
+    def _store(self, key, value):
+        # Track of key holding value; new tracks, and tracks whose value
+        # changes shape, get their components appended to the arrays.
+        array = numpy.asarray(value, dtype=numpy.float64)
+        track = self._tracks.get(key)
+        if track is None:
+            track = self._tracks[key] = len(self._kinds)
+            self._kinds.append(None)
+            self._shapes.append(None)
+            self._offsets = numpy.append(self._offsets, 0)
+            self._sizes = numpy.append(self._sizes, 0)
+            self._start_times = numpy.append(self._start_times, 0.0)
+            self._end_times = numpy.append(self._end_times, 0.0)
+            self._easings = numpy.append(self._easings, self.LINEAR)
+            self._keyframes.append(collections.deque())
+
+        if array.shape != self._shapes[track]:
+            self._shapes[track] = array.shape
+            self._offsets[track] = len(self._start_values)
+            self._sizes[track] = array.size
+            self._start_values = numpy.append(self._start_values,
+                                              array.ravel())
+            self._end_values = numpy.append(self._end_values, array.ravel())
+            self._component_tracks = numpy.append(
+                self._component_tracks, numpy.full(array.size, track))
+
+        self._kinds[track] = type(value) \
+            if isinstance(value, (list, tuple)) else float
+        return track
+
+    def _get_slice(self, track):
+        offset = self._offsets[track]
+        return slice(offset, offset + self._sizes[track])
+
+    def _advance_keyframes(self):
+        # Tracks that reached the end of their segment move on to their next
+        # queued keyframe, possibly skipping several.
+        for track, keyframes in enumerate(self._keyframes):
+            while keyframes and self._end_times[track] <= self.last_time:
+                end_time, values, easing = keyframes.popleft()
+                components = self._get_slice(track)
+                self._start_values[components] = self._end_values[components]
+                self._start_times[track] = self._end_times[track]
+                self._end_values[components] = values
+                self._end_times[track] = end_time
+                self._easings[track] = easing
+
+    def _evaluate(self):
+        if any(self._keyframes):
+            self._advance_keyframes()
+
+        durations = self._end_times - self._start_times
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            ts = numpy.where(durations > 0,
+                             (self.last_time - self._start_times) / durations,
+                             1.0)
+        ts = numpy.clip(ts, 0.0, 1.0)
+        ts = numpy.where(self._easings == self.COSINE,
+                         -0.5 * numpy.cos(numpy.pi * ts) + 0.5, ts)
+
+        # Components left behind by values that changed shape are still
+        # evaluated, but never read.
+        component_ts = ts[self._component_tracks]
+        self._values = ((1.0 - component_ts) * self._start_values
+                        + component_ts * self._end_values)
+        self._is_evaluated = True
 
     def get_value(self, key):
-        item_data = self._items[key]
-        if item_data['future'] is None:
-            return item_data['previous']
-        if self.last_time >= item_data['future_time']:
-            self._items[key] = {
-                'previous': item_data['future'],
-                'future': None,
-            }
-            return item_data['future']
-
-        t = (float(self.last_time - item_data['previous_time'])
-             / (item_data['future_time'] - item_data['previous_time']))
-        return self.interpolate(item_data['previous'],
-                                item_data['future'],
-                                t)
-
-    def set_value(self, key, value, time_ahead=0):
-        if key not in self._items or time_ahead <= 0:
-            self._items[key] = {'previous': value, 'future': None}
+        track = self._tracks[key]
+        if not self._is_evaluated:
+            self._evaluate()
+
+        values = self._values[self._get_slice(track)]
+        kind = self._kinds[track]
+        if kind is float:
+            return float(values[0])
+        return kind(values.reshape(self._shapes[track]).tolist())
+
+    def set_value(self, key, value, time_ahead=0, easing=LINEAR):
+        # Moves the value of key to value over the next time_ahead
+        # milliseconds, or sets it right away.
+        if key in self._tracks and time_ahead > 0 \
+                and numpy.shape(value) == self._shapes[self._tracks[key]]:
+            self.set_keyframes(key, [(time_ahead, value)], easing=easing)
             return
 
-        self._items[key] = {
-            'previous': self.get_value(key),
-            'previous_time': self.last_time,
-            'future': value,
-            'future_time': self.last_time + time_ahead,
-        }
+        track = self._store(key, value)
+        components = self._get_slice(track)
+        self._start_values[components] = numpy.ravel(value)
+        self._end_values[components] = numpy.ravel(value)
+        self._start_times[track] = self.last_time
+        self._end_times[track] = self.last_time
+        self._keyframes[track].clear()
+        self._is_evaluated = False
+
+    def set_keyframes(self, key, keyframes, easing=LINEAR):
+        # Animates the value of key from its current value through
+        # keyframes, (time_ahead, value) pairs in increasing time_ahead.
+        track = self._tracks[key]
+        if not self._is_evaluated:
+            self._evaluate()
+
+        shape = self._shapes[track]
+        for time_ahead, value in keyframes:
+            if numpy.shape(value) != shape:
+                raise ValueError('Keyframe value %r does not have the shape'
+                                 ' of %r.' % (value, key))
+
+        components = self._get_slice(track)
+        self._start_values[components] = self._values[components]
+        self._end_values[components] = self._values[components]
+        self._start_times[track] = self.last_time
+        self._end_times[track] = self.last_time
+        self._keyframes[track] = collections.deque(
+            (self.last_time + time_ahead,
+             numpy.ravel(numpy.asarray(value, dtype=numpy.float64)), easing)
+            for time_ahead, value in keyframes)
+        if keyframes:
+            self._store(key, keyframes[-1][1])
+        self._is_evaluated = False
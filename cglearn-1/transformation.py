@@ -1,8 +1,103 @@
 import math
+
+import numpy
+
 from OpenGL.GL import *
 
 
+def pose_matrices(poses):
+    # Accepts (N, 4, 4) matrices as they are, or (N, 3) rows of
+    # (x, y, angle) and (N, 4) rows of (x, y, angle, scale), angles in
+    # degrees around the Z axis.
+    poses = numpy.asarray(poses, dtype=numpy.float64)
+    if poses.ndim == 3 and poses.shape[1:] == (4, 4):
+        return poses
+    if poses.ndim != 2 or poses.shape[1] not in (3, 4):
+        raise ValueError('Expected (N, 4, 4), (N, 3) or (N, 4) poses.')
+
+    angles = numpy.radians(poses[:, 2])
+    if poses.shape[1] == 4:
+        scales = poses[:, 3]
+    else:
+        scales = numpy.ones(len(poses))
+
+    matrices = numpy.zeros((len(poses), 4, 4))
+    matrices[:, 0, 0] = scales * numpy.cos(angles)
+    matrices[:, 0, 1] = -scales * numpy.sin(angles)
+    matrices[:, 1, 0] = scales * numpy.sin(angles)
+    matrices[:, 1, 1] = scales * numpy.cos(angles)
+    matrices[:, 2, 2] = scales
+    matrices[:, 0, 3] = poses[:, 0]
+    matrices[:, 1, 3] = poses[:, 1]
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+def translation_matrices(offsets):
+    # (N, 4, 4) matrices from (N, 3) offsets, as glTranslate builds them.
+    offsets = numpy.asarray(offsets, dtype=numpy.float64)
+    matrices = numpy.zeros((len(offsets), 4, 4))
+    matrices[:, [0, 1, 2, 3], [0, 1, 2, 3]] = 1.0
+    matrices[:, :3, 3] = offsets
+    return matrices
+
+
+def rotation_matrices(angles, axes):
+    # (N, 4, 4) matrices from N angles in degrees and (N, 3) axes, as
+    # glRotate builds them. Zero axes give identities.
+    angles = numpy.radians(numpy.asarray(angles, dtype=numpy.float64))
+    axes = numpy.asarray(axes, dtype=numpy.float64)
+    lengths = numpy.linalg.norm(axes, axis=1)
+    is_null = lengths == 0
+    axes = axes / numpy.where(is_null, 1.0, lengths)[:, numpy.newaxis]
+    angles = numpy.where(is_null, 0.0, angles)
+
+    x, y, z = axes.T
+    c = numpy.cos(angles)
+    s = numpy.sin(angles)
+    d = 1.0 - c
+
+    matrices = numpy.zeros((len(angles), 4, 4))
+    matrices[:, 0, 0] = x * x * d + c
+    matrices[:, 0, 1] = x * y * d - z * s
+    matrices[:, 0, 2] = x * z * d + y * s
+    matrices[:, 1, 0] = y * x * d + z * s
+    matrices[:, 1, 1] = y * y * d + c
+    matrices[:, 1, 2] = y * z * d - x * s
+    matrices[:, 2, 0] = x * z * d - y * s
+    matrices[:, 2, 1] = y * z * d + x * s
+    matrices[:, 2, 2] = z * z * d + c
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+def scale_matrices(factors):
+    # (N, 4, 4) matrices from (N, 3) factors, as glScale builds them.
+    factors = numpy.asarray(factors, dtype=numpy.float64)
+    matrices = numpy.zeros((len(factors), 4, 4))
+    matrices[:, [0, 1, 2], [0, 1, 2]] = factors
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+def multiply_gl_matrix(matrix):
+    # glMultMatrix with a row-major matrix; GL reads them column-major.
+    glMultMatrixd(numpy.ascontiguousarray(matrix.T))
+
+
 class AbstractTransformation(object):
+    # Besides applying themselves with GL calls, transformations give the
+    # same transforms as 4x4 matrices, for one eased t or a whole array of
+    # them at once.
+    @staticmethod
+    def ease(times):
+        # Eased t of times, as transform computes it. Negative times, which
+        # transform skips, give NaN.
+        times = numpy.asarray(times, dtype=numpy.float64)
+        ts = numpy.where(times >= 1, 1.0,
+                         -0.5 * numpy.cos(numpy.pi * times) + 0.5)
+        return numpy.where(times < 0, numpy.nan, ts)
+
     def transform(self, time):
         if time < 0:
             return
@@ -16,6 +111,25 @@ class AbstractTransformation(object):
     def raw_transform(self, t):
         raise NotImplementedError()
 
+    def raw_matrices(self, ts):
+        # (N, 4, 4) matrices of the transform at the eased ts.
+        raise NotImplementedError()
+
+    def raw_matrix(self, t):
+        return self.raw_matrices(numpy.array([t], dtype=numpy.float64))[0]
+
+    def get_matrices(self, times):
+        # (N, 4, 4) matrices of transform(time) for every time; identities
+        # where the transform does nothing.
+        ts = self.ease(numpy.atleast_1d(times))
+        is_skipped = numpy.isnan(ts)
+        matrices = self.raw_matrices(numpy.where(is_skipped, 0.0, ts))
+        matrices[is_skipped] = numpy.identity(4)
+        return matrices
+
+    def get_matrix(self, time):
+        return self.get_matrices([time])[0]
+
 
 class Translation(AbstractTransformation):
     def __init__(self, dx, dy, dz=0):
@@ -26,6 +140,10 @@ class Translation(AbstractTransformation):
     def raw_transform(self, t):
         glTranslate(t * self._dx, t * self._dy, t * self._dz)
 
+    def raw_matrices(self, ts):
+        return translation_matrices(
+            ts[:, numpy.newaxis] * [self._dx, self._dy, self._dz])
+
 
 class Rotation(AbstractTransformation):
     def __init__(self, angle, ax, ay, az):
@@ -37,6 +155,14 @@ class Rotation(AbstractTransformation):
     def raw_transform(self, t):
         glRotate(t * self._angle, self._ax, self._ay, t * self._az)
 
+    def raw_matrices(self, ts):
+        # Same axis as raw_transform, whose Z component scales with t.
+        axes = numpy.empty((len(ts), 3))
+        axes[:, 0] = self._ax
+        axes[:, 1] = self._ay
+        axes[:, 2] = ts * self._az
+        return rotation_matrices(ts * self._angle, axes)
+
 
 class Scale(AbstractTransformation):
     def __init__(self, sx, sy=None, sz=None):
@@ -52,10 +178,65 @@ class Scale(AbstractTransformation):
     def raw_transform(self, t):
         glScale(t * self._sx, t * self._sy, t * self._sz)
 
+    def raw_matrices(self, ts):
+        return scale_matrices(
+            ts[:, numpy.newaxis] * [self._sx, self._sy, self._sz])
+
 
 class TransformationSequence(object):
+    # Transformations run one after the other: at time, the i-th one is
+    # applied at time - i, as with the phases of a Context. Their product
+    # is cached per time quantized to 1 / TIME_RESOLUTION. Replacing
+    # transformations is noticed by itself; changing one in place needs
+    # invalidate().
     coordinates = None
     transformations = None
 
+    TIME_RESOLUTION = 1000
+
+    _matrix_cache = None
+    _cached_transformations = None
+
+    def __init__(self, transformations=None, coordinates=None):
+        if transformations is not None:
+            self.transformations = list(transformations)
+        if coordinates is not None:
+            self.coordinates = coordinates
+
+    def invalidate(self):
+        self._matrix_cache = {}
+
+    def _quantize(self, times):
+        # Times beyond the ends all give the same product.
+        times = numpy.clip(times, -1.0, len(self.transformations or ()))
+        return numpy.rint(numpy.asarray(times) * self.TIME_RESOLUTION) \
+            .astype(numpy.int64)
+
+    def get_matrices(self, times):
+        # (N, 4, 4) products for every time, evaluated in one pass per
+        # transformation, e.g. to precompute a whole animation.
+        times = self._quantize(numpy.atleast_1d(times)) \
+            / float(self.TIME_RESOLUTION)
+        matrices = numpy.zeros((len(times), 4, 4))
+        matrices[:] = numpy.identity(4)
+        for index, transformation in enumerate(self.transformations or ()):
+            matrices = numpy.matmul(
+                matrices, transformation.get_matrices(times - index))
+        return matrices
+
+    def get_matrix(self, time):
+        transformations = tuple(self.transformations or ())
+        if transformations != self._cached_transformations:
+            self.invalidate()
+            self._cached_transformations = transformations
+
+        key = int(self._quantize(time))
+        matrix = self._matrix_cache.get(key)
+        if matrix is None:
+            matrix = self.get_matrices([key / float(self.TIME_RESOLUTION)])[0]
+            self._matrix_cache[key] = matrix
+        return matrix
+
     def transform(self, time):
-        pass
+        if self.transformations:
+            multiply_gl_matrix(self.get_matrix(time))